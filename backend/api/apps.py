@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import authentication  # сигналы сброса кэша
+        from . import conditional  # noqa: F401 — сигналы ревизий
+        from . import snapshots  # noqa: F401 — сброс снимка ингредиентов
+        from . import events
+        authentication.check_shared_caches()
+        events.connect()
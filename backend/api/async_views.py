@@ -0,0 +1,141 @@
+"""
+Асинхронный путь чтения для ASGI-сервера.
+
+Медленные клиенты держит event loop, а поток из пула занимается только
+работой с БД и сериализацией. Ингредиенты читаются асинхронным ORM,
+если он есть (Django 4.1+), иначе запрос уходит в пул потоков; запрос,
+фильтр, сериализатор, аутентификация, троттлинг и выбор реплики — те же,
+что у IngredientViewSet.
+Рецепты отдаёт тот же RecipeViewSet, запущенный в пуле потоков, поэтому
+ответы совпадают с WSGI-путём байт в байт.
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.db.models.query import QuerySet
+from django.http import HttpResponse, JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+
+from foodgram.db_router import reset_replica, use_replica
+from .replicas import replica_allowed
+from .throttling import TokenBucketThrottle
+from .views import IngredientViewSet, RecipeViewSet
+
+# Асинхронные итераторы QuerySet появились в Django 4.1
+ASYNC_ORM = hasattr(QuerySet, 'aiterator')
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def _worker(func):
+    """
+    Обернуть синхронную функцию для запуска в общем пуле потоков.
+
+    Сигналы request_started/request_finished закрывают соединения с БД
+    только в потоке обработчика, поэтому в потоке пула делаем это сами.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            result = func(*args, **kwargs)
+            if hasattr(result, 'render'):
+                result.render()
+            return result
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def async_read_view(viewset, actions, read_handler=None):
+    """
+    Асинхронная вьюха поверх DRF-вьюсета.
+
+    GET/HEAD обрабатывает read_handler (по умолчанию — сам вьюсет
+    в пуле потоков), остальные методы уходят в синхронный вьюсет
+    так же, как это делает Django для обычных sync-вьюх.
+    """
+    full_view = sync_to_async(viewset.as_view(actions))
+    if read_handler is None:
+        read_handler = _worker(viewset.as_view({'get': actions['get']}))
+
+    async def view(request, *args, **kwargs):
+        if request.method in READ_METHODS:
+            return await read_handler(request, *args, **kwargs)
+        return await full_view(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+def _admit(request):
+    """
+    Троттлинг списка ингредиентов с тем же scope и идентификатором, что
+    у IngredientViewSet (пользователя определяют его аутентификаторы).
+    Вернуть (сколько ждать — 0, если запрос пропущен; читать ли с
+    реплики).
+    """
+    view = IngredientViewSet(action_map={'get': 'list'})
+    user = view.initialize_request(request).user
+    throttle = TokenBucketThrottle()
+    if not throttle.allow(request, view.throttle_scopes['list'], user):
+        return throttle.wait(), False
+    return 0, replica_allowed(user)
+
+
+async def _ingredient_list(request, *args, **kwargs):
+    """Автодополнение ингредиентов по началу названия."""
+    # Вьюсет здесь не вызывается, поэтому его проверки повторяем сами
+    try:
+        wait, replica = await _worker(_admit)(request)
+    except APIException:
+        # Неверные учётные данные: ошибку отдаёт сам вьюсет
+        return await _worker(
+            IngredientViewSet.as_view({'get': 'list'})
+        )(request, *args, **kwargs)
+    if wait:
+        response = JsonResponse(
+            {'detail': 'Запрос был проигнорирован ввиду ограничения частоты.'},
+            status=429,
+            json_dumps_params={'ensure_ascii': False},
+        )
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
+    view = IngredientViewSet
+    queryset = view.filterset_class(
+        request.GET, queryset=view.queryset.all()
+    ).qs
+    # Маршрутизатор видит реплику через contextvar, который
+    # sync_to_async переносит в поток пула
+    token = use_replica() if replica else None
+    try:
+        if ASYNC_ORM:
+            ingredients = [ingredient async for ingredient in queryset]
+        else:
+            ingredients = await _worker(list)(queryset)
+    finally:
+        if token is not None:
+            reset_replica(token)
+    renderer = JSONRenderer()
+    return HttpResponse(
+        renderer.render(view.serializer_class(ingredients, many=True).data),
+        content_type=renderer.media_type,
+    )
+
+
+ingredient_list = async_read_view(
+    IngredientViewSet, {'get': 'list'}, read_handler=_ingredient_list
+)
+recipe_list = async_read_view(
+    RecipeViewSet, {'get': 'list', 'post': 'create'}
+)
+recipe_detail = async_read_view(
+    RecipeViewSet,
+    {
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    }
+)
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+TOKEN_CACHE_KEY = 'auth-token:{}'
+# Кэши, которые у каждого процесса свои
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def token_cache():
+    return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def check_shared_caches():
+    """
+    Не запускаться с кэшем токенов, списком отозванных JWT или кэшем
+    коротких ссылок в памяти процесса при нескольких воркерах: выход и
+    смена пароля сбросили бы снимок или отозвали бы токен, а удаление
+    рецепта убрало бы его короткую ссылку только в одном из них.
+    """
+    if settings.WEB_CONCURRENCY <= 1:
+        return
+    aliases = {
+        'TOKEN_CACHE_ALIAS': settings.TOKEN_CACHE_ALIAS,
+        'SHORT_LINK_CACHE_ALIAS': settings.SHORT_LINK_CACHE_ALIAS,
+    }
+    if settings.JWT_AUTH:
+        aliases['JWT_DENYLIST_ALIAS'] = settings.JWT_DENYLIST_ALIAS
+    for name, alias in aliases.items():
+        backend = settings.CACHES[alias]['BACKEND']
+        if backend in PER_PROCESS_CACHES:
+            raise ImproperlyConfigured(
+                f'{name}={alias!r} uses {backend}, which is per process, '
+                f'while WEB_CONCURRENCY={settings.WEB_CONCURRENCY}; '
+                'configure a shared CACHE_BACKEND.'
+            )
+
+
+def forget_tokens(keys):
+    """Убрать токены из кэша аутентификации."""
+    keys = [TOKEN_CACHE_KEY.format(key) for key in keys]
+    if keys:
+        token_cache().delete_many(keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с кэшем «токен → снимок пользователя».
+
+    Повторные запросы с тем же токеном в течение TOKEN_CACHE_TTL секунд
+    не ходят в authtoken_token/users_user. Снимки сбрасываются при выходе
+    (удаление токена), смене пароля, блокировке и любом другом
+    сохранении пользователя. Кэш — общий CACHE_BACKEND
+    (TOKEN_CACHE_ALIAS=default), чтобы сброс видели все воркеры; с кэшем
+    в памяти процесса и WEB_CONCURRENCY > 1 приложение не запускается.
+    """
+    def authenticate_credentials(self, key):
+        cache = token_cache()
+        cache_key = TOKEN_CACHE_KEY.format(key)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, (user, token), settings.TOKEN_CACHE_TTL)
+        return user, token
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(pre_save, sender=User)
+def deny_user_jwt(sender, instance, **kwargs):
+    # _password выставляет set_password() до сохранения
+    if settings.JWT_AUTH and instance.pk and (
+        instance._password is not None or not instance.is_active
+    ):
+        # simplejwt при импорте читает SECRET_KEY: грузим его только
+        # там, где JWT действительно нужен
+        from .jwt_tokens import deny_user_tokens
+        deny_user_tokens(instance)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        forget_tokens(
+            Token.objects.filter(user=instance).values_list('key', flat=True)
+        )
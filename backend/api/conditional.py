@@ -0,0 +1,162 @@
+"""
+Условные запросы по номерам ревизий (foodgram.revisions).
+
+ETag рецепта и профиля строится из ревизии объекта, ревизии автора
+рецепта и ревизии смотрящего пользователя (от его подписок, избранного
+и списка покупок зависят is_subscribed, is_favorited,
+is_in_shopping_cart). Все они читаются одним запросом по первичному
+ключу, так что ответ 304 на If-None-Match не требует сериализации.
+Связанные данные в ответе (?expand=recipes_count, ?expand=tags,
+ингредиенты) меняют ревизию через обработчики сигналов ниже.
+If-Match на изменении сверяется с ETag под блокировкой строки.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Subquery, Value
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from foodgram import revisions
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscription, User
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'Объект изменился: заголовок If-Match устарел.'
+    default_code = 'precondition_failed'
+
+
+def viewer_revision(user):
+    """Ревизия смотрящего как подзапрос, чтобы не делать отдельный."""
+    if user.is_anonymous:
+        return Value(0)
+    return Subquery(User.objects.filter(pk=user.pk).values('revision')[:1])
+
+
+def etag_matches(header, etag, weak=True):
+    """Есть ли etag в заголовке If-Match/If-None-Match."""
+    if not header:
+        return False
+    etags = parse_etags(header)
+    if '*' in etags:
+        return True
+    if weak:
+        etags = [tag[2:] if tag.startswith('W/') else tag for tag in etags]
+    return etag in etags
+
+
+class ConditionalMixin:
+    """
+    Примесь к вьюсету: ETag и 304 для retrieve. Вьюсет определяет
+    get_version_stamp(); изменяющие действия вызывают check_if_match()
+    в своей транзакции.
+    """
+    def get_version_stamp(self, pk, lock=False):
+        """Кортеж ревизий объекта pk для текущего пользователя или None."""
+        raise NotImplementedError
+
+    def get_etag(self, pk=None, lock=False):
+        if pk is None:
+            pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            stamp = self.get_version_stamp(pk, lock=lock)
+        except (TypeError, ValueError, ValidationError):
+            # Некорректный pk: 404 вернёт обычная обработка
+            return None
+        if stamp is None:
+            return None
+        raw = ':'.join(map(str, (
+            self.queryset.model._meta.label_lower,
+            pk,
+            self.request.user.pk,
+            self.request.accepted_renderer.format,
+            # ?fields= и ?expand= меняют представление
+            self.request.GET.urlencode(),
+            *stamp,
+        )))
+        return quote_etag(
+            hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+        )
+
+    @staticmethod
+    def with_etag(response, etag):
+        if etag is not None and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def conditional_get(self, get_response, pk=None):
+        """304, если у клиента актуальная версия, иначе get_response()."""
+        etag = self.get_etag(pk)
+        if etag is not None and etag_matches(
+            self.request.META.get('HTTP_IF_NONE_MATCH'), etag
+        ):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Authorization',))
+            return response
+        return self.with_etag(get_response(), etag)
+
+    def check_if_match(self):
+        """Вызывается внутри транзакции: строка остаётся заблокированной."""
+        header = self.request.META.get('HTTP_IF_MATCH')
+        if header is None:
+            return
+        etag = self.get_etag(lock=True)
+        if etag is not None and not etag_matches(header, etag, weak=False):
+            raise PreconditionFailed
+
+    def retrieve(self, request, *args, **kwargs):
+        retrieve = super().retrieve
+        return self.conditional_get(
+            lambda: retrieve(request, *args, **kwargs)
+        )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_owner_revision(sender, instance, raw=False, **kwargs):
+    if not raw:
+        revisions.bump(User, [instance.user_id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def bump_ingredient_recipes(sender, instance, created=False, raw=False,
+                            **kwargs):
+    # Название и единица ингредиента видны в рецепте
+    if not created and not raw:
+        revisions.bump(Recipe, Recipe.objects.filter(
+            ingredient_amounts__ingredient=instance
+        ).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_author_revision(sender, instance, created=True, raw=False,
+                         **kwargs):
+    # Число рецептов автора видно в ?expand=recipes_count; правка
+    # рецепта его не меняет (у post_delete нет аргумента created)
+    if created and not raw:
+        revisions.bump(User, [instance.author_id])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def bump_tag_recipes(sender, instance, created=False, raw=False, **kwargs):
+    # Теги видны в рецепте при ?expand=tags
+    if not created and not raw:
+        revisions.bump(Recipe, Recipe.objects.filter(
+            tags=instance
+        ).values_list('pk', flat=True))
@@ -8,3 +8,6 @@ CHOICES_LIST = (
     ('0', 'False'),
     ('1', 'True'),
 )
+
+# Максимальное число элементов в одном пакетном запросе
+BULK_MAX_ITEMS = 1000
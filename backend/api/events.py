@@ -0,0 +1,303 @@
+"""
+Шина событий об изменении моделей для сброса кэшей.
+
+Изменения Recipe, IngredientInRecipe, Favorite, ShoppingCart,
+Subscription и User (post_save, post_delete, m2m_changed тегов рецепта)
+превращаются в ChangeEvent с ключами зависимостей вида «recipe:42»,
+«user:7:cart». Событие попадает в пакет только после коммита транзакции
+(transaction.on_commit), так что откаченные изменения никого не будят.
+
+Внутри запроса (change_events_middleware) и блока batch() события
+копятся и схлопываются по объекту: обновление рецепта с 40
+ингредиентами даёт одну публикацию, а не 40. Подписчик регистрирует
+ключи или шаблоны (fnmatch, например «user:*:cart») и получает
+ChangeBatch только с теми событиями, которые его касаются.
+
+bulk_create и bulk_update сигналов не шлют: код, который ими пишет,
+сообщает об изменениях сам через record_many().
+
+Тем, кому изменения нужны в той же транзакции (журнал изменений
+sync), record() и record_many() передают объекты сразу — через
+add_recorder().
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from functools import partial
+
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.decorators import sync_and_async_middleware
+
+from recipes.models import (
+    Favorite, IngredientInRecipe, Recipe, ShoppingCart
+)
+from users.models import Subscription, User
+
+logger = logging.getLogger(__name__)
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    model: str  # app_label.model_name
+    pk: object
+    action: str
+    keys: frozenset
+
+
+@dataclass(frozen=True)
+class ChangeBatch:
+    events: tuple
+    keys: frozenset
+
+
+def recipe_keys(recipe):
+    return {
+        'recipes', f'recipe:{recipe.pk}', f'user:{recipe.author_id}:recipes'
+    }
+
+
+def ingredient_amount_keys(amount):
+    return {f'recipe:{amount.recipe_id}'}
+
+
+def favorite_keys(favorite):
+    return {
+        f'recipe:{favorite.recipe_id}:favorites',
+        f'user:{favorite.user_id}:favorites',
+    }
+
+
+def cart_keys(item):
+    return {
+        f'recipe:{item.recipe_id}:cart',
+        f'user:{item.user_id}:cart',
+    }
+
+
+def subscription_keys(subscription):
+    return {
+        f'user:{subscription.user_id}:subscriptions',
+        f'user:{subscription.author_id}:subscribers',
+    }
+
+
+def user_keys(user):
+    return {f'user:{user.pk}'}
+
+
+KEY_BUILDERS = {
+    Recipe: recipe_keys,
+    IngredientInRecipe: ingredient_amount_keys,
+    Favorite: favorite_keys,
+    ShoppingCart: cart_keys,
+    Subscription: subscription_keys,
+    User: user_keys,
+}
+
+
+class EventBus:
+    """Подписчики по точным ключам и по шаблонам fnmatch."""
+    def __init__(self):
+        self._exact = defaultdict(list)
+        self._patterns = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler, *keys):
+        with self._lock:
+            for key in keys:
+                if any(char in key for char in '*?['):
+                    self._patterns.append((key, handler))
+                else:
+                    self._exact[key].append(handler)
+        return handler
+
+    def unsubscribe(self, handler, *keys):
+        with self._lock:
+            for key in keys:
+                if (key, handler) in self._patterns:
+                    self._patterns.remove((key, handler))
+                elif handler in self._exact.get(key, ()):
+                    self._exact[key].remove(handler)
+                    if not self._exact[key]:
+                        del self._exact[key]
+
+    def publish(self, events):
+        all_keys = set().union(*(event.keys for event in events))
+        matched = defaultdict(set)
+        with self._lock:
+            for key in all_keys:
+                for handler in self._exact.get(key, ()):
+                    matched[handler].add(key)
+            for pattern, handler in self._patterns:
+                matched[handler].update(
+                    key for key in all_keys if fnmatchcase(key, pattern)
+                )
+        for handler, keys in matched.items():
+            if not keys:
+                continue
+            batch = ChangeBatch(
+                tuple(event for event in events if event.keys & keys),
+                frozenset(keys),
+            )
+            try:
+                handler(batch)
+            except Exception:
+                # Данные уже закоммичены: сбой подписчика не должен
+                # превращать успешный запрос в ошибку
+                logger.exception('Change event handler %r failed', handler)
+
+
+bus = EventBus()
+subscribe = bus.subscribe
+unsubscribe = bus.unsubscribe
+
+
+class PendingEvents:
+    """События пакета, схлопнутые по объекту."""
+    def __init__(self):
+        self.events = {}
+
+    def add(self, event):
+        identity = (
+            (event.model, event.pk) if event.pk is not None
+            else (event.model, event.keys)
+        )
+        previous = self.events.get(identity)
+        if previous is not None:
+            if DELETED in (previous.action, event.action):
+                action = DELETED
+            else:
+                action = previous.action
+            event = ChangeEvent(
+                event.model, event.pk, action, previous.keys | event.keys
+            )
+        self.events[identity] = event
+
+
+_pending = ContextVar('change_events', default=None)
+
+
+@contextmanager
+def batch():
+    """Копить события до выхода из блока и опубликовать одним пакетом."""
+    if _pending.get() is not None:
+        # Вложенный блок: публикует внешний
+        yield
+        return
+    pending = PendingEvents()
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+        if pending.events:
+            bus.publish(list(pending.events.values()))
+
+
+# Получатели изменений внутри транзакции: recorder(objs, action)
+_recorders = []
+
+
+def add_recorder(recorder):
+    """Передавать recorder каждый пакет record()/record_many() сразу."""
+    if recorder not in _recorders:
+        _recorders.append(recorder)
+    return recorder
+
+
+def _collect(event):
+    pending = _pending.get()
+    if pending is not None:
+        pending.add(event)
+    else:
+        bus.publish([event])
+
+
+def _emit(model, pk, action, keys):
+    transaction.on_commit(
+        partial(_collect, ChangeEvent(
+            model._meta.label_lower, pk, action, frozenset(keys)
+        )),
+        using=router.db_for_write(model),
+    )
+
+
+def record(instance, action):
+    """Сообщить об изменении объекта после коммита текущей транзакции."""
+    record_many([instance], action)
+
+
+def record_many(objs, action):
+    """То же для пакетных операций, которые не шлют сигналов."""
+    objs = [
+        obj for obj in objs if obj._meta.concrete_model in KEY_BUILDERS
+    ]
+    if not objs:
+        return
+    for recorder in _recorders:
+        recorder(objs, action)
+    for obj in objs:
+        model = obj._meta.concrete_model
+        _emit(model, obj.pk, action, KEY_BUILDERS[model](obj))
+
+
+def _on_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record(instance, CREATED if created else UPDATED)
+
+
+def _on_delete(sender, instance, **kwargs):
+    record(instance, DELETED)
+
+
+def _on_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        record(instance, UPDATED)
+        return
+    # Со стороны тега: затронутые рецепты известны только по pk
+    recipes = [Recipe(pk=pk) for pk in pk_set or ()]
+    for recorder in _recorders:
+        recorder(recipes, UPDATED)
+    for pk in pk_set or ():
+        _emit(Recipe, pk, UPDATED, {'recipes', f'recipe:{pk}'})
+
+
+def connect():
+    for model in KEY_BUILDERS:
+        post_save.connect(
+            _on_save, sender=model, dispatch_uid=f'events-save-{model}'
+        )
+        post_delete.connect(
+            _on_delete, sender=model, dispatch_uid=f'events-delete-{model}'
+        )
+    m2m_changed.connect(
+        _on_tags_changed,
+        sender=Recipe.tags.through,
+        dispatch_uid='events-recipe-tags',
+    )
+
+
+@sync_and_async_middleware
+def change_events_middleware(get_response):
+    """Один пакет событий на запрос."""
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            with batch():
+                return await get_response(request)
+    else:
+        def middleware(request):
+            with batch():
+                return get_response(request)
+    return middleware
@@ -0,0 +1,276 @@
+"""
+Выгрузка каталога для аналитики: рецепты, ингредиенты рецептов,
+избранное и списки покупок одной таблицей за запрос вместо постраничного
+обхода /api/recipes/.
+
+Форматы: Parquet и Arrow IPC (по столбцам, если установлен pyarrow),
+NDJSON и CSV (всегда). Строки читаются QuerySet.iterator(chunk_size):
+на PostgreSQL это серверный курсор, так что в памяти не больше одного
+блока, и каждый блок сразу уходит клиенту или в файл.
+
+Инкрементальная выгрузка: since_id — только строки с id больше данного
+(id растут, так что это «новые с прошлого раза»), since — только строки
+новее этого момента: рецепты по дате публикации, ингредиенты рецептов
+по дате публикации рецепта, избранное и списки покупок по времени
+добавления. Изменения уже выгруженных строк так не видны.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart
+)
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet и Arrow доступны, только если есть pyarrow
+    pyarrow = None
+
+CHUNK_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    model: type
+    columns: tuple  # первый столбец — id
+    # Поле (путь) с временем строки для since; None — фильтр не нужен
+    since_field: str = None
+
+
+TABLES = {
+    'recipes': ExportTable(
+        Recipe,
+        ('id', 'author_id', 'name', 'text', 'image', 'cooking_time',
+         'servings', 'pub_date'),
+        'pub_date',
+    ),
+    'ingredient_amounts': ExportTable(
+        IngredientInRecipe,
+        ('id', 'recipe_id', 'ingredient_id', 'amount'),
+        'recipe__pub_date',
+    ),
+    'favorites': ExportTable(
+        Favorite, ('id', 'user_id', 'recipe_id', 'created'), 'created'
+    ),
+    'shopping_cart': ExportTable(
+        ShoppingCart,
+        ('id', 'user_id', 'recipe_id', 'servings', 'created'),
+        'created',
+    ),
+    # Справочник для расшифровки ingredient_id
+    'ingredients': ExportTable(
+        Ingredient, ('id', 'name', 'measurement_unit')
+    ),
+}
+
+
+def rows(table, since=None, since_id=None, chunk_size=CHUNK_SIZE):
+    queryset = table.model._default_manager.order_by('pk')
+    if since_id:
+        queryset = queryset.filter(pk__gt=since_id)
+    if since is not None and table.since_field:
+        queryset = queryset.filter(**{f'{table.since_field}__gt': since})
+    return queryset.values_list(*table.columns).iterator(
+        chunk_size=chunk_size
+    )
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_ndjson(table, chunks):
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps(
+                dict(zip(table.columns, row)),
+                cls=DjangoJSONEncoder,
+                ensure_ascii=False,
+            ) + '\n'
+            for row in chunk
+        ).encode()
+
+
+def write_csv(table, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table.columns)
+    for chunk in chunks:
+        writer.writerows(
+            [value.isoformat() if hasattr(value, 'isoformat') else value
+             for value in row]
+            for row in chunk
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Пустая выгрузка: только заголовок
+        yield buffer.getvalue().encode()
+
+
+def arrow_schema(table):
+    types = {
+        'DateTimeField': pyarrow.timestamp('us', tz='UTC'),
+        'FloatField': pyarrow.float64(),
+        'BooleanField': pyarrow.bool_(),
+    }
+    fields = []
+    for column in table.columns:
+        field = table.model._meta.get_field(column)
+        if field.is_relation:
+            field = field.target_field
+        internal_type = field.get_internal_type()
+        if internal_type in types:
+            arrow_type = types[internal_type]
+        elif internal_type.endswith(('IntegerField', 'AutoField')):
+            arrow_type = pyarrow.int64()
+        else:
+            arrow_type = pyarrow.string()
+        fields.append(pyarrow.field(column, arrow_type))
+    return pyarrow.schema(fields)
+
+
+def record_batch(schema, chunk):
+    return pyarrow.RecordBatch.from_arrays(
+        [
+            pyarrow.array(column, type=field.type)
+            for column, field in zip(zip(*chunk), schema)
+        ],
+        schema=schema,
+    )
+
+
+class ChunkSink(io.RawIOBase):
+    """Файл для писателей pyarrow, записанное забирается блоками."""
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def write_arrow(table, chunks):
+    schema = arrow_schema(table)
+    sink = ChunkSink()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_batch(record_batch(schema, chunk))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def write_parquet(table, chunks):
+    schema = arrow_schema(table)
+    sink = ChunkSink()
+    # Блок строк — группа строк Parquet: пишется на диск или в ответ
+    # сразу, в памяти не копится
+    with pyarrow.parquet.ParquetWriter(
+        sink, schema, compression='zstd'
+    ) as writer:
+        for chunk in chunks:
+            writer.write_table(
+                pyarrow.Table.from_batches([record_batch(schema, chunk)])
+            )
+            yield sink.drain()
+    yield sink.drain()
+
+
+WRITERS = {
+    'ndjson': write_ndjson,
+    'csv': write_csv,
+}
+if pyarrow is not None:
+    WRITERS.update(arrow=write_arrow, parquet=write_parquet)
+
+
+def stream(table, export_format, since=None, since_id=None,
+           chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Байты выгрузки таблицы блоками. В progress (если передан)
+    записываются rows — число строк и last_id — id последней строки.
+    """
+    def tracked(chunks):
+        for chunk in chunks:
+            if progress is not None:
+                progress['rows'] = progress.get('rows', 0) + len(chunk)
+                progress['last_id'] = chunk[-1][0]
+            yield chunk
+
+    chunks = tracked(chunked(
+        rows(table, since, since_id, chunk_size), chunk_size
+    ))
+    for data in WRITERS[export_format](table, chunks):
+        if data:
+            yield data
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Сама выгрузка идёт потоком мимо рендерера; через него DRF выбирает
+    формат (?format= или Accept) и выводит ошибки.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class ParquetRenderer(ExportRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+
+class ArrowRenderer(ExportRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+
+# Первый — формат по умолчанию
+RENDERERS = (
+    ((ParquetRenderer, ArrowRenderer) if pyarrow is not None else ())
+    + (NDJSONRenderer, CSVRenderer)
+)
@@ -0,0 +1,94 @@
+"""
+Выборочные поля ответа: ?fields= и ?expand=.
+
+?fields=id,name,author.first_name оставляет в ответе только
+перечисленные поля (вложенные — через точку; «author» без точки — все
+поля автора). ?expand=tags добавляет поля, которых по умолчанию в ответе
+нет (expandable_fields сериализатора). Без параметров ответ прежний.
+
+Вьюсет по wants() решает, что загружать: отложенные столбцы,
+prefetch и аннотации Exists нужны только для запрошенных полей.
+"""
+
+
+def parse(value):
+    """'id,author.name' → {'id': {}, 'author': {'name': {}}}; '' → None."""
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree or None
+
+
+def included(fields, expand, name, expandable=False):
+    """Входит ли поле name в ответ на этом уровне вложенности."""
+    if fields:
+        return name in fields
+    return not expandable or name in expand
+
+
+def descend(fields, expand, name):
+    """Поля и expand для вложенного сериализатора name."""
+    return (fields or {}).get(name) or None, expand.get(name) or {}
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Примесь к сериализатору: убирает поля, не запрошенные в ?fields=, и
+    поля expandable_fields, не запрошенные в ?expand=.
+    """
+    expandable_fields = ()
+
+    def get_fieldset(self):
+        # Вложенному сериализатору набор полей задаёт родитель
+        fieldset = getattr(self, 'fieldset', None)
+        if fieldset is None:
+            fieldset = self.context.get('fieldset', (None, {}))
+        return fieldset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.get_fieldset()
+        for name in list(fields):
+            if not included(
+                requested, expand, name, name in self.expandable_fields
+            ):
+                del fields[name]
+                continue
+            nested = getattr(fields[name], 'child', fields[name])
+            if isinstance(nested, SparseFieldsetSerializerMixin):
+                nested.fieldset = descend(requested, expand, name)
+        return fields
+
+
+class SparseFieldsetMixin:
+    """
+    Примесь к вьюсету: разбирает ?fields= и ?expand= и передаёт их
+    сериализатору через контекст.
+    """
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            params = self.request.query_params
+            self._fieldset = (
+                parse(params.get('fields')), parse(params.get('expand')) or {}
+            )
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+    def wants(self, *path, expandable=False):
+        """Попадёт ли в ответ поле path (например, 'author', 'avatar')."""
+        fields, expand = self.get_fieldset()
+        for depth, name in enumerate(path):
+            last = depth == len(path) - 1
+            if not included(fields, expand, name, expandable and last):
+                return False
+            fields, expand = descend(fields, expand, name)
+        return True
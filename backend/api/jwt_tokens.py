@@ -0,0 +1,116 @@
+"""
+Подписанные токены (JWT_AUTH=True): выпуск, отзыв и аутентификация без
+обращения к БД.
+
+Модуль импортируется только на пути JWT: simplejwt при импорте читает
+SECRET_KEY, а остальному приложению и командам manage.py он не нужен.
+Отозванные токены хранятся в кэше JWT_DENYLIST_ALIAS — по умолчанию в
+общем CACHE_BACKEND, чтобы отзыв сразу видели все воркеры.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import User
+
+# Поля пользователя, которые кладутся в JWT: их хватает правам доступа
+# и сериализаторам, остальные поля дочитываются из БД при обращении.
+JWT_USER_CLAIMS = (
+    'username', 'email', 'first_name', 'last_name',
+    'role', 'is_staff', 'is_superuser', 'is_active',
+)
+DENIED_JTI_KEY = 'jwt-denied:{}'
+DENIED_USER_KEY = 'jwt-user-denied:{}'
+
+
+def jwt_denylist():
+    return caches[settings.JWT_DENYLIST_ALIAS]
+
+
+def issue_tokens(user):
+    """Выпустить пару refresh/access со снимком пользователя в claims."""
+    refresh = RefreshToken.for_user(user)
+    # Дробная метка: отзыв всех токенов пользователя не должен задевать
+    # токен, выпущенный сразу после него в ту же секунду.
+    refresh['iat'] = time.time()
+    for claim in JWT_USER_CLAIMS:
+        refresh[claim] = getattr(user, claim)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+def deny_token(token):
+    """Отозвать токен; запись в списке живёт до истечения его срока."""
+    remaining = int(token['exp'] - time.time()) + 1
+    if remaining > 0:
+        jwt_denylist().set(
+            DENIED_JTI_KEY.format(token[jwt_settings.JTI_CLAIM]),
+            True,
+            remaining
+        )
+
+
+def deny_user_tokens(user):
+    """Отозвать все токены пользователя, выпущенные до этого момента."""
+    jwt_denylist().set(
+        DENIED_USER_KEY.format(user.pk),
+        time.time(),
+        int(jwt_settings.REFRESH_TOKEN_LIFETIME.total_seconds()) + 1
+    )
+
+
+def is_denied(token):
+    jti_key = DENIED_JTI_KEY.format(token[jwt_settings.JTI_CLAIM])
+    user_key = DENIED_USER_KEY.format(token.get(jwt_settings.USER_ID_CLAIM))
+    denied = jwt_denylist().get_many([jti_key, user_key])
+    if jti_key in denied:
+        return True
+    revoked_at = denied.get(user_key)
+    return revoked_at is not None and token.get('iat', 0) <= revoked_at
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Аутентификация по подписанному access-токену без обращения к БД.
+
+    Пользователь собирается из claims токена (JWT_USER_CLAIMS) как
+    экземпляр User с отложенными остальными полями: пароль или аватар
+    читаются из БД только там, где они нужны, а save() обновляет только
+    загруженные поля. Отозванные токены ищутся в общем списке
+    JWT_DENYLIST_ALIAS; блокировка пользователя отзывает все его токены,
+    а токен заблокированного (is_active=False в claims) не принимается.
+    """
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_denied(token):
+            raise InvalidToken('Токен отозван.')
+        return token
+
+    def get_user(self, validated_token):
+        try:
+            loaded = {
+                claim: validated_token[claim] for claim in JWT_USER_CLAIMS
+            }
+            loaded['id'] = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('В токене нет данных пользователя.')
+        if not loaded['is_active']:
+            raise AuthenticationFailed(
+                'Пользователь заблокирован.', code='user_inactive'
+            )
+        # from_db ждёт значения в порядке полей модели
+        fields = [
+            field.attname for field in User._meta.concrete_fields
+            if field.attname in loaded
+        ]
+        return User.from_db(
+            router.db_for_write(User),
+            fields,
+            [loaded[name] for name in fields]
+        )
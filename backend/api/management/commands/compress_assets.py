@@ -0,0 +1,111 @@
+import gzip
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from api.snapshots import write_ingredients_snapshot
+
+try:
+    import brotli
+except ImportError:  # .br создаются, только если установлен brotli
+    brotli = None
+
+# Текстовые форматы; картинки в media уже сжаты, их не трогаем
+COMPRESSIBLE = {
+    '.css', '.js', '.map', '.json', '.html', '.txt', '.svg',
+    '.xml', '.yml', '.yaml', '.ico', '.ttf', '.eot',
+}
+MIN_SIZE = 256
+
+
+class Command(BaseCommand):
+    help = (
+        'Write .gz (and .br when brotli is installed) copies of text '
+        'assets for nginx gzip_static, and a snapshot of the ingredient '
+        'list. Run after collectstatic and after importing ingredients.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Directories to compress (default: STATIC_ROOT and '
+                 'MEDIA_ROOT)'
+        )
+        parser.add_argument(
+            '--no-ingredients', action='store_true',
+            help='Do not write the ingredient list snapshot'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Recompress files whose compressed copies are up to date'
+        )
+
+    def handle(self, *args, **options):
+        roots = [Path(path) for path in options['paths']] or [
+            Path(settings.STATIC_ROOT), Path(settings.MEDIA_ROOT)
+        ]
+        for root in roots:
+            if not root.is_dir():
+                raise CommandError(f'Нет каталога {root}')
+        written = skipped = 0
+        saved = 0
+        for root in roots:
+            for path in self._files(root):
+                result = self._compress(path, options['force'])
+                if result is None:
+                    skipped += 1
+                else:
+                    written += 1
+                    saved += result
+        self.stdout.write(self.style.SUCCESS(
+            f'Compressed {written} files, skipped {skipped}, '
+            f'saved {saved / 1024:.1f} KiB (gzip)'
+            + ('' if brotli else '; brotli not installed, .br skipped')
+        ))
+        if not options['no_ingredients']:
+            self._write_ingredients()
+
+    def _write_ingredients(self):
+        # Без БД (например, при старте контейнера раньше базы) снимка
+        # просто не будет: список отдаст Django
+        try:
+            path, count = write_ingredients_snapshot()
+        except DatabaseError as error:
+            self.stderr.write(f'Ingredient snapshot skipped: {error}')
+            return
+        self.stdout.write(f'Ingredient snapshot: {path} ({count} items)')
+        self._compress(path, force=True)
+
+    @staticmethod
+    def _files(root):
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                if path.suffix.lower() in COMPRESSIBLE:
+                    yield path
+
+    @staticmethod
+    def _compress(path, force):
+        """Записать сжатые копии; вернуть экономию gzip в байтах."""
+        gz_path = path.with_name(path.name + '.gz')
+        source_mtime = path.stat().st_mtime
+        if (
+            not force and gz_path.exists()
+            and gz_path.stat().st_mtime >= source_mtime
+        ):
+            return None
+        data = path.read_bytes()
+        if len(data) < MIN_SIZE:
+            return None
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) >= len(data):
+            return None
+        gz_path.write_bytes(compressed)
+        if brotli is not None:
+            path.with_name(path.name + '.br').write_bytes(
+                brotli.compress(data, quality=11)
+            )
+        return len(data) - len(compressed)
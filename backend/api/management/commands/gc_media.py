@@ -0,0 +1,121 @@
+import os
+import posixpath
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from foodgram.storage import DERIVED_DIR, TMP_DIR, derived_source
+
+
+def file_fields():
+    """Все FileField/ImageField моделей проекта."""
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                yield model, field
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete media files that no FileField references, in batches. '
+        'Only upload_to directories of the models and derived files are '
+        'scanned; files newer than --min-age are kept so uploads of not '
+        'yet committed transactions survive. Derived files live as long '
+        'as their source.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Keep files modified less than this many seconds ago'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='How many files to delete before pausing'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.0,
+            help='Pause between batches, seconds'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be deleted'
+        )
+
+    def handle(self, *args, **options):
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        referenced = set()
+        directories = {TMP_DIR, DERIVED_DIR}
+        for model, field in file_fields():
+            if isinstance(field.upload_to, str):
+                directories.add(field.upload_to.strip('/'))
+            referenced.update(
+                model._default_manager.exclude(
+                    **{field.name: ''}
+                ).values_list(field.name, flat=True).iterator(
+                    chunk_size=options['batch_size']
+                )
+            )
+
+        # Производный файл нужен, пока жив его исходный
+        sources = {
+            os.path.splitext(posixpath.basename(name))[0]
+            for name in referenced
+        }
+
+        cutoff = time.time() - options['min_age']
+        batch = []
+        deleted = freed = 0
+        for path, name in self._files(media_root, directories):
+            if name in referenced:
+                continue
+            if (name.startswith(DERIVED_DIR + '/')
+                    and derived_source(name) in sources):
+                continue
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+            batch.append(path)
+            freed += stat.st_size
+            if len(batch) >= options['batch_size']:
+                deleted += self._delete(batch, options)
+                batch = []
+        deleted += self._delete(batch, options)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} unreferenced files, {freed / 1024:.1f} KiB; '
+            f'{len(referenced)} files referenced'
+        ))
+
+    @staticmethod
+    def _files(media_root, directories):
+        """Пары (путь, имя относительно MEDIA_ROOT) в каталогах моделей."""
+        for directory in sorted(directories):
+            top = os.path.join(media_root, directory)
+            for dirpath, _, filenames in os.walk(top):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    yield path, os.path.relpath(
+                        path, media_root
+                    ).replace(os.sep, '/')
+
+    def _delete(self, batch, options):
+        if not batch or options['dry_run']:
+            return len(batch)
+        for path in batch:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            try:
+                # Пустой каталог-префикс хеша больше не нужен
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+        if options['sleep']:
+            time.sleep(options['sleep'])
+        return len(batch)
@@ -0,0 +1,155 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Local load test of a read endpoint with many concurrent, '
+        'optionally slow clients. Run it against the WSGI server and '
+        'against the ASGI server to compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000/api/ingredients/',
+            help='Endpoint to request'
+        )
+        parser.add_argument(
+            '--concurrency', '-c', type=int, default=200,
+            help='Number of simultaneously connected clients'
+        )
+        parser.add_argument(
+            '--requests', '-n', type=int, default=2000,
+            help='Total number of requests'
+        )
+        parser.add_argument(
+            '--slow', type=float, default=0.0,
+            help='Seconds each client waits in the middle of sending '
+                 'its request headers (simulates slow mobile clients)'
+        )
+        parser.add_argument(
+            '--token', default=None,
+            help='Auth token to send as "Authorization: Token <token>"'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30.0,
+            help='Per-request timeout in seconds'
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only plain http:// URLs are supported')
+        path = quote(url.path or '/', safe='/%')
+        if url.query:
+            path += '?' + quote(url.query, safe='=&%')
+        headers = [
+            f'GET {path} HTTP/1.1',
+            f'Host: {url.netloc}',
+            'Accept: application/json',
+            'Connection: close',
+        ]
+        if options['token']:
+            headers.append(f'Authorization: Token {options["token"]}')
+        request = ('\r\n'.join(headers) + '\r\n\r\n').encode()
+
+        started = time.perf_counter()
+        latencies, statuses, connects = asyncio.run(self._run(
+            url.hostname, url.port or 80, request, options
+        ))
+        elapsed = time.perf_counter() - started
+
+        ok = statuses.get(200, 0)
+        self.stdout.write(f'URL:          {options["url"]}')
+        self.stdout.write(
+            f'Requests:     {options["requests"]} '
+            f'(concurrency {options["concurrency"]}, '
+            f'slow {options["slow"]}s)'
+        )
+        self.stdout.write(f'Elapsed:      {elapsed:.2f}s')
+        self.stdout.write(f'Throughput:   {ok / elapsed:.1f} ok req/s')
+        self.stdout.write(f'Statuses:     {statuses}')
+        if latencies:
+            latencies.sort()
+            self.stdout.write(
+                'Latency (ms): '
+                f'p50={self._percentile(latencies, 50):.1f} '
+                f'p95={self._percentile(latencies, 95):.1f} '
+                f'p99={self._percentile(latencies, 99):.1f} '
+                f'mean={statistics.mean(latencies):.1f}'
+            )
+        if connects:
+            new = [ms for kind, ms in connects if kind == 'new']
+            self.stdout.write(
+                f'DB connects:  {len(new)} new of {len(connects)} '
+                f'responses, mean setup '
+                f'{statistics.mean(new) if new else 0:.2f}ms'
+            )
+
+    async def _run(self, host, port, request, options):
+        queue = asyncio.Queue()
+        for _ in range(options['requests']):
+            queue.put_nowait(None)
+        latencies = []
+        statuses = {}
+        connects = []
+
+        async def client():
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    status, connect = await asyncio.wait_for(
+                        self._request(host, port, request, options['slow']),
+                        options['timeout']
+                    )
+                except (
+                    OSError, asyncio.TimeoutError, ValueError, IndexError
+                ):
+                    status = 'error'
+                else:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    if connect:
+                        connects.append(connect)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        await asyncio.gather(
+            *(client() for _ in range(options['concurrency']))
+        )
+        return latencies, statuses, connects
+
+    @staticmethod
+    async def _request(host, port, request, slow):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            if slow:
+                half = len(request) // 2
+                writer.write(request[:half])
+                await writer.drain()
+                await asyncio.sleep(slow)
+                writer.write(request[half:])
+            else:
+                writer.write(request)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        head = response.split(b'\r\n\r\n', 1)[0].decode('latin-1')
+        status_line, *header_lines = head.split('\r\n')
+        connect = None
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            if name.lower() == 'x-db-connect':
+                # Заголовок ConnectionSetupMiddleware: «new; 3.20ms»
+                kind, _, ms = value.strip().partition(';')
+                connect = (kind, float(ms.strip().rstrip('ms') or 0))
+        return int(status_line.split()[1]), connect
+
+    @staticmethod
+    def _percentile(values, percent):
+        index = min(len(values) - 1, int(len(values) * percent / 100))
+        return values[index]
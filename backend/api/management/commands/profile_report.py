@@ -0,0 +1,117 @@
+import json
+import statistics
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Summarize request profiles written by api.profiling, grouped by '
+        'endpoint: request and SQL timings, the hottest functions and the '
+        'slowest SQL. Optionally merge the collapsed stacks into one file '
+        'for flamegraph.pl.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir', default=str(settings.PROFILING_DIR),
+            help='Directory with profiles (PROFILING_DIR)'
+        )
+        parser.add_argument(
+            '--endpoint', default=None,
+            help='Only this endpoint, e.g. RecipeViewSet.list'
+        )
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='How many functions and SQL statements to show'
+        )
+        parser.add_argument(
+            '--folded', default=None,
+            help='Write merged collapsed stacks of the selected endpoints '
+                 'to this file'
+        )
+
+    @staticmethod
+    def load(directory):
+        """Профили эндпоинта: (сведения, свёрнутые стеки)."""
+        profiles = []
+        for meta_path in sorted(directory.glob('*.json')):
+            stacks = Counter()
+            folded = meta_path.with_suffix('.folded')
+            if folded.exists():
+                for line in folded.read_text().splitlines():
+                    stack, _, count = line.rpartition(' ')
+                    stacks[stack] += int(count)
+            profiles.append((json.loads(meta_path.read_text()), stacks))
+        return profiles
+
+    def report(self, endpoint, profiles, top):
+        durations = [meta['duration_ms'] for meta, _ in profiles]
+        queries = [len(meta['queries']) for meta, _ in profiles]
+        sql_time = [
+            sum(query['duration_ms'] for query in meta['queries'])
+            for meta, _ in profiles
+        ]
+        self.stdout.write(self.style.MIGRATE_HEADING(endpoint))
+        self.stdout.write(
+            f'  {len(profiles)} profiles, '
+            f'median {statistics.median(durations):.1f} ms, '
+            f'max {max(durations):.1f} ms; '
+            f'SQL {statistics.mean(queries):.1f} queries, '
+            f'{statistics.mean(sql_time):.1f} ms on average'
+        )
+
+        # Собственное время функции — сэмплы, где она на вершине стека
+        own, total = Counter(), 0
+        for _, stacks in profiles:
+            for stack, count in stacks.items():
+                own[stack.rsplit(';', 1)[-1]] += count
+                total += count
+        if total:
+            self.stdout.write(f'  hottest functions ({total} samples):')
+            for name, count in own.most_common(top):
+                self.stdout.write(f'    {count / total:6.1%}  {name}')
+
+        statements = defaultdict(lambda: [0, 0.0])
+        for meta, _ in profiles:
+            for query in meta['queries']:
+                statements[query['sql']][0] += 1
+                statements[query['sql']][1] += query['duration_ms']
+        if statements:
+            self.stdout.write('  slowest SQL (total ms, runs):')
+            for sql, (runs, spent) in sorted(
+                statements.items(), key=lambda item: -item[1][1]
+            )[:top]:
+                self.stdout.write(f'    {spent:9.1f} {runs:5}  {sql[:200]}')
+
+    def handle(self, *args, **options):
+        root = Path(options['dir'])
+        if not root.is_dir():
+            raise CommandError(f'No profiles in {root}')
+        endpoints = sorted(
+            path for path in root.iterdir()
+            if path.is_dir()
+            and options['endpoint'] in (None, path.name)
+        )
+        if not endpoints:
+            raise CommandError('No matching endpoints')
+
+        merged = Counter()
+        for directory in endpoints:
+            profiles = self.load(directory)
+            if not profiles:
+                continue
+            self.report(directory.name, profiles, options['top'])
+            for _, stacks in profiles:
+                merged.update(stacks)
+
+        if options['folded']:
+            with open(options['folded'], 'w') as f:
+                for stack, count in merged.items():
+                    f.write(f'{stack} {count}\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Collapsed stacks written to {options["folded"]}'
+            ))
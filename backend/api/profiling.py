@@ -0,0 +1,185 @@
+"""
+Профилирование отдельных запросов API на живом сервере.
+
+Запрос профилируется, если в заголовке X-Profile передан
+PROFILING_SECRET (тогда в ответе есть X-Profile-Id), либо случайно с
+вероятностью PROFILING_SAMPLE_RATE. По умолчанию выключено: секрета нет,
+вероятность 0.
+
+Профилировщик сэмплирующий: отдельный поток раз в PROFILING_INTERVAL
+секунд снимает стек потока запроса (sys._current_frames()), сам запрос
+ничего не замеряет. SQL-запросы записываются через execute_wrapper —
+время начала от старта запроса, длительность, база и текст без
+параметров.
+
+Каждый профиль — два файла в PROFILING_DIR/<вьюсет>.<действие>/:
+<id>.folded — стеки в свёрнутом формате flamegraph.pl
+(«кадр;кадр;кадр число») и <id>.json — сведения о запросе и хронология
+SQL. У эндпоинта хранятся последние PROFILING_MAX_PROFILES профилей,
+более старые удаляются. Сводку по эндпоинтам строит команда
+profile_report.
+"""
+import hmac
+import json
+import random
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+HEADER = 'HTTP_X_PROFILE'
+PROJECT_DIR = str(settings.BASE_DIR)
+STDLIB_DIR = sysconfig.get_paths()['stdlib']
+
+
+def frame_name(code):
+    """Кадр стека: путь внутри проекта или пакета и имя функции."""
+    filename = code.co_filename
+    if 'site-packages/' in filename:
+        filename = filename.split('site-packages/', 1)[1]
+    elif filename.startswith(PROJECT_DIR):
+        filename = filename[len(PROJECT_DIR) + 1:]
+    elif filename.startswith(STDLIB_DIR):
+        filename = filename[len(STDLIB_DIR) + 1:]
+    return f'{filename}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+def requested(request):
+    """Профилировать ли запрос; второе значение — по заголовку ли."""
+    token = request.META.get(HEADER)
+    secret = settings.PROFILING_SECRET
+    # compare_digest не принимает строки с не-ASCII символами
+    if token and secret and hmac.compare_digest(
+        token.encode(), secret.encode()
+    ):
+        return True, True
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate, False
+
+
+def prune(directory, keep):
+    """Оставить в directory последние keep профилей."""
+    # id начинается с времени, так что порядок имён — порядок записи
+    profiles = sorted(path.stem for path in directory.glob('*.json'))
+    for profile_id in profiles[:max(len(profiles) - keep, 0)]:
+        for suffix in ('.json', '.folded'):
+            (directory / f'{profile_id}{suffix}').unlink(missing_ok=True)
+
+
+class Sampler(threading.Thread):
+    """Снимает стек потока thread_id от кадра root вглубь."""
+    def __init__(self, thread_id, root, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names, code = [], None
+            while frame is not None and frame is not self.root:
+                code = frame.f_code
+                names.append(frame_name(code))
+                frame = frame.f_back
+            # Запуск и остановка самого профилировщика не в счёт
+            if names and code.co_filename != __file__:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+class RequestProfile:
+    """Стеки и SQL одного запроса; root — кадр, с которого снимать стек."""
+    def __init__(self, root):
+        self.root = root
+        self.queries = []
+
+    def __enter__(self):
+        self.started = timezone.now()
+        self.start = time.perf_counter()
+        self.sampler = Sampler(
+            threading.get_ident(), self.root, settings.PROFILING_INTERVAL
+        )
+        self._wrappers = ExitStack()
+        for alias in connections:
+            self._wrappers.enter_context(
+                connections[alias].execute_wrapper(self._record)
+            )
+        self.sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        self.sampler.stop()
+        self._wrappers.close()
+        return False
+
+    def _record(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'start_ms': round((start - self.start) * 1000, 3),
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'many': many,
+            })
+
+    def save(self, endpoint, request, response):
+        """Записать профиль; возвращает его id."""
+        profile_id = (
+            f'{self.started:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+        )
+        directory = Path(settings.PROFILING_DIR) / endpoint
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f'{profile_id}.folded').write_text(''.join(
+            f'{endpoint};{stack} {count}\n'
+            for stack, count in self.sampler.stacks.items()
+        ))
+        (directory / f'{profile_id}.json').write_text(json.dumps({
+            'id': profile_id,
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'started': self.started.isoformat(),
+            'duration_ms': round(self.duration * 1000, 3),
+            'interval_ms': settings.PROFILING_INTERVAL * 1000,
+            'samples': sum(self.sampler.stacks.values()),
+            'queries': self.queries,
+        }, ensure_ascii=False, indent=1))
+        prune(directory, settings.PROFILING_MAX_PROFILES)
+        return profile_id
+
+
+class ProfilingMixin:
+    """Примесь к вьюсету: профилирование dispatch по запросу."""
+    def dispatch(self, request, *args, **kwargs):
+        wanted, by_header = requested(request)
+        if not wanted:
+            return super().dispatch(request, *args, **kwargs)
+        with RequestProfile(sys._getframe()) as profile:
+            response = super().dispatch(request, *args, **kwargs)
+        endpoint = (
+            f'{type(self).__name__}.'
+            f'{getattr(self, "action", None) or request.method.lower()}'
+        )
+        profile_id = profile.save(endpoint, request, response)
+        if by_header:
+            response['X-Profile-Id'] = profile_id
+        return response
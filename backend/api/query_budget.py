@@ -0,0 +1,156 @@
+"""
+Бюджет SQL-запросов на действие API.
+
+Вьюсет с QueryBudgetMixin задаёт query_budgets — {действие: сколько
+запросов оно может выполнить}; запросы аутентификации и проверки прав
+не считаются. Кроме числа запросов отслеживаются повторы: один и тот же
+SQL (с разными параметрами) QUERY_BUDGET_DUPLICATES раз подряд — это
+N+1, и в отчёте указан метод сериализатора, который его выполняет
+(например, UserReadSerializer.get_is_subscribed).
+
+Нарушение по QUERY_BUDGET_MODE: raise — исключение QueryBudgetExceeded
+(по умолчанию при DEBUG), log — запись в лог со стеком, off — без
+проверки. В тестах тот же контроль — менеджер контекста:
+
+    with query_budget(6):
+        client.get('/api/recipes/')
+"""
+import logging
+import sys
+import traceback
+from collections import Counter
+from contextlib import ContextDecorator, ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = str(settings.BASE_DIR)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _in_project(frame):
+    filename = frame.f_code.co_filename
+    return (
+        filename.startswith(PROJECT_DIR)
+        and 'site-packages' not in filename
+        and filename != __file__
+    )
+
+
+def _where(frame):
+    return f'{frame.f_code.co_filename}:{frame.f_lineno}'
+
+
+def _culprit(frame):
+    """
+    Кто выполнил запрос: метод сериализатора проекта, иначе любой
+    сериализатор, иначе ближайшая строка кода проекта.
+    """
+    serializer = project = None
+    while frame is not None:
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, BaseSerializer):
+            method = (
+                f'{type(owner).__name__}.{frame.f_code.co_name} '
+                f'({_where(frame)})'
+            )
+            if _in_project(frame):
+                return method
+            serializer = serializer or method
+        if project is None and _in_project(frame):
+            project = _where(frame)
+        frame = frame.f_back
+    return serializer or project or 'unknown'
+
+
+def _project_stack(frame):
+    stack = traceback.extract_stack(frame)
+    return ''.join(traceback.format_list([
+        entry for entry in stack
+        if entry.filename.startswith(PROJECT_DIR)
+        and 'site-packages' not in entry.filename
+        and entry.filename != __file__
+    ]))
+
+
+class query_budget(ContextDecorator):
+    """
+    Не больше limit запросов ко всем базам внутри блока и без повторов
+    одного SQL duplicates раз. Стек снимается только при нарушении.
+    """
+    def __init__(self, limit, name=None, mode='raise', duplicates=None):
+        self.limit = limit
+        self.name = name or 'block'
+        self.mode = mode
+        self.duplicates = (
+            settings.QUERY_BUDGET_DUPLICATES
+            if duplicates is None else duplicates
+        )
+
+    def __enter__(self):
+        self.count = 0
+        self.statements = Counter()
+        self.problems = []
+        self._wrappers = ExitStack()
+        for alias in connections:
+            self._wrappers.enter_context(
+                connections[alias].execute_wrapper(self._record)
+            )
+        return self
+
+    def _record(self, execute, sql, params, many, context):
+        self.count += 1
+        self.statements[sql] += 1
+        if self.count == self.limit + 1:
+            self.problems.append(
+                f'query {self.count} over budget of {self.limit}: {sql}\n'
+                + _project_stack(sys._getframe(1))
+            )
+        if self.statements[sql] == self.duplicates:
+            self.problems.append(
+                f'same query run {self.duplicates} times (N+1) in '
+                f'{_culprit(sys._getframe(1))}: {sql}'
+            )
+        return execute(sql, params, many, context)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._wrappers.close()
+        if not self.problems:
+            return False
+        message = (
+            f'Query budget of {self.name} exceeded: {self.count} queries, '
+            f'budget {self.limit}\n' + '\n'.join(self.problems)
+        )
+        # Уже летящее исключение важнее: нарушение только в лог
+        if self.mode == 'raise' and exc_type is None:
+            raise QueryBudgetExceeded(message)
+        logger.error(message)
+        return False
+
+
+class QueryBudgetMixin:
+    """
+    Примесь к вьюсету: действия из query_budgets выполняются под
+    query_budget с режимом QUERY_BUDGET_MODE.
+    """
+    query_budgets = {}
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        limit = self.query_budgets.get(self.action)
+        if limit is not None and settings.QUERY_BUDGET_MODE != 'off':
+            self._query_budget_scope.enter_context(query_budget(
+                limit,
+                name=f'{type(self).__name__}.{self.action}',
+                mode=settings.QUERY_BUDGET_MODE,
+            ))
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self._query_budget_scope:
+            return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,76 @@
+"""
+Чтение безопасных запросов API с реплик с гарантией read-your-writes.
+
+После успешного изменяющего запроса пользователь на
+REPLICA_STICKY_SECONDS «прилипает» к основной БД, пока реплики
+догоняют запись. Метка хранится в кэше Django: для нескольких
+процессов нужен общий кэш (CACHE_BACKEND).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.db_router import reset_replica, use_replica
+
+STICKY_KEY = 'replica-sticky:{}'
+
+
+def remember_write(user):
+    cache.set(
+        STICKY_KEY.format(user.pk), True, settings.REPLICA_STICKY_SECONDS
+    )
+
+
+def wrote_recently(user):
+    return user.is_authenticated and bool(
+        cache.get(STICKY_KEY.format(user.pk))
+    )
+
+
+def replica_allowed(user):
+    """Можно ли читать данные пользователя с реплики."""
+    return bool(settings.DATABASE_REPLICAS) and not wrote_recently(user)
+
+
+class ReplicaReadMixin:
+    """
+    Примесь к вьюсету: действия из replica_actions на безопасных методах
+    читают данные с реплики. Аутентификация и проверка прав выполняются
+    до переключения, на основной БД.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and replica_allowed(request.user)
+        ):
+            self._replica_token = use_replica()
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._replica_token is not None:
+                reset_replica(self._replica_token)
+
+
+class ReplicaStickyMiddleware:
+    """Запомнить пользователя, успешно выполнившего изменяющий запрос."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        ):
+            remember_write(user)
+        return response
@@ -1,11 +1,17 @@
 import base64
 import binascii
 
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
+from django.db import connections, router
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 from rest_framework.validators import UniqueTogetherValidator
 
 from djoser.serializers import UserSerializer as DjoserUserSerializer
+from foodgram import revisions
 from recipes.models import (
     Ingredient,
     Tag,
@@ -18,7 +24,11 @@ from recipes.models import (
     COOKING_TIME_MIN,
     COOKING_TIME_MAX,
 )
+from sync import changes
 from users.models import User, Subscription
+from . import events
+from .fieldsets import SparseFieldsetSerializerMixin
+from .constants import BULK_MAX_ITEMS
 
 
 class Base64ImageField(serializers.ImageField):
@@ -36,6 +46,125 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+# Ключ контекста сериализатора, под которым хранится кэш in_bulk запроса
+IN_BULK_CACHE = 'in_bulk_cache'
+
+
+def resolve_in_bulk(queryset, pks, cache=None):
+    """Загрузить объекты по списку pk одним запросом.
+
+    Возвращает словарь {pk: объект} и список pk, которых нет в базе.
+    В cache (если передан) запоминаются и найденные, и отсутствующие pk,
+    повторно запрашиваются только новые.
+    """
+    if cache is None:
+        cache = {}
+    unknown = set(pks) - cache.keys()
+    if unknown:
+        cache.update(dict.fromkeys(unknown))
+        cache.update(queryset.in_bulk(unknown))
+    objects = {pk: cache[pk] for pk in pks if cache[pk] is not None}
+    missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+    return objects, missing
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField без запроса в БД на каждый элемент.
+
+    Поле проверяет только тип pk, а сами объекты загружает родитель
+    (BulkManyRelatedField или list-сериализатор) одним запросом in_bulk.
+    """
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        pk = self.get_queryset().model._meta.pk
+        try:
+            return pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def resolve(self, pks):
+        """Загрузить объекты по pk через общий для запроса кэш in_bulk."""
+        queryset = self.get_queryset()
+        cache = self.context.setdefault(IN_BULK_CACHE, {}).setdefault(
+            queryset.model, {}
+        )
+        return resolve_in_bulk(queryset, pks, cache)
+
+    def parse_pks(self, values):
+        """Отобрать из сырых данных корректные pk, молча пропуская мусор."""
+        pks = []
+        for value in values:
+            if value is None:
+                continue
+            try:
+                pks.append(self.to_internal_value(value))
+            except serializers.ValidationError:
+                continue
+        return pks
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        max_length = kwargs.pop('max_length', None)
+        list_kwargs = {
+            'child_relation': cls(*args, **kwargs),
+            'max_length': max_length,
+        }
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список связанных объектов, проверяемый одним запросом in_bulk."""
+    default_error_messages = {
+        'max_length': 'Не больше {max_length} элементов.',
+    }
+
+    def __init__(self, max_length=None, **kwargs):
+        self.max_length = max_length
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if (
+            self.max_length is not None
+            and isinstance(data, list)
+            and len(data) > self.max_length
+        ):
+            self.fail('max_length', max_length=self.max_length)
+        pks = super().to_internal_value(data)
+        objects, missing = self.child_relation.resolve(pks)
+        if missing:
+            message = self.child_relation.error_messages['does_not_exist']
+            raise serializers.ValidationError(
+                [message.format(pk_value=pk) for pk in missing],
+                code='does_not_exist'
+            )
+        return [objects[pk] for pk in pks]
+
+
+def bulk_create_with_pks(model, objs):
+    """bulk_create, после которого у всех объектов заполнен pk.
+
+    Если СУБД не умеет возвращать pk из пакетной вставки
+    (SQLite в Django 3.2), объекты сохраняются по одному. О созданных
+    объектах узнаёт api.events: save() шлёт сигналы сам, за
+    bulk_create сообщает record_many().
+    """
+    connection = connections[router.db_for_write(model)]
+    if connection.features.can_return_rows_from_bulk_insert:
+        objs = model.objects.bulk_create(objs)
+        events.record_many(objs, events.CREATED)
+        return objs
+    for obj in objs:
+        obj.save(force_insert=True)
+    return objs
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
     """Регистрация пользователя: только нужные поля и хеширование пароля."""
     password = serializers.CharField(write_only=True)
@@ -62,10 +191,15 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return user
 
 
-class UserReadSerializer(DjoserUserSerializer):
+class UserReadSerializer(
+    SparseFieldsetSerializerMixin, DjoserUserSerializer
+):
     """Чтение профиля пользователя."""
     is_subscribed = serializers.SerializerMethodField()
-    avatar = serializers.ImageField(read_only=True) 
+    avatar = serializers.ImageField(read_only=True)
+    recipes_count = serializers.SerializerMethodField()
+
+    expandable_fields = ('recipes_count',)
 
     class Meta(DjoserUserSerializer.Meta):
         model = User
@@ -77,9 +211,13 @@ class UserReadSerializer(DjoserUserSerializer):
             'email',
             'avatar',
             'is_subscribed',
+            'recipes_count',
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            # Посчитано аннотацией Exists в запросе вьюсета
+            return obj.is_subscribed
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -87,6 +225,11 @@ class UserReadSerializer(DjoserUserSerializer):
             author=obj
         ).exists()
 
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.recipes.count()
+
 
 class AvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField()
@@ -136,9 +279,29 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
+class IngredientInRecipeListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта: все id проверяются одним запросом."""
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        id_field = self.child.fields['id']
+        objects, missing = id_field.resolve(
+            [item['ingredient'] for item in items]
+        )
+        if missing:
+            message = id_field.error_messages['does_not_exist']
+            raise serializers.ValidationError([
+                {'id': [message.format(pk_value=item['ingredient'])]}
+                if item['ingredient'] in missing else {}
+                for item in items
+            ], code='does_not_exist')
+        for item in items:
+            item['ingredient'] = objects[item['ingredient']]
+        return items
+
+
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     """Ингредиент в рецепте с указанием количества."""
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         source='ingredient',
         queryset=Ingredient.objects.all()
     )
@@ -162,6 +325,7 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientInRecipe
         fields = ('id', 'name', 'measurement_unit', 'amount')
+        list_serializer_class = IngredientInRecipeListSerializer
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
@@ -171,47 +335,231 @@ class RecipeShortSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
-    """Полное чтение рецепта."""
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ('id', 'name', 'color', 'slug')
+
+
+class RecipeReadSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
+    """
+    Полное чтение рецепта. Флаги is_favorited, is_in_shopping_cart и
+    is_subscribed автора берутся из аннотаций запроса, если вьюсет их
+    добавил, иначе запрашиваются для каждого рецепта.
+    """
     author = UserReadSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(
         source='ingredient_amounts',
         many=True,
         read_only=True
     )
+    tags = TagSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
+    expandable_fields = ('tags',)
+
     class Meta:
         model = Recipe
         fields = (
             'id',
             'author',
             'ingredients',
+            'tags',
             'is_favorited',
             'is_in_shopping_cart',
             'name',
             'image',
             'text',
             'cooking_time',
+            'servings',
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return user.favorites.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return user.shopping_cart.filter(recipe=obj).exists()
 
 
+class RecipeBulkSerializer(serializers.ListSerializer):
+    """
+    Пакетное создание/обновление рецептов.
+
+    Ингредиенты и теги всех рецептов пакета проверяются одним запросом
+    in_bulk на модель, запись идёт через bulk_create/bulk_update.
+    При обновлении instance — queryset рецептов, доступных для правки,
+    а каждый элемент пакета содержит id рецепта.
+    Транзакцию открывает вызывающий код.
+    """
+    def to_internal_value(self, data):
+        if not isinstance(data, list) or (
+            self.max_length is not None and len(data) > self.max_length
+        ):
+            return super().to_internal_value(data)
+        self._prefetch_related(data)
+        id_errors = [{}] * len(data)
+        if self.instance is not None:
+            id_errors = self._match_instances(data)
+        try:
+            items = super().to_internal_value(data)
+        except serializers.ValidationError as exc:
+            if not isinstance(exc.detail, list):
+                raise
+            raise serializers.ValidationError([
+                {**id_error, **item_error}
+                for id_error, item_error in zip(id_errors, exc.detail)
+            ])
+        if any(id_errors):
+            raise serializers.ValidationError(id_errors)
+        return items
+
+    def _prefetch_related(self, data):
+        """Загрузить ингредиенты и теги всего пакета в кэш in_bulk."""
+        id_field = self.child.fields['ingredients'].child.fields['id']
+        tag_field = self.child.fields['tags'].child_relation
+        ingredient_ids, tag_ids = [], []
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            ingredients = item.get('ingredients')
+            if isinstance(ingredients, list):
+                ingredient_ids.extend(
+                    ingredient.get('id') for ingredient in ingredients
+                    if isinstance(ingredient, dict)
+                )
+            tags = item.get('tags')
+            if isinstance(tags, list):
+                tag_ids.extend(tags)
+        id_field.resolve(id_field.parse_pks(ingredient_ids))
+        tag_field.resolve(tag_field.parse_pks(tag_ids))
+
+    def _match_instances(self, data):
+        """Сопоставить элементы пакета с рецептами из self.instance по id."""
+        pk_field = Recipe._meta.pk
+        ids = []
+        for item in data:
+            try:
+                ids.append(pk_field.to_python(
+                    item.get('id') if isinstance(item, dict) else None
+                ))
+            except DjangoValidationError:
+                ids.append(None)
+        found = self.instance.in_bulk(
+            [pk for pk in ids if pk is not None]
+        )
+        self.matched_instances = [found.get(pk) for pk in ids]
+        errors = []
+        seen = set()
+        for pk in ids:
+            if pk not in found:
+                errors.append({'id': ['Рецепт не найден.']})
+            elif pk in seen:
+                errors.append({'id': ['Рецепт указан несколько раз.']})
+            else:
+                errors.append({})
+            seen.add(pk)
+        return errors
+
+    def create(self, validated_data):
+        author = self.context['request'].user
+        recipes = bulk_create_with_pks(Recipe, [
+            Recipe(author=author, **self._own_fields(item))
+            for item in validated_data
+        ])
+        # bulk_create не шлёт сигналов, см. api.conditional
+        revisions.bump(User, [author.pk])
+        self._save_relations(recipes, validated_data, replace=False)
+        return recipes
+
+    def update(self, instance, validated_data):
+        recipes = self.matched_instances
+        image_field = Recipe._meta.get_field('image')
+        fields = set()
+        for recipe, item in zip(recipes, validated_data):
+            own_fields = self._own_fields(item)
+            for attr, value in own_fields.items():
+                setattr(recipe, attr, value)
+            if 'image' in own_fields:
+                # bulk_update не вызывает pre_save, файл сохраняем сами
+                image_field.pre_save(recipe, add=False)
+            fields.update(own_fields)
+            # Теги и ингредиенты тоже меняют рецепт, даже если его полей
+            # в пакете нет
+            revisions.bump_later(recipe)
+        Recipe.objects.bulk_update(recipes, {*fields, 'revision'})
+        for recipe in recipes:
+            revisions.forget(recipe)
+        events.record_many(recipes, events.UPDATED)
+        self._save_relations(recipes, validated_data, replace=True)
+        return recipes
+
+    @staticmethod
+    def _own_fields(item):
+        return {
+            key: value for key, value in item.items()
+            if key not in ('tags', 'ingredient_amounts')
+        }
+
+    @staticmethod
+    def _save_relations(recipes, validated_data, replace):
+        """Записать теги и ингредиенты пакета: по запросу на таблицу."""
+        tag_through = Recipe.tags.through
+        with_tags = [
+            (recipe, item['tags'])
+            for recipe, item in zip(recipes, validated_data)
+            if 'tags' in item
+        ]
+        with_ingredients = [
+            (recipe, item['ingredient_amounts'])
+            for recipe, item in zip(recipes, validated_data)
+            if 'ingredient_amounts' in item
+        ]
+        if replace and with_tags:
+            tag_through.objects.filter(
+                recipe__in=[recipe for recipe, _ in with_tags]
+            ).delete()
+        if replace and with_ingredients:
+            IngredientInRecipe.objects.filter(
+                recipe__in=[recipe for recipe, _ in with_ingredients]
+            ).delete()
+        tag_through.objects.bulk_create([
+            tag_through(recipe=recipe, tag=tag)
+            for recipe, tags in with_tags
+            for tag in tags
+        ])
+        amounts = IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=ingredient['ingredient'],
+                amount=ingredient['amount']
+            )
+            for recipe, ingredients in with_ingredients
+            for ingredient in ingredients
+        ])
+        events.record_many(amounts, events.CREATED)
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Создание/обновление рецепта."""
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
         required=False,
@@ -240,7 +588,9 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'image',
             'text',
             'cooking_time',
+            'servings',
         )
+        list_serializer_class = RecipeBulkSerializer
 
     def validate_ingredients(self, value):
         if not value:
@@ -265,6 +615,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             for ing in ingredients
         ]
         IngredientInRecipe.objects.bulk_create(objs)
+        events.record_many(objs, events.CREATED)
 
     def create(self, validated_data):
         tags = validated_data.pop('tags', [])
@@ -288,6 +639,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], 'ingredient_amounts__ingredient')
         return RecipeReadSerializer(
             instance,
             context=self.context
@@ -334,7 +686,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ShoppingCart
-        fields = ('user', 'recipe')
+        fields = ('user', 'recipe', 'servings')
         validators = [
             UniqueTogetherValidator(
                 queryset=ShoppingCart.objects.all(),
@@ -351,6 +703,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
 
 
 class SubscriptionReadSerializer(serializers.ModelSerializer):
+    is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
@@ -373,5 +726,91 @@ class SubscriptionReadSerializer(serializers.ModelSerializer):
                 pass
         return RecipeShortSerializer(qs, many=True, context=self.context).data
 
+    def get_is_subscribed(self, author):
+        # Здесь всегда авторы, на которых подписан текущий пользователь
+        return True
+
     def get_recipes_count(self, author):
+        if hasattr(author, 'recipes_count'):
+            return author.recipes_count
         return author.recipes.count()
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций с избранным и покупками."""
+    recipes = BulkPrimaryKeyRelatedField(
+        many=True,
+        queryset=Recipe.objects.all(),
+        allow_empty=False,
+        max_length=BULK_MAX_ITEMS,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
+class ExportParamsSerializer(serializers.Serializer):
+    """Параметры инкрементальной выгрузки /api/export/<table>/."""
+    since = serializers.DateTimeField(required=False)
+    since_id = serializers.IntegerField(required=False, min_value=0)
+
+
+class SyncParamsSerializer(serializers.Serializer):
+    """Параметры ленты изменений /api/sync/."""
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=settings.SYNC_PAGE_MAX,
+        default=settings.SYNC_PAGE_SIZE,
+    )
+
+    def validate_cursor(self, value):
+        try:
+            return changes.decode_cursor(value)
+        except ValueError:
+            raise serializers.ValidationError('Неизвестный курсор.')
+
+
+class JWTRefreshTokenSerializer(serializers.Serializer):
+    """Проверка refresh-токена: подпись, срок и список отозванных."""
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        # simplejwt при импорте читает SECRET_KEY — только на пути JWT
+        from rest_framework_simplejwt.exceptions import (
+            InvalidToken, TokenError
+        )
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        from .jwt_tokens import is_denied
+        try:
+            token = RefreshToken(value)
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+        if is_denied(token):
+            raise InvalidToken('Токен отозван.')
+        return token
+
+
+class JWTRefreshSerializer(JWTRefreshTokenSerializer):
+    """
+    Обмен refresh-токена на новую пару. Пользователь перечитывается из
+    БД, чтобы claims нового access-токена были свежими; старый
+    refresh-токен отзывается.
+    """
+    def validate(self, attrs):
+        from rest_framework_simplejwt.exceptions import InvalidToken
+        from rest_framework_simplejwt.settings import (
+            api_settings as jwt_settings
+        )
+
+        from .jwt_tokens import deny_token, issue_tokens
+        token = attrs['refresh']
+        user = User.objects.filter(
+            pk=token[jwt_settings.USER_ID_CLAIM], is_active=True
+        ).first()
+        if user is None:
+            raise InvalidToken('Пользователь не найден или заблокирован.')
+        deny_token(token)
+        return issue_tokens(user)
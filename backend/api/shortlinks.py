@@ -0,0 +1,178 @@
+"""
+Короткие ссылки на рецепты: /s/<code> → /recipes/<id>.
+
+Код — id рецепта в base62: get-link и редирект переводят его в id и
+обратно без записи в БД. Редирект проверяет, что рецепт есть, по
+общему кэшу SHORT_LINK_CACHE_ALIAS и идёт в БД только при промахе;
+удаление рецепта убирает код из кэша сразу для всех воркеров. Переходы
+считаются в
+памяти и раз в SHORT_LINK_FLUSH_INTERVAL секунд записываются фоновым
+потоком: строки ShortLink создаются для рецептов, на которые впервые
+перешли, и счётчики пачки обновляются одним UPDATE.
+"""
+import atexit
+import logging
+import os
+import string
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+from django.http import Http404, HttpResponseRedirect
+from django.views.decorators.http import require_safe
+
+from recipes.models import Recipe, ShortLink
+from . import events
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = string.digits + string.ascii_letters
+LINK_CACHE_KEY = 'short-link:{}'
+
+
+def encode(number):
+    """Неотрицательное число в base62."""
+    code = ''
+    while True:
+        number, digit = divmod(number, len(ALPHABET))
+        code = ALPHABET[digit] + code
+        if not number:
+            return code
+
+
+def decode(code):
+    """id рецепта по коду или None, если код не получен из encode()."""
+    number = 0
+    for char in code:
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            return None
+        number = number * len(ALPHABET) + digit
+    # «0a» и «a» — одно число, но код у рецепта один
+    return number if encode(number) == code else None
+
+
+class HitCounter:
+    """Счётчик переходов, который пишется в БД пачками."""
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = Counter()
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def add(self, code):
+        with self.lock:
+            self.pending[code] += 1
+            if self.pid != os.getpid():
+                # Первый переход в этом процессе (в том числе после fork
+                # воркера gunicorn): поток создаётся здесь, а не при импорте
+                self.pid = os.getpid()
+                threading.Thread(
+                    target=self._run, name='short-link-hits', daemon=True
+                ).start()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        if not pending:
+            return
+        try:
+            self._create_missing(pending)
+            ShortLink.objects.filter(code__in=pending).update(
+                hits=F('hits') + Case(
+                    *(
+                        When(code=code, then=Value(count))
+                        for code, count in pending.items()
+                    ),
+                    output_field=PositiveBigIntegerField(),
+                )
+            )
+        except DatabaseError:
+            # Вернём счёт в очередь до следующей попытки
+            with self.lock:
+                self.pending.update(pending)
+            raise
+
+    def _create_missing(self, pending):
+        """Строки ShortLink для рецептов, на которые перешли впервые."""
+        recipe_ids = {decode(code): code for code in pending}
+        known = ShortLink.objects.filter(
+            code__in=pending
+        ).values_list('recipe_id', flat=True)
+        missing = Recipe.objects.filter(
+            pk__in=set(recipe_ids) - set(known)
+        ).values_list('pk', flat=True)
+        ShortLink.objects.bulk_create(
+            [
+                ShortLink(recipe_id=recipe_id, code=recipe_ids[recipe_id])
+                for recipe_id in missing
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception('Failed to save short link hits')
+            finally:
+                close_old_connections()
+
+
+hits = HitCounter(settings.SHORT_LINK_FLUSH_INTERVAL)
+atexit.register(hits.flush)
+
+
+def link_cache():
+    return caches[settings.SHORT_LINK_CACHE_ALIAS]
+
+
+def get_code(recipe_id):
+    """Код существующего рецепта."""
+    if not Recipe.objects.filter(pk=recipe_id).exists():
+        raise Http404
+    return encode(recipe_id)
+
+
+def resolve(code):
+    """id рецепта по коду; есть ли рецепт — по кэшу или по БД."""
+    recipe_id = decode(code)
+    if recipe_id is None:
+        raise Http404
+    cache = link_cache()
+    cache_key = LINK_CACHE_KEY.format(code)
+    if cache.get(cache_key) is None:
+        if not Recipe.objects.filter(pk=recipe_id).exists():
+            raise Http404
+        # Срок жизни ограничивает устаревание, если удаление рецепта
+        # закоммитилось между проверкой и записью в кэш
+        cache.set(cache_key, True, settings.SHORT_LINK_CACHE_TTL)
+    return recipe_id
+
+
+@require_safe
+def redirect(request, code):
+    """GET /s/<code>: редирект на страницу рецепта."""
+    recipe_id = resolve(code)
+    hits.add(code)
+    # 302, а не 301: постоянный редирект браузер кэширует, и повторные
+    # переходы не дошли бы до счётчика
+    return HttpResponseRedirect(f'/recipes/{recipe_id}')
+
+
+def forget_deleted(batch):
+    keys = [
+        LINK_CACHE_KEY.format(encode(event.pk)) for event in batch.events
+        if event.model == 'recipes.recipe' and event.action == events.DELETED
+    ]
+    if keys:
+        link_cache().delete_many(keys)
+
+
+events.subscribe(forget_deleted, 'recipe:*')
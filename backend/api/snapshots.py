@@ -0,0 +1,44 @@
+"""
+Снимок списка ингредиентов для nginx.
+
+/api/ingredients/ без параметров отдаёт nginx из файла в STATIC_ROOT.
+Файл пишет команда compress_assets; любое изменение ингредиентов его
+удаляет, и до следующего запуска команды список снова отдаёт Django.
+"""
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient
+
+INGREDIENTS_SNAPSHOT = Path('api') / 'ingredients.json'
+
+
+def ingredients_snapshot_path():
+    return Path(settings.STATIC_ROOT) / INGREDIENTS_SNAPSHOT
+
+
+def write_ingredients_snapshot():
+    """Записать снимок; вернуть путь и число ингредиентов."""
+    # Запрос, порядок и поля — как у GET /api/ingredients/ без
+    # параметров. Модуль загружается в apps.ready, где views ещё рано
+    from .views import IngredientViewSet
+    path = ingredients_snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = IngredientViewSet.serializer_class(
+        IngredientViewSet.queryset.all(), many=True
+    ).data
+    path.write_bytes(JSONRenderer().render(data))
+    return path, len(data)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def drop_ingredients_snapshot(sender, **kwargs):
+    path = ingredients_snapshot_path()
+    for stale in (path, *(path.with_name(path.name + ext)
+                          for ext in ('.gz', '.br'))):
+        stale.unlink(missing_ok=True)
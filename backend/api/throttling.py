@@ -0,0 +1,192 @@
+"""
+Ограничение частоты дорогих запросов и контроль допуска.
+
+TokenBucketThrottle — token bucket на пользователя (анонима — на IP)
+для действий, перечисленных в throttle_scopes вьюсета; скорость задаётся
+в DEFAULT_THROTTLE_RATES в формате DRF («10/min»), столько же запросов
+разрешено подряд. Корзины хранятся в памяти процесса
+(THROTTLE_BACKEND=local) или в общем кэше Django (THROTTLE_BACKEND —
+алиас из CACHES).
+
+admission_control_middleware ограничивает число одновременно
+обрабатываемых запросов в процессе и сверх лимита отвечает 503.
+
+PasswordHashingBusyMixin отвечает 429, когда занят пул хеширования
+паролей (foodgram.hashers).
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from foodgram.hashers import PasswordHashingBusy
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+ADMISSION_POLL_INTERVAL = 0.01
+
+
+def parse_rate(rate):
+    """'10/min' -> (токенов в секунду, ёмкость корзины)."""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity / DURATIONS[period[0]], capacity
+
+
+def take_token(state, rate, capacity, now):
+    """
+    Пополнить корзину за прошедшее время и взять токен.
+
+    Возвращает новое состояние (токены, время) и сколько секунд ждать
+    до следующего токена (0 — запрос разрешён).
+    """
+    tokens, stamp = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class LocalBucketStore:
+    """Корзины в памяти процесса; давно не использованные вытесняются."""
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, capacity):
+        with self.lock:
+            state, wait = take_token(
+                self.buckets.pop(key, None), rate, capacity, time.monotonic()
+            )
+            self.buckets[key] = state
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class CacheBucketStore:
+    """
+    Корзины в кэше Django, общем для всех процессов. Чтение и запись не
+    атомарны: при одновременных запросах одного клиента лимит может быть
+    превышен на несколько запросов, что для защиты от перегрузки
+    допустимо.
+    """
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, rate, capacity):
+        key = f'throttle:{key}'
+        state, wait = take_token(
+            self.cache.get(key), rate, capacity, time.time()
+        )
+        # Полная корзина не отличается от отсутствующей
+        self.cache.set(key, state, math.ceil(capacity / rate) + 1)
+        return wait
+
+
+@lru_cache(maxsize=None)
+def bucket_store(backend):
+    if backend == 'local':
+        return LocalBucketStore()
+    return CacheBucketStore(backend)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket по действию вьюсета.
+
+    view.throttle_scopes сопоставляет действию scope; действия без scope
+    и scope без скорости в DEFAULT_THROTTLE_RATES не ограничиваются.
+    """
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scopes', {}).get(
+            getattr(view, 'action', None)
+        )
+        return self.allow(request, scope, request.user)
+
+    def allow(self, request, scope, user=None):
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if not rate:
+            return True
+        if user is not None and user.is_authenticated:
+            ident = f'user:{user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        self.wait_seconds = bucket_store(settings.THROTTLE_BACKEND).take(
+            f'{scope}:{ident}', *parse_rate(rate)
+        )
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def overloaded_response():
+    response = JsonResponse(
+        {'detail': 'Сервер перегружен, повторите запрос позже.'},
+        status=503,
+        json_dumps_params={'ensure_ascii': False},
+    )
+    response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+    return response
+
+
+@sync_and_async_middleware
+def admission_control_middleware(get_response):
+    """
+    Не брать в обработку больше ADMISSION_MAX_CONCURRENCY запросов на
+    процесс. Лишний запрос ждёт свободного места не дольше
+    ADMISSION_QUEUE_TIMEOUT секунд и затем получает 503 с Retry-After,
+    а не стоит в очереди к БД, пока та не захлебнётся. Лимит разумно
+    держать равным размеру пула соединений (DB_POOL_MAX_SIZE) или числу
+    потоков воркера.
+    """
+    slots = threading.BoundedSemaphore(settings.ADMISSION_MAX_CONCURRENCY)
+    timeout = settings.ADMISSION_QUEUE_TIMEOUT
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            # Блокирующее ожидание остановило бы event loop
+            deadline = time.monotonic() + timeout
+            while not slots.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    return overloaded_response()
+                await asyncio.sleep(ADMISSION_POLL_INTERVAL)
+            try:
+                return await get_response(request)
+            finally:
+                slots.release()
+    else:
+        def middleware(request):
+            if not slots.acquire(timeout=timeout):
+                return overloaded_response()
+            try:
+                return get_response(request)
+            finally:
+                slots.release()
+    return middleware
+
+
+class PasswordHashingBusyMixin:
+    """
+    Примесь к вьюхам, которые хешируют пароли (вход, регистрация, смена
+    пароля): PasswordHashingBusy превращается в 429 с Retry-After.
+    """
+    def handle_exception(self, exc):
+        if isinstance(exc, PasswordHashingBusy):
+            exc = Throttled(
+                wait=exc.retry_after,
+                detail='Слишком много попыток входа, повторите позже.',
+                code='password_hashing_busy',
+            )
+        return super().handle_exception(exc)
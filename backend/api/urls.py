@@ -1,11 +1,18 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from rest_framework.documentation import include_docs_urls
 
+from . import async_views
 from .views import (
+    AuthUserViewSet,
     CustomUserViewSet,
+    ExportViewSet,
     IngredientViewSet,
-    RecipeViewSet
+    JWTViewSet,
+    RecipeViewSet,
+    SyncViewSet,
+    TokenCreateView
 )
 
 app_name = 'api'
@@ -14,9 +21,56 @@ router = DefaultRouter()
 router.register(r'users', CustomUserViewSet, basename='users')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
+router.register(r'export', ExportViewSet, basename='export')
+router.register(r'sync', SyncViewSet, basename='sync')
+
+# Маршруты djoser.urls и djoser.urls.authtoken, но вьюхи отвечают 429
+# при занятом пуле хеширования паролей
+auth_router = DefaultRouter()
+auth_router.register(r'users', AuthUserViewSet)
+auth_urlpatterns = [
+    # Регистрация, просмотр, смена пароля
+    path('', include(auth_router.urls)),
+    path('token/login/', TokenCreateView.as_view(), name='login'),
+    # Выход
+    path('', include('djoser.urls.authtoken')),
+]
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('auth/', include('djoser.urls')),            # регистрация, просмотр, смена пароля
-    path('auth/', include('djoser.urls.authtoken')),  # получение токена
+    path('auth/', include(auth_urlpatterns)),
+]
+
+# Подписанные токены: /auth/jwt/create/, /auth/jwt/refresh/, /auth/jwt/logout/
+jwt_urlpatterns = [
+    path(
+        f'jwt/{action}/',
+        JWTViewSet.as_view({'post': action}),
+        name=f'jwt-{action}'
+    )
+    for action in ('create', 'refresh', 'logout')
 ]
+
+if settings.JWT_AUTH:
+    urlpatterns.append(path('auth/', include(jwt_urlpatterns)))
+
+if settings.ASYNC_READ_PATH:
+    # Под ASGI списки и детали отдаются асинхронными вьюхами;
+    # маршруты стоят раньше роутера и перекрывают его.
+    urlpatterns = [
+        path(
+            'ingredients/',
+            async_views.ingredient_list,
+            name='ingredients-list-async'
+        ),
+        path(
+            'recipes/',
+            async_views.recipe_list,
+            name='recipes-list-async'
+        ),
+        path(
+            'recipes/<int:pk>/',
+            async_views.recipe_detail,
+            name='recipes-detail-async'
+        ),
+    ] + urlpatterns
@@ -1,32 +1,109 @@
+from django.contrib.auth.signals import user_logged_in
 from django.shortcuts import get_object_or_404
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count, Exists, F, OuterRef, Prefetch, Subquery, Sum,
+    prefetch_related_objects
+)
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import (
+    AllowAny, IsAdminUser, IsAuthenticated
+)
 from rest_framework.response import Response
 
 from .permissions import IsAuthorOrReadOnly
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from djoser import views as djoser_views
+from djoser.conf import settings as djoser_settings
 
+from foodgram import revisions
+from jobs.queue import enqueue
+from recipes import nutrition, units
 from users.models import User, Subscription
 from recipes.models import (
     Ingredient, Recipe,
     IngredientInRecipe, Favorite, ShoppingCart
 )
+from sync import changes
+from sync.models import Change
 from .serializers import (
     UserReadSerializer, UserCreateSerializer, SubscriptionSerializer,
     IngredientSerializer, SubscriptionReadSerializer,
     RecipeReadSerializer, RecipeWriteSerializer, RecipeShortSerializer,
-    FavoriteSerializer, ShoppingCartSerializer, AvatarSerializer
+    FavoriteSerializer, ShoppingCartSerializer, AvatarSerializer,
+    RecipeIdsSerializer, JWTRefreshSerializer, JWTRefreshTokenSerializer,
+    ExportParamsSerializer, SyncParamsSerializer, bulk_create_with_pks
 )
+from . import export, shortlinks
+from .conditional import ConditionalMixin, viewer_revision
+from .fieldsets import SparseFieldsetMixin
+from .constants import BULK_MAX_ITEMS
 from .filters import RecipeFilter, IngredientFilter
 from .pagination import CustomPagination
+from .profiling import ProfilingMixin
+from .query_budget import QueryBudgetMixin
+from .replicas import ReplicaReadMixin
+from .throttling import PasswordHashingBusyMixin
+
+
+# Столбцы пользователя, которые выводит UserReadSerializer
+USER_READ_COLUMNS = ('username', 'first_name', 'last_name', 'email', 'avatar')
+# То же для рецепта в RecipeReadSerializer
+RECIPE_READ_COLUMNS = ('name', 'image', 'text', 'cooking_time', 'servings')
+
+
+def recipe_read_queryset(queryset, user, wants):
+    """
+    Рецепты для RecipeReadSerializer: столбцы, prefetch и аннотации
+    только для полей, которые попадут в ответ (wants — см.
+    SparseFieldsetMixin.wants).
+    """
+    columns = ['id', *(
+        column for column in RECIPE_READ_COLUMNS if wants(column)
+    )]
+    if wants('author'):
+        queryset = queryset.select_related('author')
+        columns += ['author', *(
+            f'author__{column}' for column in USER_READ_COLUMNS
+            if wants('author', column)
+        )]
+        if user.is_authenticated and wants('author', 'is_subscribed'):
+            queryset = queryset.annotate(author_is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef('author')
+                )
+            ))
+    if wants('ingredients'):
+        queryset = queryset.prefetch_related(Prefetch(
+            'ingredient_amounts',
+            queryset=IngredientInRecipe.objects.select_related('ingredient'),
+        ))
+    if wants('tags', expandable=True):
+        queryset = queryset.prefetch_related('tags')
+    if user.is_authenticated:
+        for flag, model in (
+            ('is_favorited', Favorite),
+            ('is_in_shopping_cart', ShoppingCart),
+        ):
+            if wants(flag):
+                queryset = queryset.annotate(**{flag: Exists(
+                    model.objects.filter(user=user, recipe=OuterRef('pk'))
+                )})
+    return queryset.only(*columns)
 
 
 class CustomUserViewSet(
+    ProfilingMixin,
+    PasswordHashingBusyMixin,
+    QueryBudgetMixin,
+    SparseFieldsetMixin,
+    ConditionalMixin,
+    ReplicaReadMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
@@ -34,6 +111,17 @@ class CustomUserViewSet(
 ):
     queryset = User.objects.all()
     pagination_class = CustomPagination
+    throttle_scopes = {
+        'create': 'user_create',
+        'avatar': 'avatar',
+        'set_password': 'set_password',
+    }
+    query_budgets = {
+        'list': 4,
+        'retrieve': 4,
+        'me': 4,
+        'subscriptions': 6,
+    }
 
     def get_permissions(self):
         if self.action == 'create':
@@ -47,6 +135,30 @@ class CustomUserViewSet(
             return UserCreateSerializer
         return UserReadSerializer
 
+    def get_queryset(self):
+        """Для чтения — только то, что запрошено в ?fields=/?expand=."""
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        user = self.request.user
+        if user.is_authenticated and self.wants('is_subscribed'):
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        if self.wants('recipes_count', expandable=True):
+            # С GROUP BY Django не применяет Meta.ordering, задаём явно
+            queryset = queryset.annotate(
+                recipes_count=Count('recipes')
+            ).order_by(*User._meta.ordering)
+        return queryset.only('id', *(
+            column for column in USER_READ_COLUMNS if self.wants(column)
+        ))
+
+    def get_version_stamp(self, pk, lock=False):
+        return User.objects.filter(pk=pk).values_list(
+            'revision', viewer_revision(self.request.user)
+        ).first()
+
     @action(
         detail=False,
         methods=('get',),
@@ -54,11 +166,14 @@ class CustomUserViewSet(
     )
     def me(self, request):
         """Вернуть свой профиль."""
-        serializer = UserReadSerializer(
-            request.user,
-            context={'request': request}
+        # request.user — снимок из кэша токенов или claims JWT и может
+        # отставать от ревизии в ETag: тело читается из БД
+        return self.conditional_get(
+            lambda: Response(self.get_serializer(
+                User.objects.get(pk=request.user.pk)
+            ).data),
+            pk=request.user.pk,
         )
-        return Response(serializer.data)
 
     @action(
         detail=False,
@@ -98,7 +213,7 @@ class CustomUserViewSet(
             )
 
         user.set_password(new)
-        user.save()
+        user.save(update_fields=('password',))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -138,8 +253,29 @@ class CustomUserViewSet(
     )
     def subscriptions(self, request):
         """Список подписок текущего пользователя."""
-        authors_qs = User.objects.filter(subscribers__user=request.user)
+        # С GROUP BY Django не применяет Meta.ordering, задаём явно
+        authors_qs = User.objects.filter(
+            subscribers__user=request.user
+        ).annotate(
+            recipes_count=Count('recipes')
+        ).order_by(*User._meta.ordering)
         page = self.paginate_queryset(authors_qs)
+        # Рецепты всех авторов страницы одним запросом, не больше
+        # recipes_limit последних у каждого
+        recipes = Recipe.objects.only(
+            'id', 'author', 'name', 'image', 'cooking_time'
+        )
+        limit = request.query_params.get('recipes_limit', '')
+        if limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:int(limit)]
+            ))
+        prefetch_related_objects(
+            page if page is not None else authors_qs,
+            Prefetch('recipes', queryset=recipes),
+        )
         serializer = SubscriptionReadSerializer(
             page or authors_qs,
             many=True,
@@ -178,7 +314,9 @@ class CustomUserViewSet(
         )
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    QueryBudgetMixin, ReplicaReadMixin, viewsets.ReadOnlyModelViewSet
+):
     """Эндпоинт /api/ingredients/."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -186,21 +324,67 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
     permission_classes = (AllowAny,)
+    throttle_scopes = {'list': 'ingredients'}
+    query_budgets = {'list': 2, 'retrieve': 2}
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ProfilingMixin,
+    QueryBudgetMixin,
+    SparseFieldsetMixin,
+    ConditionalMixin,
+    ReplicaReadMixin,
+    viewsets.ModelViewSet,
+):
     """Эндпоинт /api/recipes/."""
     queryset = Recipe.objects.all()
+    replica_actions = (
+        'list', 'retrieve', 'download_shopping_cart', 'get_link',
+        'nutrition',
+    )
+    throttle_scopes = {
+        'create': 'recipe_write',
+        'update': 'recipe_write',
+        'partial_update': 'recipe_write',
+        'bulk': 'recipe_bulk',
+        'download_shopping_cart': 'shopping_cart_download',
+    }
+    query_budgets = {
+        'list': 6,
+        'retrieve': 5,
+        'download_shopping_cart': 3,
+        'nutrition': 3,
+        'shopping_cart_nutrition': 3,
+        'get_link': 4,
+    }
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = CustomPagination
     permission_classes = (IsAuthorOrReadOnly,)
 
     def get_permissions(self):
-        if self.action in ('list', 'retrieve', 'get_link'):
+        if self.action in ('list', 'retrieve', 'get_link', 'nutrition'):
             return [AllowAny()]
+        if self.action in (
+            'download_shopping_cart', 'shopping_cart_nutrition'
+        ):
+            return [IsAuthenticated()]
         return [IsAuthorOrReadOnly()]
 
+    def get_queryset(self):
+        """
+        Для чтения — только запрошенные в ?fields=/?expand= столбцы,
+        prefetch и флаги пользователя (аннотации Exists вместо запроса
+        на каждый рецепт).
+        """
+        queryset = super().get_queryset()
+        if self.action == 'nutrition':
+            # Итог кэшируется по ревизии, остальное не нужно
+            return queryset.only('id', 'revision')
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        return recipe_read_queryset(queryset, self.request.user, self.wants)
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
@@ -237,15 +421,22 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(
         detail=True,
-        methods=('post', 'delete'),
+        methods=('post', 'patch', 'delete'),
         permission_classes=(IsAuthenticated,),
     )
     def shopping_cart(self, request, pk=None):
-        """Добавить/удалить рецепт в/из списка покупок."""
+        """
+        Добавить/удалить рецепт в/из списка покупок. POST и PATCH
+        принимают {"servings": n} — на сколько порций покупать.
+        """
         recipe = get_object_or_404(Recipe, pk=pk)
         if request.method == 'POST':
             serializer = ShoppingCartSerializer(
-                data={'user': request.user.id, 'recipe': recipe.id},
+                data={
+                    'user': request.user.id,
+                    'recipe': recipe.id,
+                    'servings': request.data.get('servings'),
+                },
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
@@ -257,30 +448,191 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 ).data,
                 status=status.HTTP_201_CREATED
             )
+        if request.method == 'PATCH':
+            serializer = ShoppingCartSerializer(
+                get_object_or_404(
+                    request.user.shopping_cart, recipe=recipe
+                ),
+                data={'servings': request.data.get('servings')},
+                partial=True,
+                context={'request': request}
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(
+                RecipeShortSerializer(
+                    recipe,
+                    context={'request': request}
+                ).data
+            )
         request.user.shopping_cart.filter(
             recipe=recipe
         ).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=('post', 'patch'),
+        permission_classes=(IsAuthenticated,),
+        url_path='bulk',
+    )
+    def bulk(self, request):
+        """
+        Пакетно создать (POST) или обновить (PATCH) рецепты.
+
+        Тело — список рецептов; при обновлении в каждом элементе есть id.
+        Пакет проверяется целиком и записывается одной транзакцией.
+        """
+        if request.method == 'POST':
+            serializer = self.get_serializer(
+                data=request.data,
+                many=True,
+                max_length=BULK_MAX_ITEMS,
+            )
+            response_status = status.HTTP_201_CREATED
+        else:
+            serializer = self.get_serializer(
+                request.user.recipes.all(),
+                data=request.data,
+                many=True,
+                partial=True,
+                max_length=BULK_MAX_ITEMS,
+            )
+            response_status = status.HTTP_200_OK
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            recipes = serializer.save()
+            self._enqueue_renditions(recipes)
+        return Response(
+            RecipeShortSerializer(
+                recipes,
+                many=True,
+                context={'request': request}
+            ).data,
+            status=response_status
+        )
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='bulk/favorite',
+    )
+    def bulk_favorite(self, request):
+        """Пакетно добавить/удалить рецепты в/из избранного."""
+        return self._bulk_user_recipes(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated,),
+        url_path='bulk/shopping_cart',
+    )
+    def bulk_shopping_cart(self, request):
+        """Пакетно добавить/удалить рецепты в/из списка покупок."""
+        return self._bulk_user_recipes(request, ShoppingCart)
+
+    def _bulk_user_recipes(self, request, model):
+        """
+        Общая часть пакетных операций с избранным и списком покупок.
+
+        Возвращает статус по каждому рецепту: created/exists при
+        добавлении и deleted/missing при удалении.
+        """
+        serializer = RecipeIdsSerializer(
+            data=request.data,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        user = request.user
+        with transaction.atomic():
+            if request.method == 'POST':
+                existing = self._bulk_add(model, user, recipes)
+                statuses = ('exists', 'created')
+            else:
+                existing = set(
+                    model.objects.filter(
+                        user=user, recipe__in=recipes
+                    ).values_list('recipe_id', flat=True)
+                )
+                model.objects.filter(
+                    user=user, recipe_id__in=existing
+                ).delete()
+                statuses = ('deleted', 'missing')
+        return Response(
+            [
+                {
+                    'id': recipe.id,
+                    'status': statuses[recipe.id not in existing],
+                }
+                for recipe in recipes
+            ],
+            status=status.HTTP_200_OK
+        )
+
+    @staticmethod
+    def _bulk_add(model, user, recipes):
+        """
+        Добавить пользователю рецепты, которых у него ещё нет; вернуть
+        id тех, что уже были.
+
+        Без ignore_conflicts: с ним bulk_create возвращает все объекты,
+        включая не вставленные, и в журнал изменений попали бы лишние
+        события. Строки, которые успел вставить параллельный запрос,
+        перечитываются, и вставка повторяется.
+        """
+        for attempt in range(2):
+            existing = set(
+                model.objects.filter(
+                    user=user, recipe__in=recipes
+                ).values_list('recipe_id', flat=True)
+            )
+            try:
+                with transaction.atomic():
+                    created = bulk_create_with_pks(model, [
+                        model(user=user, recipe=recipe)
+                        for recipe in recipes
+                        if recipe.id not in existing
+                    ])
+            except IntegrityError:
+                if attempt:
+                    raise
+                continue
+            if created:
+                # bulk_create не шлёт сигналов, см. api.conditional
+                revisions.bump(User, [user.pk])
+            return existing
+
     @action(
         detail=False,
         methods=('get',),
         permission_classes=(IsAuthenticated,),
     )
     def download_shopping_cart(self, request):
-        """Скачать файл со списком покупок."""
-        user = request.user
+        """
+        Скачать файл со списком покупок. Количества масштабируются на
+        порции в списке и складываются одним запросом в базовых
+        единицах (см. recipes.units).
+        """
+        # Название ингредиента уникально, так что группа — один
+        # ингредиент; базовая единица нужна для вывода («2,5 кг»)
+        unit = 'ingredient__measurement_unit'
+        scaled = F('amount') * ShoppingCart.multiplier(
+            cart='recipe__in_shopping_cart__', recipe='recipe__'
+        )
         ingredients = IngredientInRecipe.objects.filter(
-            recipe__in_shopping_cart__user=user
+            recipe__in_shopping_cart__user=request.user
         ).values(
             name=F('ingredient__name'),
-            measurement_unit=F('ingredient__measurement_unit')
-        ).annotate(amount=Sum('amount'))
+            measurement_unit=units.canonical_unit(unit),
+        ).annotate(
+            amount=Sum(units.canonical_amount(unit, scaled))
+        ).order_by('name')
 
         lines = [
             f'{item["name"]} — '
-            f'{item["amount"]} '
-            f'{item["measurement_unit"]}'
+            f'{units.format_amount(item["amount"], item["measurement_unit"])}'
             for item in ingredients
         ]
         content = 'Список покупок:\n\n' + '\n'.join(lines)
@@ -293,6 +645,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return response
 
+    @action(
+        detail=True,
+        methods=('get',),
+        permission_classes=(AllowAny,),
+    )
+    def nutrition(self, request, pk=None):
+        """Пищевая ценность и стоимость рецепта (см. recipes.nutrition)."""
+        recipe = self.get_object()
+        return Response(nutrition.recipe_totals([recipe])[recipe.pk])
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart_nutrition(self, request):
+        """
+        Пищевая ценность и стоимость всего списка покупок с учётом
+        порций: итоги рецептов из кэша, умноженные на множитель.
+        """
+        recipes = list(Recipe.objects.filter(
+            in_shopping_cart__user=request.user
+        ).annotate(
+            multiplier=ShoppingCart.multiplier(
+                cart='in_shopping_cart__', recipe=''
+            )
+        ).only('id', 'revision'))
+        totals = nutrition.recipe_totals(recipes)
+        return Response({
+            **nutrition.combine(
+                (totals[recipe.pk], recipe.multiplier) for recipe in recipes
+            ),
+            'recipes': len(recipes),
+        })
+
     @action(
         detail=True,
         methods=('get',),
@@ -300,13 +687,70 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path='get-link',
     )
     def get_link(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        link = request.build_absolute_uri()
+        """Короткая ссылка /s/<code> без загрузки рецепта."""
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise Http404
+        if recipe_id < 0:
+            raise Http404
+        link = request.build_absolute_uri(
+            reverse('short-link', args=(shortlinks.get_code(recipe_id),))
+        )
         return Response(
             {'short-link': link},
             status=status.HTTP_200_OK
         )
 
+    def get_version_stamp(self, pk, lock=False):
+        recipes = Recipe.objects.filter(pk=pk)
+        if lock:
+            recipes = recipes.select_for_update(of=('self',))
+        return recipes.values_list(
+            'revision',
+            'author__revision',
+            viewer_revision(self.request.user),
+        ).first()
+
+    def update(self, request, *args, **kwargs):
+        """PUT/PATCH с If-Match: правка только актуальной версии."""
+        with transaction.atomic():
+            # Сначала права: чужому рецепту — 403, а не 412
+            self.get_object()
+            self.check_if_match()
+            response = super().update(request, *args, **kwargs)
+        return self.with_etag(response, self.get_etag())
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            self.get_object()
+            self.check_if_match()
+            return super().destroy(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            recipe = serializer.save()
+            self._enqueue_renditions([recipe])
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            recipe = serializer.save()
+            if 'image' in serializer.validated_data:
+                self._enqueue_renditions([recipe])
+
+    @staticmethod
+    def _enqueue_renditions(recipes):
+        """
+        Поставить подготовку превью в очередь в транзакции записи
+        рецепта: задача появится, только если рецепт сохранён.
+        """
+        for name in {recipe.image.name for recipe in recipes if recipe.image}:
+            enqueue(
+                'recipes.image_renditions',
+                {'image': name},
+                dedupe_key=f'renditions:{name}',
+            )
+
     def partial_update(self, request, *args, **kwargs):
         if 'ingredients' not in request.data:
             return Response(
@@ -314,3 +758,178 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         return super().partial_update(request, *args, **kwargs)
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    Выгрузка каталога /api/export/<table>/ для аналитики (см. api.export).
+
+    Формат — ?format=parquet|arrow|ndjson|csv или заголовок Accept;
+    инкрементально — ?since_id= и ?since=.
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = export.RENDERERS
+    lookup_value_regex = '[a-z_]+'
+    throttle_scopes = {'retrieve': 'export'}
+
+    def retrieve(self, request, pk=None):
+        table = export.TABLES.get(pk)
+        if table is None:
+            raise Http404
+        params = ExportParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            export.stream(table, renderer.format, **params.validated_data),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{pk}.{renderer.format}"'
+        )
+        return response
+
+
+class SyncViewSet(
+    QueryBudgetMixin, SparseFieldsetMixin, viewsets.GenericViewSet
+):
+    """
+    Лента изменений для офлайн-клиентов /api/sync/?cursor= (см.
+    sync.changes).
+
+    Без курсора возвращает курсор текущего конца журнала: клиент
+    берёт его до полной загрузки и дальше получает только изменения.
+    Изменённые рецепты приходят вместе с данными (?fields=/?expand=
+    как у /api/recipes/), удалённые — записью с action=deleted.
+    """
+    permission_classes = (AllowAny,)
+    pagination_class = None
+    throttle_scopes = {'list': 'sync'}
+    query_budgets = {'list': 6}
+
+    def list(self, request):
+        params = SyncParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        after = params.validated_data.get('cursor')
+        if after is None:
+            return Response({
+                'changes': [],
+                'cursor': changes.encode_cursor(changes.head()),
+                'has_more': False,
+            })
+        if changes.is_pruned(after):
+            return Response(
+                {
+                    'detail': 'Курсор старше журнала изменений, '
+                              'нужна полная загрузка.',
+                    'cursor': changes.encode_cursor(changes.head()),
+                },
+                status=status.HTTP_410_GONE,
+            )
+        page, has_more = changes.changes_since(
+            request.user, after, params.validated_data['limit']
+        )
+        latest = changes.coalesce(page)
+        recipes = recipe_read_queryset(
+            Recipe.objects.all(), request.user, self.wants
+        ).in_bulk([
+            change.object_id for change in latest
+            if change.kind == Change.RECIPE and change.action != Change.DELETED
+        ])
+        items = []
+        for change in latest:
+            item = {
+                'type': change.kind,
+                'id': change.object_id,
+                'action': change.action,
+            }
+            if (
+                change.kind == Change.RECIPE
+                and change.action != Change.DELETED
+            ):
+                recipe = recipes.get(change.object_id)
+                if recipe is None:
+                    # Удалён после этой записи: удаление ещё впереди
+                    item['action'] = Change.DELETED
+                else:
+                    item['data'] = RecipeReadSerializer(
+                        recipe, context=self.get_serializer_context()
+                    ).data
+            items.append(item)
+        return Response({
+            'changes': items,
+            'cursor': changes.encode_cursor(page[-1].seq if page else after),
+            'has_more': has_more,
+        })
+
+
+class JWTViewSet(PasswordHashingBusyMixin, viewsets.GenericViewSet):
+    """
+    Вход по подписанным токенам (JWT_AUTH=True).
+
+    Учётные данные те же, что у /auth/token/login/, и проверяет их
+    сериализатор djoser; в ответ выдаётся пара access/refresh. simplejwt
+    и api.jwt_tokens импортируются в методах: при импорте simplejwt
+    читает SECRET_KEY, а маршруты JWT подключаются только при JWT_AUTH.
+    """
+    permission_classes = (AllowAny,)
+    # Просроченный access-токен в заголовке не должен мешать
+    # получить новый.
+    authentication_classes = ()
+
+    def get_authenticate_header(self, request):
+        # Иначе DRF превращает 401 от недействительного токена в 403
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        return JWTAuthentication().authenticate_header(request)
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return djoser_settings.SERIALIZERS.token_create
+        if self.action == 'refresh':
+            return JWTRefreshSerializer
+        return JWTRefreshTokenSerializer
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.user
+        user_logged_in.send(sender=user.__class__, request=request, user=user)
+        from .jwt_tokens import issue_tokens
+        return Response(issue_tokens(user), status=status.HTTP_200_OK)
+
+    def refresh(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+    def logout(self, request):
+        """Отозвать refresh-токен и access-токен из заголовка, если он есть."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        from rest_framework_simplejwt.exceptions import TokenError
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from .jwt_tokens import deny_token
+        deny_token(serializer.validated_data['refresh'])
+        authenticator = JWTAuthentication()
+        header = authenticator.get_header(request)
+        raw_token = header and authenticator.get_raw_token(header)
+        if raw_token:
+            try:
+                deny_token(AccessToken(raw_token))
+            except TokenError:
+                pass
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TokenCreateView(
+    PasswordHashingBusyMixin, djoser_views.TokenCreateView
+):
+    """/auth/token/login/ djoser."""
+
+
+class AuthUserViewSet(PasswordHashingBusyMixin, djoser_views.UserViewSet):
+    """/auth/users/ djoser: регистрация, смена и сброс пароля."""
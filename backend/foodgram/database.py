@@ -0,0 +1,199 @@
+"""
+Настройки базы данных из переменных окружения.
+
+По умолчанию — SQLite, как и раньше. Для PostgreSQL (docker-compose)
+задаётся DB_ENGINE=postgresql и стандартные переменные POSTGRES_*.
+"""
+import logging
+import os
+import time
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+}
+POOLED_POSTGRESQL_ENGINE = 'foodgram.pooled_postgresql'
+# CONN_HEALTH_CHECKS поддерживается самим Django начиная с 4.1, для
+# более старых версий — бэкенд с HealthCheckMixin
+NATIVE_HEALTH_CHECKS = django.VERSION >= (4, 1)
+HEALTH_CHECKED_POSTGRESQL_ENGINE = 'foodgram.postgresql'
+
+
+def env_bool(name, default=False):
+    return os.getenv(name, str(default)) == 'True'
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(f'{name} должно быть целым числом.')
+
+
+def database_from_env(base_dir, prefix='DB'):
+    """
+    Собрать словарь настроек одной БД из переменных окружения.
+
+    DB_ENGINE                 sqlite (по умолчанию) или postgresql
+    DB_NAME                   имя файла SQLite (db.sqlite3)
+    POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, DB_HOST, DB_PORT
+    DB_CONN_MAX_AGE           время жизни постоянного соединения, сек.
+    DB_CONN_HEALTH_CHECKS     проверять соединение перед запросом
+    DB_POOL                   пул соединений внутри процесса (PostgreSQL)
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT
+    DB_STATEMENT_TIMEOUT_MS   statement_timeout для PostgreSQL, 0 — нет
+
+    prefix позволяет описать ещё одну БД теми же переменными
+    (например, REPLICA_ENGINE, REPLICA_HOST).
+    """
+    def env(name, default=None):
+        return os.getenv(f'{prefix}_{name}', default)
+
+    engine = env('ENGINE', 'sqlite')
+    if engine not in ENGINES:
+        raise ImproperlyConfigured(
+            f'{prefix}_ENGINE: ожидается одно из {", ".join(ENGINES)}.'
+        )
+    if engine == 'sqlite':
+        return {
+            'ENGINE': ENGINES['sqlite'],
+            'NAME': base_dir / env('NAME', 'db.sqlite3'),
+            'CONN_MAX_AGE': env_int(f'{prefix}_CONN_MAX_AGE', 0),
+        }
+
+    pool = env_bool(f'{prefix}_POOL')
+    if pool:
+        backend = POOLED_POSTGRESQL_ENGINE
+    elif NATIVE_HEALTH_CHECKS:
+        backend = ENGINES[engine]
+    else:
+        backend = HEALTH_CHECKED_POSTGRESQL_ENGINE
+    options = {}
+    statement_timeout = env_int(f'{prefix}_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout:
+        options['options'] = f'-c statement_timeout={statement_timeout}'
+    config = {
+        'ENGINE': backend,
+        'NAME': env('NAME') or os.getenv('POSTGRES_DB', 'postgres'),
+        'USER': env('USER') or os.getenv('POSTGRES_USER', 'postgres'),
+        'PASSWORD': env('PASSWORD') or os.getenv('POSTGRES_PASSWORD', ''),
+        'HOST': env('HOST', 'db'),
+        'PORT': env('PORT', '5432'),
+        # С пулом соединение возвращается в пул после каждого запроса,
+        # без пула — живёт CONN_MAX_AGE секунд в своём потоке.
+        'CONN_MAX_AGE': 0 if pool else env_int(f'{prefix}_CONN_MAX_AGE', 60),
+        'CONN_HEALTH_CHECKS': env_bool(f'{prefix}_CONN_HEALTH_CHECKS', True),
+        'OPTIONS': options,
+    }
+    if pool:
+        config['POOL'] = {
+            'min_size': env_int(f'{prefix}_POOL_MIN_SIZE', 1),
+            'max_size': env_int(f'{prefix}_POOL_MAX_SIZE', 10),
+            'timeout': env_int(f'{prefix}_POOL_TIMEOUT', 10),
+        }
+    return config
+
+
+def replicas_from_env(base_dir):
+    """
+    Настройки реплик для чтения.
+
+    DB_REPLICAS — список префиксов через запятую, например REPLICA1,REPLICA2.
+    Каждая реплика описывается теми же переменными, что и основная БД,
+    но со своим префиксом: REPLICA1_ENGINE, REPLICA1_HOST, REPLICA1_NAME...
+    В тестах реплики «зеркалят» default.
+    """
+    replicas = {}
+    for prefix in os.getenv('DB_REPLICAS', '').split(','):
+        prefix = prefix.strip()
+        if not prefix:
+            continue
+        config = database_from_env(base_dir, prefix=prefix)
+        config['TEST'] = {'MIRROR': DEFAULT_DB_ALIAS}
+        replicas[prefix.lower()] = config
+    return replicas
+
+
+class HealthCheckMixin:
+    """
+    CONN_HEALTH_CHECKS для Django < 4.1, с той же семантикой, что в 4.1.
+
+    Постоянное соединение, пережившее запрос, проверяется is_usable()
+    один раз — перед первым курсором следующего запроса, в котором оно
+    понадобилось; новое соединение и соединения, не нужные запросу, не
+    проверяются. Без проверки первый запрос после перезапуска
+    PostgreSQL падает на разорванном соединении.
+    """
+    health_check_done = True
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        # Вызывается Django в начале и в конце каждого запроса
+        super().close_if_unusable_or_obsolete()
+        if self.connection is not None:
+            self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (
+            self.connection is None
+            or self.health_check_done
+            or not self.settings_dict.get('CONN_HEALTH_CHECKS')
+        ):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+
+class ConnectionSetupMiddleware:
+    """
+    Замер накладных расходов на установку соединения с БД.
+
+    Соединение с default открывается явно до обработки запроса,
+    результат пишется в заголовок X-DB-Connect: «reused; 0.01ms» для
+    постоянного/пулового соединения и «new; 3.20ms» для нового.
+    Включается переменной DB_CONNECTION_STATS=True.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.requests = 0
+        self.new_connections = 0
+        self.connect_time_ms = 0.0
+
+    def __call__(self, request):
+        connection = connections[DEFAULT_DB_ALIAS]
+        reused = connection.connection is not None
+        started = time.perf_counter()
+        connection.ensure_connection()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        response = self.get_response(request)
+
+        self.requests += 1
+        if not reused:
+            self.new_connections += 1
+            self.connect_time_ms += elapsed_ms
+        response['X-DB-Connect'] = (
+            f'{"reused" if reused else "new"}; {elapsed_ms:.2f}ms'
+        )
+        logger.debug(
+            'DB connect: %s in %.2fms (%d new of %d requests, %.1fms total)',
+            'reused' if reused else 'new', elapsed_ms,
+            self.new_connections, self.requests, self.connect_time_ms
+        )
+        return response
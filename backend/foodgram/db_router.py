@@ -0,0 +1,50 @@
+"""
+Маршрутизация чтения на реплики.
+
+По умолчанию всё читается и пишется в default. Чтение уходит на реплику
+только внутри use_replica(): его включает api.replicas.ReplicaReadMixin
+для безопасных запросов выбранных вьюсетов. Реплика выбирается одна на
+весь запрос, чтобы count() пагинации и страница читались из одной БД.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Модели этих приложений можно читать с реплики; служебные таблицы
+# (кэш в БД, сессии, токены) всегда читаются с основной БД.
+REPLICA_APP_LABELS = ('recipes', 'users')
+
+_replica = ContextVar('replica', default=None)
+
+
+def use_replica():
+    """Читать модели проекта с одной из реплик; вернуть токен для сброса."""
+    alias = (
+        random.choice(settings.DATABASE_REPLICAS)
+        if settings.DATABASE_REPLICAS else None
+    )
+    return _replica.set(alias)
+
+
+def reset_replica(token):
+    _replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias and model._meta.app_label in REPLICA_APP_LABELS:
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
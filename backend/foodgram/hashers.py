@@ -0,0 +1,111 @@
+"""
+Хешеры паролей с параметрами из настроек и вынесением в пул процессов.
+
+Хеширование и проверка пароля — самая дорогая по CPU операция API.
+Чтобы всплеск входов не занимал все потоки воркера, вычисление идёт в
+небольшом пуле процессов (PASSWORD_HASH_WORKERS), а число ожидающих
+операций ограничено (PASSWORD_HASH_QUEUE): сверх лимита хешер сразу
+выбрасывает PasswordHashingBusy, а не ждёт в очереди; вьюхи API
+отвечают на него 429 (api.throttling.PasswordHashingBusyMixin).
+Процессы пула запускаются через spawn: fork многопоточного воркера
+копирует и чужие захваченные блокировки. Имена алгоритмов совпадают со
+встроенными хешерами Django, поэтому сохранённые хеши совместимы, а
+смена параметров приводит к перехешированию при следующем входе.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = None
+# Внутри процесса пула вычисления выполняются на месте
+_in_worker = False
+
+
+class PasswordHashingBusy(Exception):
+    """Очередь пула заполнена; повторить через retry_after секунд."""
+    def __init__(self, retry_after):
+        super().__init__(
+            f'Password hashing queue is full, retry in {retry_after}s'
+        )
+        self.retry_after = retry_after
+
+
+def _mark_worker():
+    global _in_worker
+    _in_worker = True
+
+
+def _get_executor():
+    global _executor, _executor_pid, _slots
+    with _executor_lock:
+        # Пул, унаследованный при fork, в дочернем процессе не работает
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_mark_worker,
+            )
+            _executor_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_QUEUE)
+        return _executor, _slots
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def offload(func, *args):
+    """Выполнить func в пуле хеширования или отказать PasswordHashingBusy."""
+    if _in_worker or not settings.PASSWORD_HASH_WORKERS:
+        return func(*args)
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        raise PasswordHashingBusy(settings.PASSWORD_HASH_RETRY_AFTER)
+    try:
+        return executor.submit(func, *args).result()
+    except BrokenProcessPool:
+        _reset_executor()
+        return func(*args)
+    finally:
+        slots.release()
+
+
+class OffloadedHasherMixin:
+    def encode(self, password, salt, *args):
+        return offload(super().encode, password, salt, *args)
+
+    def verify(self, password, encoded):
+        return offload(super().verify, password, encoded)
+
+
+class PBKDF2PasswordHasher(
+    OffloadedHasherMixin, hashers.PBKDF2PasswordHasher
+):
+    def __init__(self):
+        self.iterations = settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class Argon2PasswordHasher(
+    OffloadedHasherMixin, hashers.Argon2PasswordHasher
+):
+    def __init__(self):
+        self.time_cost = settings.PASSWORD_ARGON2_TIME_COST
+        self.memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+        self.parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class BCryptSHA256PasswordHasher(
+    OffloadedHasherMixin, hashers.BCryptSHA256PasswordHasher
+):
+    def __init__(self):
+        self.rounds = settings.PASSWORD_BCRYPT_ROUNDS
@@ -0,0 +1,128 @@
+"""
+PostgreSQL-бэкенд с пулом соединений внутри процесса.
+
+Django 3.2 не умеет пул «из коробки» (он появился только в 5.1),
+поэтому соединения берутся из psycopg2 ThreadedConnectionPool и
+возвращаются в него вместо закрытия. Параметры пула — ключ POOL
+в настройках БД (см. foodgram.database).
+
+При CONN_HEALTH_CHECKS соединение из пула перед выдачей проверяется
+запросом SELECT 1: после перезапуска PostgreSQL или таймаута простоя
+в пуле лежат разорванные соединения. Разорванные и те, на которых
+были ошибки БД, в пул не возвращаются, а закрываются.
+"""
+import os
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions, extras
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+Database = base.Database
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """Пул, который ждёт освободившееся соединение, а не падает сразу."""
+    def __init__(self, minconn, maxconn, timeout, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise PoolError(
+                f'Нет свободных соединений в пуле за {self._timeout} с.'
+            )
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Пулы общие для всех потоков процесса; pid в ключе защищает
+    # от использования соединений родителя после fork().
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def _pool_key(self):
+        return os.getpid(), self.alias
+
+    def _get_pool(self, conn_params):
+        key = self._pool_key()
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                options = self.settings_dict.get('POOL', {})
+                pool = BlockingConnectionPool(
+                    options.get('min_size', 1),
+                    options.get('max_size', 10),
+                    options.get('timeout', 10),
+                    **conn_params
+                )
+                self._pools[key] = pool
+        return pool
+
+    @staticmethod
+    def _alive(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.status != extensions.STATUS_READY:
+                connection.rollback()
+        except Database.Error:
+            return False
+        return True
+
+    def _checkout(self, pool):
+        """Соединение из пула; разорванные закрываются и заменяются."""
+        if not self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            return pool.getconn()
+        # Мёртвыми могут оказаться все простаивающие соединения пула
+        for _ in range(pool.maxconn):
+            connection = pool.getconn()
+            if self._alive(connection):
+                return connection
+            pool.putconn(connection, close=True)
+        return pool.getconn()
+
+    def get_new_connection(self, conn_params):
+        connection = self._checkout(self._get_pool(conn_params))
+        # То же, что делает базовый бэкенд для нового соединения.
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = self._pools.get(self._pool_key())
+        if pool is None:
+            return super()._close()
+        connection = self.connection
+        # После ошибки БД соединение могло остаться в неизвестном
+        # состоянии: следующему запросу оно не достанется
+        broken = bool(connection.closed) or self.errors_occurred
+        with self.wrap_database_errors:
+            if not broken and connection.status != extensions.STATUS_READY:
+                try:
+                    connection.rollback()
+                except Database.Error:
+                    broken = True
+            pool.putconn(connection, close=broken)
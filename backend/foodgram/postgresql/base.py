@@ -0,0 +1,13 @@
+"""
+PostgreSQL-бэкенд с CONN_HEALTH_CHECKS для Django < 4.1.
+
+Используется вместо django.db.backends.postgresql, если пул выключен
+(см. foodgram.database).
+"""
+from django.db.backends.postgresql import base
+
+from foodgram.database import HealthCheckMixin
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,62 @@
+"""
+Номер ревизии объекта для ETag и оптимистичных блокировок.
+
+Поле revision увеличивается в самой БД (revision = revision + 1) при
+каждом сохранении объекта, так что одновременные записи не получат
+одинаковый номер. Изменения, которые идут мимо save() (bulk_update,
+зависимые таблицы), увеличивают его через bump().
+"""
+from django.db import models
+
+
+def bump(model, pks):
+    """Увеличить ревизию объектов model с первичными ключами pks."""
+    pks = set(pks)
+    if pks:
+        model._default_manager.filter(pk__in=pks).update(
+            revision=models.F('revision') + 1
+        )
+
+
+def bump_later(obj):
+    """
+    Пометить объект для увеличения ревизии при ближайшем save() или
+    bulk_update (с 'revision' в списке полей).
+    """
+    obj.revision = models.F('revision') + 1
+
+
+def forget(obj):
+    # Новое значение знает только БД: поле станет отложенным и
+    # перечитается при обращении
+    obj.__dict__.pop('revision', None)
+
+
+class RevisionedModel(models.Model):
+    """Абстрактная модель с полем revision."""
+    # Поля, изменение которых меняет ревизию; None — любые
+    revision_fields = None
+
+    revision = models.PositiveIntegerField(
+        'Ревизия', default=1, editable=False
+    )
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if (
+                self.revision_fields is not None
+                and not set(update_fields) & set(self.revision_fields)
+            ):
+                return super().save(*args, **kwargs)
+            kwargs['update_fields'] = {*update_fields, 'revision'}
+        bump_later(self)
+        try:
+            return super().save(*args, **kwargs)
+        finally:
+            forget(self)
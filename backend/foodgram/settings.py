@@ -1,8 +1,11 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+from .database import database_from_env, replicas_from_env
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -17,6 +20,8 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
+    'sync.apps.SyncConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -30,10 +35,47 @@ INSTALLED_APPS = [
 ]
 
 DATABASES = {
+    'default': database_from_env(BASE_DIR),
+    **replicas_from_env(BASE_DIR),
+}
+
+# Реплики для чтения (см. foodgram.db_router)
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает с основной БД
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+}
+
+# Сколько процессов обслуживают запросы (gunicorn берёт число воркеров
+# из этой же переменной). Кэши, через которые отзываются токены, при
+# нескольких процессах должны быть общими — см. api.authentication
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# Кэш аутентификации по токену: алиас из CACHES и время жизни, сек.
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS', 'default')
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 60))
+
+# Аутентификация по подписанным токенам: access-токен проверяется
+# без обращения к БД, отзыв — через список в кэше JWT_DENYLIST_ALIAS.
+JWT_AUTH = os.getenv('JWT_AUTH', 'False') == 'True'
+JWT_DENYLIST_ALIAS = os.getenv('JWT_DENYLIST_ALIAS', 'default')
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        seconds=int(os.getenv('JWT_ACCESS_LIFETIME', 300))
+    ),
+    'REFRESH_TOKEN_LIFETIME': timedelta(
+        seconds=int(os.getenv('JWT_REFRESH_LIFETIME', 7 * 24 * 3600))
+    ),
+    'SIGNING_KEY': os.getenv('JWT_SIGNING_KEY') or SECRET_KEY,
+    'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
 MIDDLEWARE = [
@@ -44,8 +86,27 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # События об изменении моделей публикуются одним пакетом на запрос
+    'api.events.change_events_middleware',
 ]
 
+if DATABASE_REPLICAS:
+    MIDDLEWARE.append('api.replicas.ReplicaStickyMiddleware')
+
+# Сколько запросов процесс обрабатывает одновременно (0 — без лимита);
+# остальные ждут ADMISSION_QUEUE_TIMEOUT секунд и получают 503
+ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', 0))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 0.5))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+
+# Заголовок X-DB-Connect с временем установки соединения с БД
+if os.getenv('DB_CONNECTION_STATS', 'False') == 'True':
+    MIDDLEWARE.insert(0, 'foodgram.database.ConnectionSetupMiddleware')
+
+# Контроль допуска стоит первым: лишний запрос отклоняется до любой работы
+if ADMISSION_MAX_CONCURRENCY:
+    MIDDLEWARE.insert(0, 'api.throttling.admission_control_middleware')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -67,9 +128,43 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+# Асинхронный путь чтения ингредиентов и рецептов (имеет смысл под ASGI)
+ASYNC_READ_PATH = os.getenv('ASYNC_READ_PATH', 'False') == 'True'
 
 AUTH_USER_MODEL = 'users.User'
 
+# Хеширование паролей: алгоритм (pbkdf2, argon2, bcrypt) и его параметры.
+# Остальные хешеры в списке нужны, чтобы проверять старые хеши; при входе
+# они и хеши со старыми параметрами перехешируются выбранным алгоритмом.
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'foodgram.hashers.PBKDF2PasswordHasher',
+    'argon2': 'foodgram.hashers.Argon2PasswordHasher',
+    'bcrypt': 'foodgram.hashers.BCryptSHA256PasswordHasher',
+}
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items()
+    if name != PASSWORD_HASHER
+]
+PASSWORD_PBKDF2_ITERATIONS = int(
+    os.getenv('PASSWORD_PBKDF2_ITERATIONS', 260_000)
+)
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(
+    os.getenv('PASSWORD_ARGON2_MEMORY_COST', 102_400)  # КиБ
+)
+PASSWORD_ARGON2_PARALLELISM = int(
+    os.getenv('PASSWORD_ARGON2_PARALLELISM', 8)
+)
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv('PASSWORD_BCRYPT_ROUNDS', 12))
+# Пул процессов для хеширования (0 — считать в потоке запроса), сколько
+# операций может ждать в пуле, и Retry-After для ответа 429 сверх лимита
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 8))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv('PASSWORD_HASH_RETRY_AFTER', 1))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': (
@@ -107,10 +202,74 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Хеш содержимого в именах статики и загруженных файлов: nginx отдаёт
+# /static/ и /media/ сам с immutable-кэшем (см. infra/nginx.conf).
+# Одинаковые загрузки хранятся один раз, сирот убирает gc_media
+STATICFILES_STORAGE = (
+    'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+)
+DEFAULT_FILE_STORAGE = 'foodgram.storage.ContentAddressedStorage'
+# Размеры превью картинок рецептов (по большей стороне), их готовит
+# фоновая задача recipes.image_renditions
+RECIPE_IMAGE_RENDITIONS = [
+    int(size) for size in
+    os.getenv('RECIPE_IMAGE_RENDITIONS', '320,720').split(',') if size
+]
+
+# Сколько секунд хранится в кэше итог пищевой ценности рецепта
+# (ключ включает ревизию, так что устаревший итог не отдаётся)
+NUTRITION_CACHE_TIMEOUT = int(os.getenv('NUTRITION_CACHE_TIMEOUT', 86400))
+
+# Списки админки считают строки не дальше этого числа (foodgram.paginator)
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('ADMIN_EXACT_COUNT_LIMIT', 10_000))
+
+# Бюджет SQL-запросов действий API (api.query_budget): raise, log или
+# off; QUERY_BUDGET_DUPLICATES повторов одного SQL считаются N+1
+QUERY_BUDGET_MODE = os.getenv(
+    'QUERY_BUDGET_MODE', 'raise' if DEBUG else 'log'
+)
+QUERY_BUDGET_DUPLICATES = int(os.getenv('QUERY_BUDGET_DUPLICATES', 3))
+# Под manage.py test бюджеты всегда в режиме raise
+TEST_RUNNER = 'foodgram.test_runner.TestRunner'
+
+# Профилирование запросов (api.profiling): по заголовку X-Profile с
+# секретом или случайная доля запросов; профили пишутся в PROFILING_DIR
+PROFILING_SECRET = os.getenv('PROFILING_SECRET', '')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', 0.005))
+PROFILING_DIR = os.getenv('PROFILING_DIR', BASE_DIR / 'profiles')
+# Сколько последних профилей хранить у каждого эндпоинта
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', 200))
+
+# Короткие ссылки /s/<code>: кэш существующих кодов (общий для
+# воркеров, см. api.shortlinks), срок жизни кода в нём и как часто
+# счётчик переходов записывается в БД, секунд
+SHORT_LINK_CACHE_ALIAS = os.getenv('SHORT_LINK_CACHE_ALIAS', 'default')
+SHORT_LINK_CACHE_TTL = int(os.getenv('SHORT_LINK_CACHE_TTL', 3600))
+SHORT_LINK_FLUSH_INTERVAL = float(os.getenv('SHORT_LINK_FLUSH_INTERVAL', 5))
+
+# Фоновые задачи (jobs): python manage.py worker
+JOBS_WORKER_PROCESSES = int(os.getenv('JOBS_WORKER_PROCESSES', 2))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+# Сколько секунд задача закреплена за воркером; после — считается
+# брошенной и достаётся другому. Должно быть больше времени выполнения
+JOBS_LEASE = int(os.getenv('JOBS_LEASE', 300))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 5))
+# Задержка повтора: JOBS_BACKOFF_BASE * 2^(попытка-1), не больше MAX
+JOBS_BACKOFF_BASE = float(os.getenv('JOBS_BACKOFF_BASE', 10))
+JOBS_BACKOFF_MAX = float(os.getenv('JOBS_BACKOFF_MAX', 3600))
+
+# Синхронизация офлайн-клиентов (/api/sync/): сколько секунд запись
+# журнала выдерживается, пока не закоммитятся транзакции с меньшими
+# номерами; размер страницы и сколько дней хранится журнал
+SYNC_SETTLE_SECONDS = float(os.getenv('SYNC_SETTLE_SECONDS', 2))
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))
+SYNC_PAGE_MAX = int(os.getenv('SYNC_PAGE_MAX', 2000))
+SYNC_RETENTION_DAYS = int(os.getenv('SYNC_RETENTION_DAYS', 30))
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -122,8 +281,40 @@ REST_FRAMEWORK = {
         'api.pagination.CustomPagination'
     ),
     'PAGE_SIZE': 6,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
+    # Скорость для scope из throttle_scopes вьюсетов; переопределяется
+    # переменной THROTTLE_<SCOPE>, пустое значение снимает ограничение
+    'DEFAULT_THROTTLE_RATES': {
+        scope: os.getenv(f'THROTTLE_{scope.upper()}', rate) or None
+        for scope, rate in {
+            'shopping_cart_download': '10/min',
+            'recipe_write': '30/min',
+            'recipe_bulk': '10/min',
+            'ingredients': '120/min',
+            'user_create': '10/min',
+            'avatar': '10/min',
+            'set_password': '5/min',
+            'export': '60/hour',
+            'sync': '60/min',
+        }.items()
+    },
+    # Анонимы различаются по IP: за nginx (infra/nginx.conf) это
+    # последний адрес X-Forwarded-For, а не REMOTE_ADDR прокси. Без
+    # прокси — NUM_PROXIES=0, иначе клиент подделает свой адрес
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
 }
 
+# Где хранить корзины троттлинга: local (в памяти процесса) или алиас
+# из CACHES, общего для всех процессов
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'local')
+
+if JWT_AUTH:
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].insert(
+        0, 'api.jwt_tokens.StatelessJWTAuthentication'
+    )
+
 DJOSER = {
     # какие сериализаторы использовать
     'SERIALIZERS': {
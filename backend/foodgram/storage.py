@@ -0,0 +1,77 @@
+"""
+Контентно-адресуемое хранилище медиафайлов.
+
+Файл хешируется (sha256) прямо во время записи на диск и сохраняется
+один раз под именем <каталог upload_to>/<2 символа хеша>/<хеш><расш.>.
+Одинаковые картинки разных рецептов ссылаются на один файл. Файл по
+такому URL никогда не меняется, поэтому nginx отдаёт /media/ с
+Cache-Control: immutable.
+
+Раз файл может быть общим, delete() его не удаляет: файлы, на которые
+больше никто не ссылается, убирает команда gc_media.
+
+Производные файлы (превью и т. п.) лежат в DERIVED_DIR под именем
+исходного хеша с суффиксом и живут, пока жив исходный файл.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+# Временные файлы на время записи, на той же ФС, что и итоговые
+TMP_DIR = '.tmp'
+# Производные от загруженных файлов, см. derived_name()
+DERIVED_DIR = 'derived'
+
+
+def derived_name(name, suffix):
+    """Имя производного файла: derived/<2 символа>/<хеш>-<суффикс>."""
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    return posixpath.join(DERIVED_DIR, stem[:2], f'{stem}-{suffix}')
+
+
+def derived_source(name):
+    """Хеш исходного файла по имени производного."""
+    return posixpath.basename(name).rsplit('-', 1)[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым; из исходного берутся только
+        # каталог и расширение
+        return name
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = posixpath.join(directory, hexdigest[:2], hexdigest + ext)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Такой файл уже есть; свежее mtime защищает его от gc_media,
+                # пока новая ссылка на него не сохранена в БД
+                os.utime(full_path)
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+                os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return name
+
+    def delete(self, name):
+        """Файл может быть общим; удаляет его только gc_media."""
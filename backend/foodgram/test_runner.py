@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+
+# Реплика для тестов маршрутизации чтения (foodgram.db_router): зеркало
+# default, как и реплики из DB_REPLICAS
+TEST_REPLICA = 'replica'
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Тесты всегда проверяют бюджеты запросов строго: раннер выключает
+    DEBUG, и без этого нарушение бюджета только попало бы в лог.
+    Алиас TEST_REPLICA есть всегда; включают его тесты, переопределяя
+    DATABASE_REPLICAS.
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._query_budget_mode = settings.QUERY_BUDGET_MODE
+        settings.QUERY_BUDGET_MODE = 'raise'
+
+    def setup_databases(self, **kwargs):
+        if TEST_REPLICA not in connections.databases:
+            connections.databases[TEST_REPLICA] = {
+                **connections.databases[DEFAULT_DB_ALIAS],
+                'TEST': {'MIRROR': DEFAULT_DB_ALIAS},
+            }
+        return super().setup_databases(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        settings.QUERY_BUDGET_MODE = self._query_budget_mode
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,391 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.paginator import EmptyPage
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.backends.sqlite3 import base
+from django.test import (
+    AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import async_views
+from foodgram.database import HealthCheckMixin
+from foodgram.db_router import ReplicaRouter, reset_replica, use_replica
+from foodgram.pooled_postgresql import base as pooled
+from foodgram.paginator import EstimatedCountPaginator
+from foodgram.storage import derived_name
+from foodgram.test_runner import TEST_REPLICA
+from recipes.models import Recipe
+from users.admin import UserAdmin
+from users.models import User
+
+DAY = 24 * 60 * 60
+
+
+class CheckedDatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    pass
+
+
+class HealthCheckTests(SimpleTestCase):
+    def setUp(self):
+        # База в памяти не закрывается, поэтому — во временном файле
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {
+            **connection.settings_dict,
+            'NAME': Path(directory.name) / 'db.sqlite3', 'CONN_MAX_AGE': 60,
+            'CONN_HEALTH_CHECKS': True,
+        }
+        self.connection = CheckedDatabaseWrapper(settings_dict, 'checked')
+        self.addCleanup(self.connection.close)
+        self.is_usable = mock.patch.object(
+            self.connection, 'is_usable', return_value=True
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def request(self, queries=1):
+        self.connection.close_if_unusable_or_obsolete()
+        for _ in range(queries):
+            with self.connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        self.connection.close_if_unusable_or_obsolete()
+
+    def test_new_connection_is_not_checked(self):
+        self.request(queries=3)
+        self.is_usable.assert_not_called()
+
+    def test_reused_connection_is_checked_once_on_first_use(self):
+        self.request()
+        self.connection.close_if_unusable_or_obsolete()
+        self.is_usable.assert_not_called()
+        self.request(queries=3)
+        self.is_usable.assert_called_once()
+
+    def test_unused_connection_is_not_checked(self):
+        self.request()
+        for _ in range(3):
+            self.request(queries=0)
+        self.is_usable.assert_not_called()
+
+    def test_broken_connection_is_replaced(self):
+        self.request()
+        broken = self.connection.connection
+        self.is_usable.return_value = False
+        self.request()
+        self.assertIsNot(self.connection.connection, broken)
+
+
+class PooledConnectionTests(SimpleTestCase):
+    def setUp(self):
+        settings_dict = {
+            'ENGINE': 'foodgram.pooled_postgresql', 'NAME': 'foodgram',
+            'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '',
+            'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True,
+            'POOL': {},
+        }
+        self.wrapper = pooled.DatabaseWrapper(settings_dict, 'pooled')
+        self.pool = mock.Mock(maxconn=2)
+        mock.patch.object(
+            self.wrapper, '_get_pool', return_value=self.pool
+        ).start()
+        mock.patch.dict(
+            pooled.DatabaseWrapper._pools,
+            {self.wrapper._pool_key(): self.pool},
+        ).start()
+        mock.patch.object(pooled.extras, 'register_default_jsonb').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def pg_connection(self, alive=True):
+        connection = mock.MagicMock(
+            closed=0, status=pooled.extensions.STATUS_READY
+        )
+        if not alive:
+            cursor = connection.cursor.return_value.__enter__.return_value
+            cursor.execute.side_effect = pooled.Database.OperationalError
+        return connection
+
+    def test_dead_pooled_connection_is_discarded(self):
+        dead, alive = self.pg_connection(alive=False), self.pg_connection()
+        self.pool.getconn.side_effect = [dead, alive]
+        self.assertIs(self.wrapper.get_new_connection({}), alive)
+        self.pool.putconn.assert_called_once_with(dead, close=True)
+
+    def test_connection_is_not_checked_without_health_checks(self):
+        self.wrapper.settings_dict['CONN_HEALTH_CHECKS'] = False
+        dead = self.pg_connection(alive=False)
+        self.pool.getconn.return_value = dead
+        self.assertIs(self.wrapper.get_new_connection({}), dead)
+        dead.cursor.assert_not_called()
+
+    def test_healthy_connection_returns_to_pool(self):
+        self.wrapper.connection = connection = self.pg_connection()
+        self.wrapper._close()
+        self.pool.putconn.assert_called_once_with(connection, close=False)
+
+    def test_closed_connection_is_not_returned_to_pool(self):
+        self.wrapper.connection = connection = self.pg_connection()
+        connection.closed = 2
+        self.wrapper._close()
+        self.pool.putconn.assert_called_once_with(connection, close=True)
+
+    def test_connection_after_error_is_not_returned_to_pool(self):
+        self.wrapper.connection = connection = self.pg_connection()
+        self.wrapper.errors_occurred = True
+        self.wrapper._close()
+        self.pool.putconn.assert_called_once_with(connection, close=True)
+
+
+@override_settings(
+    ADMIN_EXACT_COUNT_LIMIT=3,
+    # манифеста collectstatic в тестах нет
+    STATICFILES_STORAGE=(
+        'django.contrib.staticfiles.storage.StaticFilesStorage'
+    ),
+)
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        for number in range(7):
+            User.objects.create_user(
+                username=f'user{number}', email=f'user{number}@example.com',
+                password='Pass12345', is_staff=True, is_superuser=True,
+            )
+
+    def test_pages_past_capped_count_open(self):
+        paginator = EstimatedCountPaginator(User.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.count, 4)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(
+            [user.username for user in paginator.page(4)], ['user6']
+        )
+        self.assertEqual(list(paginator.page(10)), [])
+        with self.assertRaises(EmptyPage):
+            paginator.page(0)
+
+    def test_exact_count_keeps_page_validation(self):
+        paginator = EstimatedCountPaginator(
+            User.objects.filter(username__in=['user0', 'user1']), 2
+        )
+        with self.assertRaises(EmptyPage):
+            paginator.page(2)
+
+    def test_admin_opens_page_past_count(self):
+        self.client.force_login(User.objects.first())
+        with mock.patch.object(UserAdmin, 'list_per_page', 2):
+            response = self.client.get('/admin/users/user/?p=4')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'user6')
+
+
+class MediaTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = Path(directory.name)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def put(self, name, content=b'data', age=0):
+        """Файл мимо хранилища, с mtime age секунд назад."""
+        path = self.media_root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return name
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def test_identical_uploads_share_one_file(self):
+        first = default_storage.save(
+            'recipes/images/porridge.PNG', ContentFile(b'image')
+        )
+        second = default_storage.save(
+            'recipes/images/soup.png', ContentFile(b'image')
+        )
+        digest = hashlib.sha256(b'image').hexdigest()
+        self.assertEqual(first, f'recipes/images/{digest[:2]}/{digest}.png')
+        self.assertEqual(second, first)
+        other = default_storage.save(
+            'recipes/images/soup.png', ContentFile(b'other')
+        )
+        self.assertNotEqual(other, first)
+        self.assertEqual(
+            len(list((self.media_root / 'recipes/images').rglob('*.png'))), 2
+        )
+
+    def test_delete_keeps_shared_file(self):
+        name = default_storage.save('avatars/a.png', ContentFile(b'image'))
+        default_storage.delete(name)
+        self.assertTrue(default_storage.exists(name))
+
+
+class GcMediaTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='Pass1234'
+        )
+        self.referenced = self.put('recipes/images/ab/abc.png', age=DAY)
+        Recipe.objects.create(
+            author=author, name='Каша', text='Сварить', cooking_time=5,
+            image=self.referenced,
+        )
+        self.derived = self.put(derived_name(self.referenced, 'thumb.webp'),
+                                age=DAY)
+        self.orphans = [
+            self.put('recipes/images/cd/cde.png', age=DAY),
+            self.put('avatars/ef/efg.png', age=DAY),
+            self.put(derived_name('recipes/images/cd/cde.png', 'thumb.webp'),
+                     age=DAY),
+        ]
+        self.fresh = self.put('recipes/images/01/012.png', age=60)
+        # Вне каталогов upload_to команда ничего не трогает
+        self.foreign = self.put('backups/dump.sql', age=DAY)
+
+    def gc_media(self, *args):
+        out = io.StringIO()
+        call_command('gc_media', '--min-age', '3600', *args, stdout=out)
+        return out.getvalue()
+
+    def remaining(self):
+        return {
+            path.relative_to(self.media_root).as_posix()
+            for path in self.media_root.rglob('*') if path.is_file()
+        }
+
+    def test_dry_run_deletes_nothing(self):
+        before = self.remaining()
+        output = self.gc_media('--dry-run')
+        self.assertIn('Would delete 3 unreferenced files', output)
+        self.assertEqual(self.remaining(), before)
+
+    def test_removes_only_old_unreferenced_files(self):
+        output = self.gc_media('--batch-size', '2')
+        self.assertIn('Deleted 3 unreferenced files', output)
+        self.assertEqual(self.remaining(), {
+            self.referenced, self.derived, self.fresh, self.foreign,
+        })
+        # Опустевшие каталоги-префиксы хеша удалены
+        self.assertFalse((self.media_root / 'avatars/ef').exists())
+
+
+@override_settings(
+    DATABASE_REPLICAS=[TEST_REPLICA],
+    MIDDLEWARE=[*settings.MIDDLEWARE, 'api.replicas.ReplicaStickyMiddleware'],
+)
+class ReplicaTests(TransactionTestCase):
+    # Зеркало видит только закоммиченные данные
+    databases = {DEFAULT_DB_ALIAS, TEST_REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='Pass12345'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Каша', text='Сварить', cooking_time=5,
+            image='recipes/images/porridge.png',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def replica_queries(self, method, url):
+        with CaptureQueriesContext(connections[TEST_REPLICA]) as queries:
+            response = method(url)
+        self.assertLess(response.status_code, 400)
+        return len(queries)
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+        token = use_replica()
+        try:
+            self.assertEqual(router.db_for_read(Recipe), TEST_REPLICA)
+            self.assertEqual(router.db_for_read(User), TEST_REPLICA)
+            # Служебные таблицы и запись — только основная БД
+            self.assertEqual(router.db_for_read(Token), DEFAULT_DB_ALIAS)
+            self.assertEqual(router.db_for_write(Recipe), DEFAULT_DB_ALIAS)
+        finally:
+            reset_replica(token)
+        self.assertEqual(router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(TEST_REPLICA, 'recipes'))
+
+    def test_safe_reads_of_chosen_actions_use_replica(self):
+        self.assertGreater(
+            self.replica_queries(self.client.get, '/api/recipes/'), 0
+        )
+        self.assertGreater(self.replica_queries(
+            self.client.get, f'/api/recipes/{self.recipe.pk}/'
+        ), 0)
+        self.assertEqual(self.replica_queries(
+            self.client.get, '/api/users/subscriptions/'
+        ), 0)
+
+    def test_user_sticks_to_primary_after_write(self):
+        self.assertEqual(self.replica_queries(
+            self.client.post, f'/api/recipes/{self.recipe.pk}/favorite/'
+        ), 0)
+        self.assertEqual(
+            self.replica_queries(self.client.get, '/api/recipes/'), 0
+        )
+        # Другие пользователи по-прежнему читают с реплики
+        self.client.force_authenticate(None)
+        self.assertGreater(
+            self.replica_queries(self.client.get, '/api/recipes/'), 0
+        )
+
+    def test_failed_write_does_not_stick(self):
+        response = self.client.post('/api/recipes/0/favorite/')
+        self.assertEqual(response.status_code, 404)
+        self.assertGreater(
+            self.replica_queries(self.client.get, '/api/recipes/'), 0
+        )
+
+    def test_async_ingredient_list_reads_like_sync_view(self):
+        def async_list():
+            with CaptureQueriesContext(connections[TEST_REPLICA]) as queries:
+                # Пул потоков видел бы другое соединение
+                with mock.patch.object(
+                    async_views, '_worker', lambda func: sync_to_async(func)
+                ):
+                    response = async_to_sync(async_views.ingredient_list)(
+                        AsyncRequestFactory().get(
+                            '/api/ingredients/', authorization=f'Token {key}'
+                        )
+                    )
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        key = Token.objects.create(user=self.user).key
+        self.assertGreater(async_list(), 0)
+        self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(async_list(), 0)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_reads_default(self):
+        token = use_replica()
+        try:
+            self.assertEqual(
+                ReplicaRouter().db_for_read(Recipe), DEFAULT_DB_ALIAS
+            )
+        finally:
+            reset_replica(token)
+        self.assertEqual(
+            self.replica_queries(self.client.get, '/api/recipes/'), 0
+        )
@@ -3,17 +3,24 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from api.shortlinks import redirect as short_link_redirect
+from api.urls import auth_urlpatterns, jwt_urlpatterns
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
-    # Djoser: регистрация, профиль
-    path('auth/', include('djoser.urls')),
+    # Djoser: регистрация, профиль, токены (/auth/token/login/,
+    # /auth/token/logout/)
+    path('auth/', include(auth_urlpatterns)),
 
-    # Djoser: маршруты для токенов (/auth/token/login/, /auth/token/logout/)
-    path('auth/', include('djoser.urls.authtoken')),
+    # Подписанные токены (JWT_AUTH=True): /auth/jwt/create/ и т.д.
+    *([path('auth/', include(jwt_urlpatterns))] if settings.JWT_AUTH else []),
 
     # Ваше API
     path('api/', include('api.urls', namespace='api')),
+
+    # Короткие ссылки на рецепты
+    path('s/<str:code>', short_link_redirect, name='short-link'),
 ]
 
 if settings.DEBUG:
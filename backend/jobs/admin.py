@@ -0,0 +1,24 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'claimed_by')
+    list_filter = ('status', 'name')
+    readonly_fields = ('created_at',)
+    actions = ('retry',)
+
+    @admin.action(description='Перезапустить')
+    def retry(self, request, queryset):
+        queryset.update(
+            status=Job.QUEUED,
+            attempts=0,
+            run_at=timezone.now(),
+            claimed_by='',
+            locked_until=None,
+            # Такая же задача может уже ждать в очереди
+            dedupe_key=None,
+        )
@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs import pool
+from jobs.queue import claim, execute, finish
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs. Jobs are claimed in batches '
+        '(SELECT ... FOR UPDATE SKIP LOCKED where supported), executed '
+        'in a process pool and retried with exponential backoff. Several '
+        'workers can run side by side.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.JOBS_WORKER_PROCESSES,
+            help='Size of the process pool; 0 runs jobs in this process'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='How many jobs to claim at once (default: 2 x processes)'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help='Pause when the queue is empty, seconds'
+        )
+        parser.add_argument(
+            '--lease', type=int, default=settings.JOBS_LEASE,
+            help='Seconds a claimed job stays reserved for this worker'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit as soon as the queue is empty'
+        )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        batch_size = options['batch_size'] or max(1, 2 * processes)
+        worker_id = (
+            f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        )
+        self.stopping = False
+        self.pool_broken = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        executor = self._executor(processes)
+        done = failed = 0
+        try:
+            while not self.stopping:
+                close_old_connections()
+                jobs = claim(worker_id, batch_size, options['lease'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                for job, error in self._run(executor, jobs):
+                    finish(job, error)
+                    if error is None:
+                        done += 1
+                    else:
+                        failed += 1
+                        self.stderr.write(
+                            f'{job} failed (attempt {job.attempts}/'
+                            f'{job.max_attempts}):\n{error}'
+                        )
+                if self.pool_broken:
+                    executor.shutdown(wait=False)
+                    executor = self._executor(processes)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Worker {worker_id}: {done} done, {failed} failed'
+        ))
+
+    def _stop(self, signum, frame):
+        # Текущая пачка дорабатывается; незавершённые задачи вернутся в
+        # очередь по истечении аренды
+        self.stopping = True
+
+    @staticmethod
+    def _executor(processes):
+        if processes <= 0:
+            return None
+        return ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=pool.setup,
+        )
+
+    def _run(self, executor, jobs):
+        """Пары (задача, ошибка или None) по мере выполнения."""
+        if executor is None:
+            for job in jobs:
+                yield job, execute(job.name, job.payload)
+            return
+        futures = {
+            executor.submit(pool.run, job.name, job.payload): job
+            for job in jobs
+        }
+        self.pool_broken = False
+        for future in as_completed(futures):
+            try:
+                error = future.result()
+            except BrokenProcessPool:
+                self.pool_broken = True
+                error = 'Worker process died'
+            yield futures[future], error
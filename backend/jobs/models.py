@@ -0,0 +1,62 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    Фоновая задача (outbox). Пишется в той же транзакции, что и
+    изменение, которое её породило; выполняет команда worker. Успешно
+    выполненные задачи удаляются.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    name = models.CharField('Задача', max_length=100)
+    payload = models.JSONField('Параметры', default=dict, blank=True)
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток', default=5
+    )
+    run_at = models.DateTimeField('Выполнить не раньше', default=timezone.now)
+    claimed_by = models.CharField('Воркер', max_length=64, blank=True)
+    locked_until = models.DateTimeField('Занята до', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    dedupe_key = models.CharField(
+        'Ключ схлопывания', max_length=200, null=True, blank=True
+    )
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            # Выборка воркера: статус + срок
+            models.Index(
+                fields=['status', 'run_at'], name='job_status_run_at_idx'
+            ),
+        ]
+        constraints = [
+            # Одна ожидающая задача на ключ: повторная постановка
+            # той же работы ничего не добавляет
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='queued'),
+                name='unique_queued_job_key'
+            ),
+        ]
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -0,0 +1,21 @@
+"""
+Точки входа процессов пула команды worker.
+
+Процесс, запущенный через spawn, импортирует этот модуль до
+django.setup(), поэтому модели здесь импортируются только внутри функций.
+"""
+import signal
+
+
+def setup():
+    # Соединения с БД и прочее состояние родителя не наследуются,
+    # Django настраивается заново
+    import django
+    django.setup()
+    # Ctrl+C в терминале получает вся группа; останавливает пул родитель
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run(name, payload):
+    from .queue import execute
+    return execute(name, payload)
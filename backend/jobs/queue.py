@@ -0,0 +1,127 @@
+"""
+Очередь фоновых задач в БД без внешнего брокера.
+
+Задача — функция от словаря payload, зарегистрированная декоратором
+@task('имя') в модуле <app>.tasks. enqueue() пишет строку Job в текущей
+транзакции: если запрос откатится, задачи не будет, а закоммиченная
+задача не потеряется, даже если процесс упадёт сразу после коммита.
+
+Воркер забирает пачку задач (SELECT ... FOR UPDATE SKIP LOCKED там, где
+БД это умеет), помечает их своим claimed_by и сроком аренды, выполняет
+и удаляет. Упавшая задача возвращается в очередь с экспоненциальной
+задержкой, после max_attempts попыток остаётся со статусом failed.
+Задача, чей воркер умер, снова становится доступна по истечении аренды,
+если попытки не исчерпаны, иначе тоже получает статус failed.
+"""
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+TASKS = {}
+
+
+def task(name):
+    """Зарегистрировать функцию как фоновую задачу."""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, *, delay=0, dedupe_key=None,
+            max_attempts=None):
+    """
+    Поставить задачу в очередь в текущей транзакции. Пока задача с тем
+    же dedupe_key ждёт выполнения, повторная постановка игнорируется.
+    """
+    if name not in TASKS:
+        raise ValueError(f'Неизвестная фоновая задача: {name}')
+    job = Job(
+        name=name,
+        payload=payload or {},
+        run_at=timezone.now() + timedelta(seconds=delay),
+        dedupe_key=dedupe_key,
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+    Job.objects.bulk_create([job], ignore_conflicts=dedupe_key is not None)
+
+
+def claim(worker_id, limit, lease):
+    """Забрать до limit готовых задач и арендовать их на lease секунд."""
+    now = timezone.now()
+    expired = Q(status=Job.RUNNING, locked_until__lt=now)
+    due = (
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | expired & Q(attempts__lt=F('max_attempts'))
+    )
+    using = router.db_for_write(Job)
+    with transaction.atomic(using=using):
+        # Воркер умер на последней попытке: повторов больше не будет
+        Job.objects.using(using).filter(
+            expired, attempts__gte=F('max_attempts')
+        ).update(
+            status=Job.FAILED,
+            locked_until=None,
+            last_error='Worker lease expired on the last attempt',
+        )
+        candidates = Job.objects.using(using).filter(due).order_by(
+            'run_at', 'id'
+        )
+        if connections[using].features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        # Условие due повторяется в UPDATE: без блокировок строк (SQLite)
+        # задачу, которую успел забрать другой воркер, мы не перехватим
+        Job.objects.using(using).filter(due, pk__in=ids).update(
+            status=Job.RUNNING,
+            claimed_by=worker_id,
+            locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1,
+        )
+        return list(Job.objects.using(using).filter(
+            pk__in=ids, status=Job.RUNNING, claimed_by=worker_id
+        ))
+
+
+def execute(name, payload):
+    """Выполнить задачу; вернуть текст ошибки или None."""
+    try:
+        TASKS[name](payload)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def backoff(attempts):
+    """Задержка перед повтором: экспонента с ограничением и разбросом."""
+    delay = min(
+        settings.JOBS_BACKOFF_MAX,
+        settings.JOBS_BACKOFF_BASE * 2 ** (attempts - 1),
+    )
+    return delay * random.uniform(0.5, 1)
+
+
+def finish(job, error):
+    """Удалить выполненную задачу или запланировать повтор."""
+    jobs = Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by)
+    if error is None:
+        jobs.delete()
+    elif job.attempts >= job.max_attempts:
+        jobs.update(status=Job.FAILED, last_error=error, locked_until=None)
+    else:
+        jobs.update(
+            status=Job.QUEUED,
+            last_error=error,
+            claimed_by='',
+            locked_until=None,
+            run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+        )
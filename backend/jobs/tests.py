@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import claim
+
+
+class ClaimTests(TestCase):
+    def expired_job(self, attempts):
+        return Job.objects.create(
+            name='noop', status=Job.RUNNING, attempts=attempts,
+            max_attempts=3, claimed_by='dead',
+            locked_until=timezone.now() - timedelta(seconds=1),
+        )
+
+    def test_expired_lease_is_reclaimed_while_attempts_remain(self):
+        job = self.expired_job(attempts=2)
+        self.assertEqual([claimed.pk for claimed in claim('w', 10, 60)],
+                         [job.pk])
+        job.refresh_from_db()
+        self.assertEqual((job.claimed_by, job.attempts), ('w', 3))
+
+    def test_expired_lease_on_last_attempt_fails(self):
+        job = self.expired_job(attempts=3)
+        self.assertEqual(claim('w', 10, 60), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNone(job.locked_until)
@@ -1,14 +1,23 @@
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from foodgram.paginator import EstimatedCountAdminMixin
 from .models import (
     Ingredient, Tag, Recipe, IngredientInRecipe,
-    Favorite, ShoppingCart
+    Favorite, ShoppingCart, ShortLink
 )
 
+# Поиск в списках — только по началу строки или точному значению: такие
+# условия идут по индексам (на PostgreSQL для LIKE 'x%' Django сам создаёт
+# индекс *_like у уникальных и db_index-полей), а icontains по умолчанию
+# читает всю таблицу.
+
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'measurement_unit')
-    search_fields = ('name',)
+    list_display = ('name', 'measurement_unit', 'calories', 'price')
+    search_fields = ('name__startswith',)
 
 
 @admin.register(Tag)
@@ -18,29 +27,60 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorites_count')
-    list_filter = ('author', 'name')
-    search_fields = ('author__username', 'name')
+class RecipeAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'author', 'pub_date', 'favorites_count')
+    list_select_related = ('author',)
+    search_fields = (
+        'name__startswith',
+        'author__username__startswith',
+        'author__email__exact',
+    )
+    autocomplete_fields = ('author',)
+
+    def get_queryset(self, request):
+        # Подзапрос, а не Count по join: считается только для строк
+        # страницы, по индексу favorite_recipe_user_idx
+        favorites = Favorite.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            count=Count('*')
+        ).values('count')
+        return super().get_queryset(request).annotate(
+            favorites_count=Coalesce(Subquery(favorites), 0)
+        )
 
     def favorites_count(self, obj):
-        return obj.favorited_by.count()
+        return obj.favorites_count
     favorites_count.short_description = 'Added to favorites'
 
 
 @admin.register(IngredientInRecipe)
-class IngredientInRecipeAdmin(admin.ModelAdmin):
+class IngredientInRecipeAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
-    list_filter = ('ingredient',)
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name__startswith',)
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'recipe')
-    list_filter = ('user',)
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username__startswith',)
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe')
-    list_filter = ('user',)
+class ShoppingCartAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'recipe', 'servings')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username__startswith',)
+    autocomplete_fields = ('user', 'recipe')
+
+
+@admin.register(ShortLink)
+class ShortLinkAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ('code', 'recipe', 'hits')
+    list_select_related = ('recipe',)
+    search_fields = ('code',)
+    raw_id_fields = ('recipe',)
@@ -0,0 +1,174 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, F, Sum
+
+from api.constants import PAGE_SIZE
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart
+)
+from users.models import Subscription, User
+
+# Признаки полного сканирования таблицы и сортировки в планах
+SEQ_SCAN_PATTERNS = (
+    re.compile(r'Seq Scan on (\w+)'),                     # PostgreSQL
+    re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING)'),  # SQLite
+)
+SORT_PATTERNS = (
+    re.compile(r'\bSort\b'),
+    re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+)
+
+
+def query_shapes(user, author, recipe):
+    """Запросы, которые API выполняет на каждом горячем эндпоинте."""
+    return [
+        ('recipes: лента', Recipe.objects.all()[:PAGE_SIZE]),
+        (
+            'recipes: ?author=',
+            Recipe.objects.filter(author=author)[:PAGE_SIZE]
+        ),
+        (
+            'recipes: ?is_favorited=1',
+            Recipe.objects.filter(
+                id__in=Favorite.objects.filter(
+                    user=user
+                ).values_list('recipe__id', flat=True)
+            )[:PAGE_SIZE]
+        ),
+        (
+            'recipes: ?is_in_shopping_cart=1',
+            Recipe.objects.filter(
+                id__in=ShoppingCart.objects.filter(
+                    user=user
+                ).values_list('recipe__id', flat=True)
+            )[:PAGE_SIZE]
+        ),
+        (
+            'recipe: ингредиенты',
+            IngredientInRecipe.objects.filter(recipe=recipe)
+        ),
+        (
+            'recipe: is_favorited',
+            user.favorites.filter(recipe=recipe)[:1]
+        ),
+        (
+            'recipe: is_in_shopping_cart',
+            user.shopping_cart.filter(recipe=recipe)[:1]
+        ),
+        (
+            'admin: favorites_count',
+            Favorite.objects.filter(recipe=recipe).values(
+                'recipe'
+            ).annotate(count=Count('pk'))
+        ),
+        (
+            'download_shopping_cart',
+            IngredientInRecipe.objects.filter(
+                recipe__in_shopping_cart__user=user
+            ).values(
+                name=F('ingredient__name'),
+                measurement_unit=F('ingredient__measurement_unit')
+            ).annotate(amount=Sum('amount'))
+        ),
+        (
+            'users: subscriptions',
+            User.objects.filter(subscribers__user=user)[:PAGE_SIZE]
+        ),
+        (
+            'users: is_subscribed',
+            user.subscriptions.filter(author=author)[:1]
+        ),
+        (
+            'users: подписчики автора',
+            Subscription.objects.filter(author=author).values('user')
+        ),
+        (
+            'users: recipes_count',
+            Recipe.objects.filter(author=author).values(
+                'author'
+            ).annotate(count=Count('pk'))
+        ),
+        (
+            'ingredients: автодополнение',
+            Ingredient.objects.filter(name__istartswith='а')
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the API query shapes with EXPLAIN, report sequential scans '
+        'and sorts, and time each query. Run before and after migrating '
+        'to compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='How many times to run each query for timing'
+        )
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Print full query plans'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Use EXPLAIN ANALYZE (PostgreSQL only)'
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Exit with an error if any query scans or sorts'
+        )
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.select_related('author').first()
+        user = (
+            User.objects.filter(favorites__isnull=False).first()
+            or User.objects.first()
+        )
+        if recipe is None or user is None:
+            raise CommandError(
+                'Нужны данные: хотя бы один пользователь и один рецепт.'
+            )
+        explain_options = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain_options['analyze'] = True
+
+        issues_total = 0
+        for name, queryset in query_shapes(user, recipe.author, recipe):
+            plan = queryset.explain(**explain_options)
+            issues = self._find_issues(plan)
+            issues_total += len(issues)
+            timing = self._time(queryset, options['repeat'])
+            style = self.style.WARNING if issues else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{name:<34} {timing:8.3f} ms  '
+                f'{", ".join(issues) or "OK"}'
+            ))
+            if options['plans']:
+                self.stdout.write(plan + '\n')
+
+        if issues_total and options['strict']:
+            raise CommandError(f'Найдено проблем в планах: {issues_total}')
+
+    @staticmethod
+    def _find_issues(plan):
+        issues = []
+        for pattern in SEQ_SCAN_PATTERNS:
+            issues.extend(
+                f'seq scan {table}' for table in pattern.findall(plan)
+            )
+        if any(pattern.search(plan) for pattern in SORT_PATTERNS):
+            issues.append('sort')
+        return issues
+
+    @staticmethod
+    def _time(queryset, repeat):
+        list(queryset.all())
+        started = time.perf_counter()
+        for _ in range(repeat):
+            list(queryset.all())
+        return (time.perf_counter() - started) * 1000 / max(repeat, 1)
@@ -1,26 +1,102 @@
+import csv
 import json
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.snapshots import drop_ingredients_snapshot
+from foodgram import revisions
+from recipes import nutrition
+from recipes.models import Ingredient, IngredientInRecipe, Recipe
+
+BATCH_SIZE = 1000
+CSV_COLUMNS = ('name', 'measurement_unit', *nutrition.NUTRIENTS)
 
 
 class Command(BaseCommand):
-    help = "Import ingredients from JSON file"
+    help = (
+        'Import ingredients from a JSON or CSV file. Besides name and '
+        'measurement_unit a record may carry calories, proteins, fats, '
+        'carbohydrates and price per 100 units; they are set on new '
+        'ingredients and updated on existing ones. New ingredients are '
+        'inserted and changed ones updated in batches.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--file', '-f', default='data/ingredients.json',
-            help='Path to JSON file with ingredients'
+            help='Path to JSON or CSV file with ingredients; CSV columns: '
+                 + ', '.join(CSV_COLUMNS)
         )
 
+    @staticmethod
+    def read(path):
+        with open(path, encoding='utf-8', newline='') as f:
+            if not path.endswith('.csv'):
+                return json.load(f)
+            return [
+                dict(zip(CSV_COLUMNS, row))
+                for row in csv.reader(f)
+                if row and row[0] != 'name'
+            ]
+
+    @staticmethod
+    def values(item):
+        """Заполненные в записи показатели: {поле: число}."""
+        return {
+            name: float(item[name]) for name in nutrition.NUTRIENTS
+            if item.get(name) not in (None, '')
+        }
+
     def handle(self, *args, **options):
-        path = options['file']
-        with open(path, encoding='utf-8') as f:
-            data = json.load(f)
-        created = 0
-        for item in data:
-            Ingredient.objects.get_or_create(
-                name=item['name'],
-                measurement_unit=item['measurement_unit']
+        items = {}
+        for number, item in enumerate(self.read(options['file']), 1):
+            try:
+                items[item['name']] = (
+                    item['measurement_unit'], self.values(item)
+                )
+            except (KeyError, TypeError, ValueError) as error:
+                raise CommandError(f'Record {number}: {error!r}')
+
+        existing = Ingredient.objects.only(
+            'id', 'name', *nutrition.NUTRIENTS
+        ).in_bulk(field_name='name')
+        new, changed, fields = [], [], set()
+        for name, (measurement_unit, values) in items.items():
+            ingredient = existing.get(name)
+            if ingredient is None:
+                new.append(Ingredient(
+                    name=name, measurement_unit=measurement_unit, **values
+                ))
+                continue
+            updated = {
+                field for field, value in values.items()
+                if getattr(ingredient, field) != value
+            }
+            if updated:
+                for field in updated:
+                    setattr(ingredient, field, values[field])
+                changed.append(ingredient)
+                fields |= updated
+
+        with transaction.atomic():
+            # bulk-операции не шлют сигналов: снимок списка и итоги
+            # рецептов сбрасываем сами
+            Ingredient.objects.bulk_create(
+                new, batch_size=BATCH_SIZE, ignore_conflicts=True
+            )
+            Ingredient.objects.bulk_update(
+                changed, fields, batch_size=BATCH_SIZE
             )
-            created += 1
-        self.stdout.write(self.style.SUCCESS(f'Imported {created} ingredients'))
+            if changed:
+                revisions.bump(Recipe, IngredientInRecipe.objects.filter(
+                    ingredient__in=changed
+                ).values_list('recipe_id', flat=True))
+            if new or changed:
+                transaction.on_commit(
+                    lambda: drop_ingredients_snapshot(Ingredient)
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {len(new)} new ingredients, '
+            f'updated {len(changed)}'
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-19 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='revision',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Ревизия'),
+        ),
+    ]
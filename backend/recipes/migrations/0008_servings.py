@@ -0,0 +1,24 @@
+# Generated by Django 3.2.18 on 2026-10-19 10:53
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_ingredient_nutrition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1, 'Не меньше 1.'), django.core.validators.MaxValueValidator(100, 'Не больше 100.')], verbose_name='Порций'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='servings',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Пусто — столько, сколько в рецепте.', null=True, validators=[django.core.validators.MinValueValidator(1, 'Не меньше 1.'), django.core.validators.MaxValueValidator(100, 'Не больше 100.')], verbose_name='Порций'),
+        ),
+    ]
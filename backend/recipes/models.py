@@ -4,13 +4,18 @@ from django.core.validators import (
     RegexValidator,
 )
 from django.db import models
+from django.db.models import ExpressionWrapper, F
+from django.db.models.functions import Coalesce
 
+from foodgram.revisions import RevisionedModel
 from users.models import User
 
 COOKING_TIME_MIN = 1
 COOKING_TIME_MAX = 32_000
 AMOUNT_MIN = 1
 AMOUNT_MAX = 32_000
+SERVINGS_MIN = 1
+SERVINGS_MAX = 100
 
 
 class Ingredient(models.Model):
@@ -30,6 +35,29 @@ class Ingredient(models.Model):
         'Единица измерения',
         max_length=50,
     )
+    # Пищевая ценность и цена на 100 базовых единиц measurement_unit
+    # (100 г для г и кг, 100 мл для мл и л, 100 шт, см. units.UNITS);
+    # пусто — неизвестно
+    calories = models.FloatField(
+        'Калории, ккал', null=True, blank=True,
+        validators=[MinValueValidator(0)],
+    )
+    proteins = models.FloatField(
+        'Белки, г', null=True, blank=True,
+        validators=[MinValueValidator(0)],
+    )
+    fats = models.FloatField(
+        'Жиры, г', null=True, blank=True,
+        validators=[MinValueValidator(0)],
+    )
+    carbohydrates = models.FloatField(
+        'Углеводы, г', null=True, blank=True,
+        validators=[MinValueValidator(0)],
+    )
+    price = models.FloatField(
+        'Цена, руб.', null=True, blank=True,
+        validators=[MinValueValidator(0)],
+    )
 
     class Meta:
         ordering = ['name']
@@ -73,7 +101,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(RevisionedModel):
     """Рецепт блюда."""
     author = models.ForeignKey(
         User,
@@ -84,6 +112,9 @@ class Recipe(models.Model):
     name = models.CharField(
         'Название',
         max_length=200,
+        # поиск по началу названия в админке; на PostgreSQL Django
+        # добавляет к индексу ещё и вариант для LIKE
+        db_index=True,
     )
     image = models.ImageField(
         'Фото',
@@ -110,6 +141,14 @@ class Recipe(models.Model):
             MaxValueValidator(COOKING_TIME_MAX, f'Не больше {COOKING_TIME_MAX} минут.')
         ],
     )
+    servings = models.PositiveSmallIntegerField(
+        'Порций',
+        default=1,
+        validators=[
+            MinValueValidator(SERVINGS_MIN, f'Не меньше {SERVINGS_MIN}.'),
+            MaxValueValidator(SERVINGS_MAX, f'Не больше {SERVINGS_MAX}.')
+        ],
+    )
     pub_date = models.DateTimeField(
         'Дата публикации',
         auto_now_add=True,
@@ -117,6 +156,17 @@ class Recipe(models.Model):
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            # Лента и пагинация: ORDER BY pub_date DESC без сортировки
+            models.Index(
+                fields=['pub_date', 'id'], name='recipe_pub_date_id_idx'
+            ),
+            # Рецепты автора (фильтр ?author=, подписки)
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -171,15 +221,22 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         related_name='favorited_by',
     )
+    # Для инкрементальной выгрузки (api.export)
+    created = models.DateTimeField('Добавлен', auto_now_add=True)
 
     class Meta:
-        ordering = ['user', 'recipe']
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'],
                 name='unique_favorite'
             )
         ]
+        indexes = [
+            # Счётчики и выборки по рецепту: index-only scan
+            models.Index(
+                fields=['recipe', 'user'], name='favorite_recipe_user_idx'
+            ),
+        ]
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
 
@@ -188,7 +245,10 @@ class Favorite(models.Model):
 
 
 class ShoppingCart(models.Model):
-    """Рецепты в списке покупок пользователя."""
+    """
+    Рецепты в списке покупок пользователя. Количества рецепта в списке
+    масштабируются на servings / Recipe.servings.
+    """
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -199,17 +259,67 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         related_name='in_shopping_cart',
     )
+    servings = models.PositiveSmallIntegerField(
+        'Порций',
+        null=True,
+        blank=True,
+        help_text='Пусто — столько, сколько в рецепте.',
+        validators=[
+            MinValueValidator(SERVINGS_MIN, f'Не меньше {SERVINGS_MIN}.'),
+            MaxValueValidator(SERVINGS_MAX, f'Не больше {SERVINGS_MAX}.')
+        ],
+    )
+    # Для инкрементальной выгрузки (api.export)
+    created = models.DateTimeField('Добавлен', auto_now_add=True)
+
+    @staticmethod
+    def multiplier(cart='', recipe='recipe__'):
+        """
+        Выражение: во сколько раз масштабировать рецепт в списке; cart и
+        recipe — пути от модели запроса до ShoppingCart и до Recipe.
+        """
+        return ExpressionWrapper(
+            Coalesce(F(f'{cart}servings'), F(f'{recipe}servings'))
+            * 1.0 / F(f'{recipe}servings'),
+            output_field=models.FloatField(),
+        )
 
     class Meta:
-        ordering = ['user', 'recipe']
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'],
                 name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='cart_recipe_user_idx'
+            ),
+        ]
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
 
     def __str__(self):
         return f'{self.user.username} → {self.recipe.name}'
+
+
+class ShortLink(models.Model):
+    """
+    Счётчик переходов по короткой ссылке /s/<code>. Код — id рецепта
+    в base62, строка создаётся при первом переходе (api.shortlinks).
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='short_link',
+        verbose_name='Рецепт',
+    )
+    code = models.CharField('Код', max_length=16, unique=True)
+    hits = models.PositiveBigIntegerField('Переходов', default=0)
+
+    class Meta:
+        verbose_name = 'Короткая ссылка'
+        verbose_name_plural = 'Короткие ссылки'
+
+    def __str__(self):
+        return self.code
@@ -0,0 +1,107 @@
+"""
+Пищевая ценность и стоимость рецептов и списка покупок.
+
+Значения ингредиента (calories, proteins, fats, carbohydrates, price)
+заданы на 100 базовых единиц его measurement_unit (см. units.UNITS):
+на 100 г для г, кг и мг, на 100 мл для мл и л, на 100 шт. Вклад
+ингредиента в рецепт — количество в базовых единицах * значение / 100,
+так что 2 кг сахара — это 2000 г. Ингредиенты «по вкусу» в итог не
+входят. Если значение у ингредиента не заполнено, оно считается нулём,
+а показатель попадает в incomplete итога.
+
+Итоги многих рецептов считаются за проход: состав всех рецептов вместе
+со значениями ингредиентов и количеством в базовых единицах читается
+одним запросом.
+
+Итог рецепта кэшируется по его revision: ревизия растёт при изменении
+состава рецепта и при правке его ингредиентов (api.conditional,
+import_ingredients), так что пересчитываются только такие рецепты.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import IngredientInRecipe
+from .units import canonical_amount
+
+NUTRIENTS = ('calories', 'proteins', 'fats', 'carbohydrates', 'price')
+# Знаков после запятой в ответе
+PRECISION = {'price': 2}
+# v2: количество в базовых единицах (раньше кг считались как г)
+TOTALS_KEY = 'nutrition:v2:recipe:{}:{}'
+
+
+def _result(sums, missing):
+    totals = {
+        name: round(float(value), PRECISION.get(name, 1))
+        for name, value in zip(NUTRIENTS, sums)
+    }
+    totals['incomplete'] = [
+        name for name, count in zip(NUTRIENTS, missing) if count
+    ]
+    return totals
+
+
+def compute(recipe_ids):
+    """Итоги рецептов без кэша: {id рецепта: итог}."""
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return {}
+    rows = IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by().annotate(base_amount=canonical_amount(
+        'ingredient__measurement_unit', F('amount')
+    )).values_list('recipe_id', 'base_amount', *(
+        f'ingredient__{name}' for name in NUTRIENTS
+    ))
+    sums = defaultdict(lambda: [0.0] * len(NUTRIENTS))
+    missing = defaultdict(lambda: [0] * len(NUTRIENTS))
+    for recipe_id, amount, *values in rows:
+        if amount is None:  # «по вкусу»
+            continue
+        for column, value in enumerate(values):
+            if value is None:
+                missing[recipe_id][column] += 1
+            else:
+                sums[recipe_id][column] += value * amount / 100
+    return {
+        recipe_id: _result(sums[recipe_id], missing[recipe_id])
+        for recipe_id in recipe_ids
+    }
+
+
+def recipe_totals(recipes):
+    """
+    Итоги рецептов (нужны pk и revision): {pk: итог}. Из кэша
+    берётся всё, что есть; остальное считается одним проходом.
+    """
+    keys = {
+        recipe.pk: TOTALS_KEY.format(recipe.pk, recipe.revision)
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    totals = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    computed = compute(pk for pk in keys if pk not in totals)
+    if computed:
+        cache.set_many(
+            {keys[pk]: value for pk, value in computed.items()},
+            settings.NUTRITION_CACHE_TIMEOUT,
+        )
+        totals.update(computed)
+    return totals
+
+
+def combine(items):
+    """
+    Сумма итогов нескольких рецептов (список покупок): items — пары
+    (итог рецепта, множитель порций).
+    """
+    sums = [0.0] * len(NUTRIENTS)
+    incomplete = set()
+    for value, multiplier in items:
+        for column, name in enumerate(NUTRIENTS):
+            sums[column] += value[name] * multiplier
+        incomplete.update(value['incomplete'])
+    return _result(sums, [name in incomplete for name in NUTRIENTS])
@@ -0,0 +1,48 @@
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from foodgram.storage import derived_name
+from jobs.queue import task
+
+
+def rendition_name(image_name, size):
+    return derived_name(image_name, f'{size}.jpg')
+
+
+@task('recipes.image_renditions')
+def image_renditions(payload):
+    """
+    Уменьшенные копии картинки рецепта. Исходник адресуется хешем, так
+    что копии общие для всех рецептов с этой картинкой и повторный
+    запуск готовые копии пропускает.
+    """
+    image_name = payload['image']
+    missing = [
+        size for size in settings.RECIPE_IMAGE_RENDITIONS
+        if not default_storage.exists(rendition_name(image_name, size))
+    ]
+    if not missing or not default_storage.exists(image_name):
+        return
+    with default_storage.open(image_name, 'rb') as source:
+        original = Image.open(source)
+        original.load()
+    original = original.convert('RGB')
+    for size in missing:
+        image = original.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=85, optimize=True)
+        path = default_storage.path(rendition_name(image_name, size))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл рядом и переименовываем: nginx никогда
+        # не отдаст недописанную копию
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(buffer.getvalue())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
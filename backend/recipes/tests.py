@@ -1,3 +1,773 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api import async_views, events, shortlinks, views
+from api.query_budget import QueryBudgetExceeded, query_budget
+from api.snapshots import write_ingredients_snapshot
+from api.serializers import SubscriptionReadSerializer
+from api.views import RecipeViewSet
+from recipes import nutrition, units
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart,
+    ShortLink, Tag
+)
+from sync.models import Change
+from users.models import Subscription, User
+
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+
+class RecipeTestCase(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='Pass1234'
+        )
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='Pass1234'
+        )
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        self.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+        self.client.force_authenticate(self.author)
+
+    def create_recipe(self, author=None, name='Каша', amount=100, **fields):
+        recipe = Recipe.objects.create(
+            author=author or self.author, name=name, text='Сварить',
+            cooking_time=10, image='recipes/images/porridge.png', **fields
+        )
+        recipe.tags.add(self.tag)
+        IngredientInRecipe.objects.create(
+            recipe=recipe, ingredient=self.sugar, amount=amount
+        )
+        return recipe
+
+
+class ConditionalRequestTests(RecipeTestCase):
+    def test_foreign_recipe_update_is_forbidden_before_if_match(self):
+        recipe = self.create_recipe()
+        self.client.force_authenticate(self.reader)
+        payload = {'ingredients': [{'id': self.sugar.pk, 'amount': 5}]}
+        for method in (self.client.patch, self.client.delete):
+            response = method(
+                f'/api/recipes/{recipe.pk}/', payload, format='json',
+                HTTP_IF_MATCH='"stale"',
+            )
+            self.assertEqual(response.status_code, 403)
+
+    def test_stale_if_match_from_author_fails(self):
+        recipe = self.create_recipe()
+        response = self.client.delete(
+            f'/api/recipes/{recipe.pk}/', HTTP_IF_MATCH='"stale"'
+        )
+        self.assertEqual(response.status_code, 412)
+
+
+class FieldsetTests(RecipeTestCase):
+    def get(self, recipe, query, **headers):
+        response = self.client.get(
+            f'/api/recipes/{recipe.pk}/?{query}', **headers
+        )
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_fields_with_nested_path(self):
+        recipe = self.create_recipe()
+        response = self.get(recipe, 'fields=id,name,author.first_name')
+        self.assertEqual(response.data, {
+            'id': recipe.pk, 'name': 'Каша', 'author': {'first_name': ''},
+        })
+
+    def test_nested_serializer_without_path_keeps_its_fields(self):
+        recipe = self.create_recipe()
+        author = self.get(recipe, 'fields=author').data['author']
+        self.assertEqual(author['username'], 'author')
+        self.assertIn('is_subscribed', author)
+        self.assertNotIn('recipes_count', author)
+
+    def test_expand_adds_expandable_fields(self):
+        recipe = self.create_recipe()
+        self.assertNotIn('tags', self.get(recipe, '').data)
+        response = self.get(recipe, 'expand=tags,author.recipes_count')
+        self.assertEqual(
+            [tag['slug'] for tag in response.data['tags']], ['breakfast']
+        )
+        self.assertEqual(response.data['author']['recipes_count'], 1)
+
+    def test_only_requested_columns_are_loaded(self):
+        self.create_recipe()
+        table = Recipe._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/?fields=id,name')
+        self.assertEqual(response.data['results'][0].keys(), {'id', 'name'})
+        recipes_sql = next(
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and f'"{table}"."name"'
+            in query['sql']
+        )
+        self.assertNotIn(f'"{table}"."text"', recipes_sql)
+        self.assertNotIn('"users_user"', recipes_sql)
+
+    def test_tag_change_invalidates_expanded_etag(self):
+        recipe = self.create_recipe()
+        etag = self.get(recipe, 'expand=tags')['ETag']
+        self.tag.name = 'Обед'
+        self.tag.save()
+        response = self.get(recipe, 'expand=tags', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tags'][0]['name'], 'Обед')
+        etag = response['ETag']
+        self.tag.delete()
+        response = self.get(recipe, 'expand=tags', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tags'], [])
+
+    def test_new_recipe_invalidates_author_recipes_count(self):
+        recipe = self.create_recipe()
+        query = 'expand=author.recipes_count'
+        etag = self.get(recipe, query)['ETag']
+        self.create_recipe(name='Суп')
+        response = self.get(recipe, query, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['author']['recipes_count'], 2)
+
+
+class BulkTests(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def payload(self, **fields):
+        return {
+            'ingredients': [{'id': self.sugar.pk, 'amount': 10}],
+            'tags': [self.tag.pk], 'name': 'Каша', 'image': PNG,
+            'text': 'Сварить', 'cooking_time': 5, **fields,
+        }
+
+    def test_create_recipes(self):
+        response = self.client.post('/api/recipes/bulk/', [
+            self.payload(name='Каша'), self.payload(name='Суп'),
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['name'] for item in response.data],
+                         ['Каша', 'Суп'])
+        self.assertEqual(self.author.recipes.count(), 2)
+
+    def test_create_reports_errors_per_item(self):
+        response = self.client.post('/api/recipes/bulk/', [
+            self.payload(),
+            self.payload(ingredients=[{'id': 0, 'amount': 10}]),
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('ingredients', response.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_body_must_be_list(self):
+        for url, method in (('/api/recipes/bulk/', self.client.post),
+                            ('/api/recipes/bulk/', self.client.patch),
+                            ('/api/recipes/bulk/favorite/', self.client.post)):
+            response = method(url, {'recipes': 1}, format='json')
+            self.assertEqual(response.status_code, 400, url)
+
+    def test_update_rejects_foreign_and_repeated_recipes(self):
+        own = self.create_recipe()
+        foreign = self.create_recipe(author=self.reader)
+        response = self.client.patch('/api/recipes/bulk/', [
+            {'id': own.pk, 'name': 'Суп'},
+            {'id': foreign.pk, 'name': 'Суп'},
+            {'id': own.pk, 'cooking_time': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [
+            {},
+            {'id': ['Рецепт не найден.']},
+            {'id': ['Рецепт указан несколько раз.']},
+        ])
+        own.refresh_from_db()
+        self.assertEqual(own.name, 'Каша')
+
+    def test_update_recipes(self):
+        recipe = self.create_recipe()
+        response = self.client.patch('/api/recipes/bulk/', [
+            {'id': recipe.pk, 'name': 'Суп', 'tags': []},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Суп')
+        self.assertFalse(recipe.tags.exists())
+
+    def test_favorite_and_cart_statuses(self):
+        first, second = self.create_recipe(), self.create_recipe(name='Суп')
+        for url, model in (('/api/recipes/bulk/favorite/', Favorite),
+                           ('/api/recipes/bulk/shopping_cart/', ShoppingCart)):
+            model.objects.create(user=self.author, recipe=first)
+            body = {'recipes': [first.pk, second.pk, second.pk]}
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, [
+                {'id': first.pk, 'status': 'exists'},
+                {'id': second.pk, 'status': 'created'},
+            ])
+            response = self.client.delete(
+                url, {'recipes': [second.pk]}, format='json'
+            )
+            self.assertEqual(
+                response.data, [{'id': second.pk, 'status': 'deleted'}]
+            )
+            response = self.client.delete(
+                url, {'recipes': [second.pk]}, format='json'
+            )
+            self.assertEqual(
+                response.data, [{'id': second.pk, 'status': 'missing'}]
+            )
+            self.assertEqual(
+                list(model.objects.values_list('recipe', flat=True)),
+                [first.pk],
+            )
+
+    def test_unknown_recipe_rejects_whole_batch(self):
+        recipe = self.create_recipe()
+        response = self.client.post(
+            '/api/recipes/bulk/favorite/',
+            {'recipes': [recipe.pk, recipe.pk + 100]}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_change_log_gets_only_inserted_rows(self):
+        first, second = self.create_recipe(), self.create_recipe(name='Суп')
+        Favorite.objects.create(user=self.author, recipe=first)
+        real_bulk_create = views.bulk_create_with_pks
+        attempts = []
+
+        def bulk_create(model, objs):
+            attempts.append(len(objs))
+            if len(attempts) == 1:
+                # Первая вставка натыкается на строку параллельного запроса
+                raise IntegrityError
+            return real_bulk_create(model, objs)
+
+        with mock.patch.object(
+            views, 'bulk_create_with_pks', bulk_create
+        ), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/bulk/favorite/',
+                {'recipes': [first.pk, second.pk]}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['status'] for item in response.data], ['exists', 'created']
+        )
+        self.assertEqual(
+            list(Change.objects.filter(kind=Change.FAVORITE).values_list(
+                'object_id', 'action'
+            )),
+            [(second.pk, Change.CREATED)],
+        )
+        self.assertEqual(attempts, [1, 1])
+
+
+class ChangeEventTests(RecipeTestCase):
+    def subscribe(self, *keys):
+        batches = []
+        events.subscribe(batches.append, *keys)
+        self.addCleanup(events.unsubscribe, batches.append, *keys)
+        return batches
+
+    def test_delivered_only_after_commit(self):
+        batches = self.subscribe('recipes')
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe = self.create_recipe()
+        self.assertEqual(batches, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            [(event.pk, event.action) for event in batches[0].events],
+            [(recipe.pk, events.CREATED)],
+        )
+
+    def test_rolled_back_changes_are_dropped(self):
+        batches = self.subscribe('recipes')
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.create_recipe()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(batches, [])
+
+    def test_request_coalesces_events_per_object(self):
+        batches = self.subscribe('recipe:*')
+        recipe = self.create_recipe()
+        pk = recipe.pk
+
+        def get_response(request):
+            with self.captureOnCommitCallbacks(execute=True):
+                for name in ('Суп', 'Борщ'):
+                    recipe.name = name
+                    recipe.save()
+                recipe.tags.clear()
+                recipe.delete()
+            return HttpResponse()
+
+        events.change_events_middleware(get_response)(
+            APIRequestFactory().get('/')
+        )
+        self.assertEqual(len(batches), 1)
+        [event] = [
+            event for event in batches[0].events
+            if event.model == 'recipes.recipe'
+        ]
+        self.assertEqual(event.action, events.DELETED)
+        self.assertEqual(event.pk, pk)
+        self.assertIn(f'recipe:{pk}', batches[0].keys)
+
+    def test_pending_events_merge_keys(self):
+        pending = events.PendingEvents()
+        pending.add(events.ChangeEvent(
+            'recipes.recipe', 1, events.CREATED, frozenset({'recipe:1'})
+        ))
+        pending.add(events.ChangeEvent(
+            'recipes.recipe', 1, events.UPDATED, frozenset({'recipes'})
+        ))
+        self.assertEqual(list(pending.events.values()), [events.ChangeEvent(
+            'recipes.recipe', 1, events.CREATED,
+            frozenset({'recipe:1', 'recipes'}),
+        )])
+
+    def test_subscribers_get_only_matching_events(self):
+        cart = self.subscribe('user:*:cart')
+        favorites = self.subscribe(f'user:{self.reader.pk}:favorites')
+        recipe = self.create_recipe()
+        with events.batch(), self.captureOnCommitCallbacks(execute=True):
+            ShoppingCart.objects.create(user=self.author, recipe=recipe)
+            Favorite.objects.create(user=self.author, recipe=recipe)
+        self.assertEqual(favorites, [])
+        [batch] = cart
+        self.assertEqual(batch.keys, {f'user:{self.author.pk}:cart'})
+        self.assertEqual(
+            [event.model for event in batch.events], ['recipes.shoppingcart']
+        )
+
+    def test_failing_subscriber_does_not_stop_others(self):
+        def fail(batch):
+            raise RuntimeError
+        events.subscribe(fail, 'recipes')
+        self.addCleanup(events.unsubscribe, fail, 'recipes')
+        batches = self.subscribe('recipes')
+        with self.assertLogs('api.events', 'ERROR'), events.batch(), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe()
+        self.assertEqual(len(batches), 1)
+
+
+class IngredientSnapshotTests(RecipeTestCase):
+    def test_snapshot_matches_api_response(self):
+        Ingredient.objects.create(name='арахис', measurement_unit='г')
+        Ingredient.objects.create(name='яблоки', measurement_unit='шт')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(STATIC_ROOT=directory.name):
+            path, count = write_ingredients_snapshot()
+        response = self.client.get('/api/ingredients/')
+        self.assertEqual(count, 3)
+        self.assertEqual(path.read_bytes(), response.content)
+
+
+class UnitsTests(RecipeTestCase):
+    def base_amounts(self):
+        return dict(IngredientInRecipe.objects.values_list(
+            'ingredient__name',
+        ).annotate(amount=units.canonical_amount(
+            'ingredient__measurement_unit', F('amount')
+        )))
+
+    def test_canonical_amount(self):
+        recipe = self.create_recipe(amount=250)
+        for name, unit, amount in (('мука', 'кг', 2), ('молоко', 'л', 3),
+                                   ('соль', 'по вкусу', 1),
+                                   ('кардамон', 'щепотка', 2)):
+            IngredientInRecipe.objects.create(
+                recipe=recipe, amount=amount,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit=unit
+                ),
+            )
+        self.assertEqual(self.base_amounts(), {
+            'сахар': 250, 'мука': 2000, 'молоко': 3000, 'соль': None,
+            'кардамон': 2,
+        })
+
+    def test_format_amount(self):
+        for amount, unit, text in ((2500, 'г', '2,5 кг'),
+                                   (999, 'г', '999 г'),
+                                   (1000, 'мл', '1 л'),
+                                   (0.5, 'г', '0,5 г'),
+                                   (12, 'шт.', '12 шт.'),
+                                   (None, 'по вкусу', 'по вкусу')):
+            self.assertEqual(units.format_amount(amount, unit), text)
+
+    def test_shopping_list(self):
+        salt = Ingredient.objects.create(
+            name='соль', measurement_unit='по вкусу'
+        )
+        flour = Ingredient.objects.create(name='мука', measurement_unit='кг')
+        for amount in (600, 700):
+            recipe = self.create_recipe(amount=amount)
+            IngredientInRecipe.objects.create(
+                recipe=recipe, ingredient=salt, amount=1
+            )
+            IngredientInRecipe.objects.create(
+                recipe=recipe, ingredient=flour, amount=2
+            )
+            ShoppingCart.objects.create(user=self.author, recipe=recipe)
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode().splitlines()[2:], [
+            'мука — 4 кг', 'сахар — 1,3 кг', 'соль — по вкусу',
+        ])
+
+
+class NutritionTests(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def ingredient_in(self, recipe, name, unit, amount, **values):
+        ingredient = Ingredient.objects.create(
+            name=name, measurement_unit=unit, **values
+        )
+        IngredientInRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=amount
+        )
+
+    def test_values_are_per_100_base_units(self):
+        recipe = self.create_recipe()
+        IngredientInRecipe.objects.filter(recipe=recipe).delete()
+        self.ingredient_in(recipe, 'мука', 'кг', 2, calories=400, price=5)
+        self.ingredient_in(recipe, 'молоко', 'л', 1, calories=60)
+        self.ingredient_in(recipe, 'яйца', 'шт', 3, calories=100)
+        self.ingredient_in(recipe, 'соль', 'по вкусу', 1, calories=0)
+        totals = nutrition.compute([recipe.pk])[recipe.pk]
+        self.assertEqual(totals['calories'], 8000 + 600 + 3)
+        self.assertEqual(totals['price'], 100.0)
+        self.assertEqual(
+            totals['incomplete'],
+            ['proteins', 'fats', 'carbohydrates', 'price'],
+        )
+
+    def test_recipe_endpoint(self):
+        recipe = self.create_recipe(amount=250)
+        Ingredient.objects.filter(pk=self.sugar.pk).update(calories=400)
+        response = self.client.get(f'/api/recipes/{recipe.pk}/nutrition/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['calories'], 1000.0)
+
+
+class ServingsTests(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        Ingredient.objects.filter(pk=self.sugar.pk).update(calories=400)
+        self.recipe = self.create_recipe(amount=600, servings=2)
+        self.url = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+
+    def shopping_list(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode().splitlines()[2:]
+
+    def test_amounts_scale_to_servings(self):
+        response = self.client.post(self.url, {'servings': 4}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.shopping_list(), ['сахар — 1,2 кг'])
+        response = self.client.get(
+            '/api/recipes/shopping_cart_nutrition/'
+        )
+        self.assertEqual(response.data['calories'], 4800.0)
+
+    def test_without_servings_recipe_amounts_are_used(self):
+        self.client.post(self.url)
+        self.assertEqual(self.shopping_list(), ['сахар — 600 г'])
+        self.assertEqual(
+            ShoppingCart.objects.get(user=self.author).servings, None
+        )
+
+    def test_other_carts_are_not_joined(self):
+        ShoppingCart.objects.create(
+            user=self.reader, recipe=self.recipe, servings=10
+        )
+        self.client.post(self.url, {'servings': 4}, format='json')
+        self.assertEqual(self.shopping_list(), ['сахар — 1,2 кг'])
+        response = self.client.get(
+            '/api/recipes/shopping_cart_nutrition/'
+        )
+        self.assertEqual(response.data['calories'], 4800.0)
+        self.assertEqual(response.data['recipes'], 1)
+
+    def test_patch_changes_servings(self):
+        added = self.client.post(self.url, {'servings': 4}, format='json')
+        response = self.client.patch(self.url, {'servings': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, added.data)
+        self.assertEqual(self.shopping_list(), ['сахар — 300 г'])
+        response = self.client.patch(
+            self.url, {'servings': None}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shopping_list(), ['сахар — 600 г'])
+
+    def test_patch_validation(self):
+        response = self.client.patch(self.url, {'servings': 2}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.client.post(self.url)
+        for servings in (0, 1000, 'много'):
+            response = self.client.patch(
+                self.url, {'servings': servings}, format='json'
+            )
+            self.assertEqual(response.status_code, 400, servings)
+            self.assertIn('servings', response.data)
+        self.assertEqual(
+            ShoppingCart.objects.get(user=self.author).servings, None
+        )
+
+
+class AsyncIngredientListTests(RecipeTestCase):
+    def test_matches_sync_view(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        Ingredient.objects.create(name='арахис', measurement_unit='г')
+        # Пул потоков видел бы другое соединение без данных теста
+        worker = mock.patch.object(
+            async_views, '_worker', lambda func: sync_to_async(func)
+        )
+        for query in ('', '?name=с', '?name=С'):
+            url = f'/api/ingredients/{query}'
+            with worker:
+                response = async_to_sync(async_views.ingredient_list)(
+                    AsyncRequestFactory().get(url)
+                )
+            expected = self.client.get(url)
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(
+                response['Content-Type'], expected['Content-Type']
+            )
+
+    def test_throttles_like_sync_view(self):
+        token = Token.objects.create(user=self.reader)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        store = mock.Mock(**{'take.return_value': 0})
+        worker = mock.patch.object(
+            async_views, '_worker', lambda func: sync_to_async(func)
+        )
+        with mock.patch('api.throttling.bucket_store', return_value=store):
+            self.client.get('/api/ingredients/')
+            # AsyncRequestFactory в Django 3.2 передаёт extra заголовками
+            for headers in ({'authorization': f'Token {token.key}'}, {}):
+                with worker:
+                    async_to_sync(async_views.ingredient_list)(
+                        AsyncRequestFactory().get(
+                            '/api/ingredients/',
+                            x_forwarded_for='203.0.113.7', **headers
+                        )
+                    )
+        keys = [call.args[0] for call in store.take.call_args_list]
+        self.assertEqual(keys, [
+            f'ingredients:user:{self.reader.pk}',
+            f'ingredients:user:{self.reader.pk}',
+            'ingredients:ip:203.0.113.7',
+        ])
+
+    def test_bad_token_is_rejected_like_sync_view(self):
+        with mock.patch.object(
+            async_views, '_worker', lambda func: sync_to_async(func)
+        ):
+            response = async_to_sync(async_views.ingredient_list)(
+                AsyncRequestFactory().get(
+                    '/api/ingredients/', authorization='Token wrong'
+                )
+            )
+        self.assertEqual(response.status_code, 401)
+
+
+class ExportTests(RecipeTestCase):
+    def test_since_filters_favorites_by_when_added(self):
+        recipe = self.create_recipe()
+        Recipe.objects.filter(pk=recipe.pk).update(
+            pub_date=timezone.now() - timedelta(days=30)
+        )
+        old = Favorite.objects.create(user=self.reader, recipe=recipe)
+        Favorite.objects.filter(pk=old.pk).update(
+            created=timezone.now() - timedelta(days=2)
+        )
+        new = Favorite.objects.create(user=self.author, recipe=recipe)
+        self.author.is_staff = True
+        self.author.save()
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        response = self.client.get(
+            '/api/export/favorites/', {'format': 'ndjson', 'since': since}
+        )
+        self.assertEqual(response.status_code, 200)
+        rows = [
+            json.loads(line) for line in
+            b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([row['id'] for row in rows], [new.pk])
+
+
+class ShortLinkTests(RecipeTestCase):
+    def test_get_link_does_not_write(self):
+        recipe = self.create_recipe()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/recipes/{recipe.pk}/get-link/')
+        code = shortlinks.encode(recipe.pk)
+        self.assertTrue(response.data['short-link'].endswith(f'/s/{code}'))
+        self.assertFalse(ShortLink.objects.exists())
+
+    def test_decode(self):
+        for number in (0, 61, 62, 10 ** 12):
+            self.assertEqual(
+                shortlinks.decode(shortlinks.encode(number)), number
+            )
+        for code in ('', '0a', 'a-b'):
+            self.assertIsNone(shortlinks.decode(code))
+
+    def test_redirect_counts_hits(self):
+        recipe = self.create_recipe()
+        code = shortlinks.encode(recipe.pk)
+        for _ in range(2):
+            response = self.client.get(f'/s/{code}')
+            self.assertRedirects(
+                response, f'/recipes/{recipe.pk}',
+                fetch_redirect_response=False,
+            )
+        shortlinks.hits.flush()
+        self.assertEqual(ShortLink.objects.get(recipe=recipe).hits, 2)
+        self.assertEqual(self.client.get('/s/0a').status_code, 404)
+        self.assertEqual(
+            self.client.get(f'/s/{shortlinks.encode(10 ** 6)}').status_code,
+            404,
+        )
+
+    def test_deleted_recipe_is_forgotten_by_all_workers(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name,
+        }
+        recipe = self.create_recipe()
+        code = shortlinks.encode(recipe.pk)
+        with override_settings(CACHES={'default': shared}):
+            shortlinks.resolve(code)
+            # Кэш другого воркера с тем же хранилищем
+            other_worker = caches.create_connection('default')
+            cache_key = shortlinks.LINK_CACHE_KEY.format(code)
+            self.assertTrue(other_worker.get(cache_key))
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.delete()
+            self.assertIsNone(other_worker.get(cache_key))
+            self.assertEqual(self.client.get(f'/s/{code}').status_code, 404)
+
+
+class ProfilingTests(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_non_ascii_header_is_not_an_error(self):
+        with override_settings(
+            PROFILING_SECRET='secret', PROFILING_DIR=self.directory
+        ):
+            response = self.client.get('/api/recipes/', HTTP_X_PROFILE='é')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_keeps_only_latest_profiles(self):
+        with override_settings(
+            PROFILING_SAMPLE_RATE=1.0, PROFILING_DIR=self.directory,
+            PROFILING_MAX_PROFILES=2,
+        ):
+            for _ in range(4):
+                self.client.get('/api/recipes/')
+        endpoint = self.directory / 'RecipeViewSet.list'
+        self.assertEqual(len(list(endpoint.glob('*.json'))), 2)
+        self.assertEqual(len(list(endpoint.glob('*.folded'))), 2)
+
+
+class QueryBudgetTests(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        # Несколько авторов и рецептов: N+1 сразу выйдет за бюджет
+        for number in range(5):
+            author = User.objects.create_user(
+                username=f'cook{number}', email=f'cook{number}@example.com',
+                password='Pass1234',
+            )
+            recipe = self.create_recipe(author=author, name=f'Блюдо {number}')
+            Favorite.objects.create(user=self.author, recipe=recipe)
+            ShoppingCart.objects.create(user=self.author, recipe=recipe)
+            Subscription.objects.create(user=self.author, author=author)
+
+    def test_tests_run_budgets_in_raise_mode(self):
+        self.assertEqual(settings.QUERY_BUDGET_MODE, 'raise')
+
+    def test_recipe_list(self):
+        for user in (self.author, None):
+            self.client.force_authenticate(user)
+            with query_budget(6):
+                response = self.client.get('/api/recipes/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 5)
+
+    def test_recipe_detail(self):
+        recipe = Recipe.objects.first()
+        with query_budget(5):
+            response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_exceeded_view_budget_raises(self):
+        with mock.patch.dict(RecipeViewSet.query_budgets, {'list': 1}):
+            with self.assertRaisesMessage(
+                QueryBudgetExceeded, 'RecipeViewSet.list'
+            ):
+                self.client.get('/api/recipes/')
+
+    def test_n_plus_one_names_serializer_method(self):
+        request = Request(APIRequestFactory().get('/'))
+        authors = list(User.objects.filter(subscribers__user=self.author))
+        with self.assertRaisesMessage(
+            QueryBudgetExceeded, 'SubscriptionReadSerializer.get_recipes'
+        ):
+            with query_budget(100):
+                SubscriptionReadSerializer(
+                    authors, many=True, context={'request': request}
+                ).data
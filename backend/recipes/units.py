@@ -0,0 +1,94 @@
+"""
+Единицы измерения для списка покупок.
+
+UNITS сопоставляет написанию единицы базовую единицу и множитель: кг и
+мг считаются в граммах, л — в миллилитрах, «шт» и «штука» — это «шт.».
+Суммирование идёт в базовых единицах прямо в запросе (canonical_unit()
+и canonical_amount() — выражения CASE по реестру), а format_amount()
+выводит итог в удобной единице: 2500 г — «2,5 кг». Единицы с
+множителем None («по вкусу») не суммируются. Незнакомые единицы
+остаются как есть с множителем 1.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, F, FloatField, Value, When
+
+# Написание → (базовая единица, множитель). Сравнение точное: lower() в
+# SQLite не знает кириллицы
+UNITS = {
+    'г': ('г', 1),
+    'гр': ('г', 1),
+    'гр.': ('г', 1),
+    'грамм': ('г', 1),
+    'кг': ('г', 1000),
+    'кг.': ('г', 1000),
+    'килограмм': ('г', 1000),
+    'мг': ('г', 0.001),
+    'мл': ('мл', 1),
+    'мл.': ('мл', 1),
+    'л': ('мл', 1000),
+    'л.': ('мл', 1000),
+    'литр': ('мл', 1000),
+    'шт.': ('шт.', 1),
+    'шт': ('шт.', 1),
+    'штука': ('шт.', 1),
+    'по вкусу': ('по вкусу', None),
+}
+# Крупная единица для вывода: с какого количества базовой переходить
+DISPLAY_UNITS = {'г': (1000, 'кг'), 'мл': (1000, 'л')}
+
+
+def _grouped(position):
+    """Написания, сгруппированные по базовой единице или множителю."""
+    groups = defaultdict(list)
+    for name, unit in UNITS.items():
+        groups[unit[position]].append(name)
+    return groups.items()
+
+
+def canonical_unit(field):
+    """Выражение: базовая единица для столбца единицы field."""
+    return Case(
+        *(
+            When(**{f'{field}__in': names}, then=Value(base))
+            for base, names in _grouped(0)
+            if names != [base]
+        ),
+        default=F(field),
+    )
+
+
+def canonical_amount(field, amount):
+    """
+    Выражение: количество amount в базовых единицах; NULL для единиц,
+    которые не суммируются.
+    """
+    return Case(
+        *(
+            When(
+                **{f'{field}__in': names},
+                then=(
+                    amount * Value(float(factor))
+                    if factor is not None else Value(None)
+                ),
+            )
+            for factor, names in _grouped(1)
+            if factor != 1
+        ),
+        default=amount * Value(1.0),
+        output_field=FloatField(),
+    )
+
+
+def format_number(value):
+    return f'{round(value, 2):.2f}'.rstrip('0').rstrip('.').replace('.', ',')
+
+
+def format_amount(amount, unit):
+    """Количество в базовой единице unit → строка для списка покупок."""
+    if amount is None:
+        return unit
+    threshold, display_unit = DISPLAY_UNITS.get(unit, (None, unit))
+    if threshold is not None and amount >= threshold:
+        return f'{format_number(amount / threshold)} {display_unit}'
+    return f'{format_number(amount)} {unit}'
@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from .models import Change
+
+
+@admin.register(Change)
+class ChangeAdmin(admin.ModelAdmin):
+    list_display = ('seq', 'kind', 'object_id', 'action', 'user_id',
+                    'created_at')
+    list_filter = ('kind', 'action')
+    readonly_fields = ('seq', 'kind', 'object_id', 'action', 'user',
+                       'created_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class SyncConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'sync'
+    verbose_name = 'Синхронизация'
+
+    def ready(self):
+        from api import events
+        from . import changes
+        # Записи строятся в транзакции изменения, пишутся после коммита
+        events.add_recorder(changes.write)
+        changes.connect()
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sync.models import Change
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete change log entries older than --days. Clients whose sync '
+        'cursor is older than the remaining log get 410 and do a full '
+        'download. The newest entry is always kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.SYNC_RETENTION_DAYS
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Последняя запись остаётся: по ней видно, до какого места
+        # журнал удалён
+        last = Change.objects.filter(created_at__lt=cutoff).order_by(
+            '-seq'
+        ).values_list('seq', flat=True).first()
+        if last is None:
+            self.stdout.write('Nothing to prune')
+            return
+        deleted, _ = Change.objects.filter(seq__lt=last).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} entries'))
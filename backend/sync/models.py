@@ -0,0 +1,63 @@
+from django.db import models
+
+from users.models import User
+
+
+class Change(models.Model):
+    """
+    Запись журнала изменений для синхронизации (GET /api/sync/).
+    Пишется сразу после коммита изменения (sync.changes); seq растёт
+    монотонно и служит курсором. Изменения рецептов видны всем
+    (user пуст), избранного, списка покупок и подписок — только их
+    владельцу.
+    """
+    RECIPE = 'recipe'
+    FAVORITE = 'favorite'
+    SHOPPING_CART = 'shopping_cart'
+    SUBSCRIPTION = 'subscription'
+    KIND_CHOICES = [
+        (RECIPE, 'Рецепт'),
+        (FAVORITE, 'Избранное'),
+        (SHOPPING_CART, 'Список покупок'),
+        (SUBSCRIPTION, 'Подписка'),
+    ]
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = [
+        (CREATED, 'Создан'),
+        (UPDATED, 'Изменён'),
+        (DELETED, 'Удалён'),
+    ]
+
+    seq = models.BigAutoField('Номер', primary_key=True)
+    kind = models.CharField('Тип', max_length=20, choices=KIND_CHOICES)
+    # id рецепта; у подписки — id автора
+    object_id = models.BigIntegerField('Объект')
+    action = models.CharField(
+        'Действие', max_length=10, choices=ACTION_CHOICES
+    )
+    # Без внешнего ключа в БД: при удалении пользователя каскад пишет
+    # удаления его избранного в журнал той же транзакцией
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Пользователь',
+    )
+    created_at = models.DateTimeField('Записано', auto_now_add=True)
+
+    class Meta:
+        ordering = ['seq']
+        indexes = [
+            # Лента пользователя: его записи и общие (user IS NULL)
+            models.Index(fields=['user', 'seq'], name='change_user_seq_idx'),
+        ]
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Журнал изменений'
+
+    def __str__(self):
+        return f'#{self.seq} {self.kind}:{self.object_id} {self.action}'
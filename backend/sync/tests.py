@@ -0,0 +1,116 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from recipes.models import Recipe
+from sync import changes
+from sync.models import Change
+from users.models import User
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='Pass1234'
+        )
+        self.cursor = self.sync()['cursor']
+
+    def sync(self, cursor=None, status=200, **params):
+        if cursor is not None:
+            params['cursor'] = cursor
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, status)
+        return response.data
+
+    def committed(self):
+        """Блок как отдельная закоммиченная транзакция."""
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def create_recipe(self, name='Каша'):
+        with self.committed():
+            return Recipe.objects.create(
+                author=self.author, name=name, text='Сварить',
+                cooking_time=10, image='recipes/images/porridge.png',
+            )
+
+    def test_update_then_delete_is_one_tombstone(self):
+        recipe = self.create_recipe()
+        recipe.name = 'Овсянка'
+        with self.committed():
+            recipe.save()
+        updated = self.sync(self.cursor)
+        self.assertEqual(len(updated['changes']), 1)
+        self.assertEqual(updated['changes'][0]['data']['name'], 'Овсянка')
+
+        recipe_id = recipe.pk
+        with self.committed():
+            recipe.delete()
+        data = self.sync(self.cursor)
+        self.assertEqual(data['changes'], [
+            {'type': Change.RECIPE, 'id': recipe_id, 'action': Change.DELETED}
+        ])
+        # С курсора после обновления — тоже только удаление
+        data = self.sync(updated['cursor'])
+        self.assertEqual(
+            [item['action'] for item in data['changes']], [Change.DELETED]
+        )
+
+    def test_late_commit_is_not_left_behind_cursor(self):
+        # Долгая транзакция начинается первой, но коммитится после
+        # короткой, а клиент успевает пройти запись короткой
+        with self.captureOnCommitCallbacks() as slow:
+            late = Recipe.objects.create(
+                author=self.author, name='Долгая', text='Сварить',
+                cooking_time=10, image='recipes/images/porridge.png',
+            )
+        self.create_recipe('Быстрая')
+        first = self.sync(self.cursor)
+        self.assertEqual(
+            [item['data']['name'] for item in first['changes']], ['Быстрая']
+        )
+        for callback in slow:
+            callback()
+        second = self.sync(first['cursor'])
+        self.assertEqual(
+            [item['id'] for item in second['changes']], [late.pk]
+        )
+
+    def test_pages_until_has_more_is_false(self):
+        names = [f'Блюдо {number}' for number in range(3)]
+        for name in names:
+            self.create_recipe(name)
+        first = self.sync(self.cursor, limit=2)
+        self.assertTrue(first['has_more'])
+        second = self.sync(first['cursor'], limit=2)
+        self.assertFalse(second['has_more'])
+        self.assertEqual(
+            [item['data']['name']
+             for item in first['changes'] + second['changes']],
+            names,
+        )
+        self.assertEqual(self.sync(second['cursor'])['changes'], [])
+
+    def test_pruned_cursor_is_gone(self):
+        for number in range(3):
+            self.create_recipe(f'Блюдо {number}')
+        Change.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('prune_changes', days=1, stdout=StringIO())
+        self.assertEqual(Change.objects.count(), 1)
+        data = self.sync(self.cursor, status=410)
+        self.assertEqual(
+            changes.decode_cursor(data['cursor']),
+            Change.objects.get().seq,
+        )
+
+    @override_settings(SYNC_SETTLE_SECONDS=60)
+    def test_unsettled_changes_wait(self):
+        self.create_recipe()
+        self.assertEqual(self.sync(self.cursor)['changes'], [])
+        self.assertEqual(self.sync()['cursor'], self.cursor)
+        Change.objects.update(created_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(len(self.sync(self.cursor)['changes']), 1)
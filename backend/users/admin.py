@@ -1,9 +1,11 @@
 from django.contrib import admin
+
+from foodgram.paginator import EstimatedCountAdminMixin
 from .models import User, Subscription
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     """Настройка отображения пользователей в админке."""
     list_display = (
         'id',
@@ -13,20 +15,22 @@ class UserAdmin(admin.ModelAdmin):
         'last_name',
         'role',
     )
-    search_fields = ('username', 'email')
+    # по началу строки — идёт по индексам *_like уникальных полей
+    search_fields = ('username__startswith', 'email__startswith')
     list_filter = ('role', 'is_staff', 'is_superuser', 'is_active')
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     """Настройка отображения подписок в админке."""
     list_display = (
         'user',
         'author',
         'created_at',  # именно так, с _at
     )
+    list_select_related = ('user', 'author')
     search_fields = (
-        'user__username',
-        'author__username',
+        'user__username__startswith',
+        'author__username__startswith',
     )
-    list_filter = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
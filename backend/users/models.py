@@ -3,6 +3,8 @@ from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.db import models
 
+from foodgram.revisions import RevisionedModel
+
 
 def validate_not_me(value):
     """Запрещаем имя пользователя 'me'."""
@@ -10,8 +12,12 @@ def validate_not_me(value):
         raise ValidationError('Имя пользователя не может быть "me".')
 
 
-class User(AbstractUser):
-    """Кастомная модель пользователя."""
+class User(RevisionedModel, AbstractUser):
+    """
+    Кастомная модель пользователя. revision меняется вместе с профилем,
+    а также с подписками, избранным и списком покупок пользователя:
+    от них зависит то, что он видит в чужих профилях и рецептах.
+    """
     USER = 'user'
     ADMIN = 'admin'
     ROLE_CHOICES = [
@@ -62,6 +68,10 @@ class User(AbstractUser):
         default=USER,
     )
 
+    revision_fields = (
+        'username', 'first_name', 'last_name', 'email', 'avatar'
+    )
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -105,6 +115,13 @@ class Subscription(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = [
+            # Подписчики автора: уникальный индекс (user, author) тут
+            # не помогает, он начинается с подписчика
+            models.Index(
+                fields=['author', 'user'], name='subscription_author_user_idx'
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ['-created_at']
@@ -1,3 +1,275 @@
-from django.test import TestCase
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api import authentication
+from api.query_budget import query_budget
+from api.throttling import TokenBucketThrottle
+from foodgram import hashers
+from recipes.models import Recipe
+from users.models import Subscription, User
+
+
+class SharedCacheTestCase(APITestCase):
+    """
+    Кэш в файлах: его экземпляры ничего не делят в памяти, как кэши
+    разных воркеров с общим CACHE_BACKEND.
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name,
+        }
+        settings = override_settings(CACHES={'default': shared})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='Pass12345'
+        )
+
+    def other_worker_cache(self):
+        return caches.create_connection('default')
+
+
+class TokenCacheTests(SharedCacheTestCase):
+    def login(self):
+        response = self.client.post(
+            '/api/auth/token/login/',
+            {'email': 'user@example.com', 'password': 'Pass12345'},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data['auth_token']
+
+    def test_logout_evicts_token_for_other_workers(self):
+        key = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        cache_key = authentication.TOKEN_CACHE_KEY.format(key)
+        self.assertIsNotNone(self.other_worker_cache().get(cache_key))
+
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+
+        other = self.other_worker_cache()
+        self.assertIsNone(other.get(cache_key))
+        with mock.patch.object(
+            authentication, 'token_cache', return_value=other
+        ):
+            with self.assertRaises(AuthenticationFailed):
+                authentication.CachedTokenAuthentication(
+                ).authenticate_credentials(key)
+
+    def test_refuses_per_process_cache_with_several_workers(self):
+        local = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        }
+        with override_settings(CACHES=local, WEB_CONCURRENCY=2):
+            with self.assertRaises(ImproperlyConfigured):
+                authentication.check_shared_caches()
+        with override_settings(CACHES=local, WEB_CONCURRENCY=1):
+            authentication.check_shared_caches()
+
+
+class JWTRevocationTests(SharedCacheTestCase):
+    def authenticate(self, access):
+        from api.jwt_tokens import StatelessJWTAuthentication
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {access}'
+        )
+        return StatelessJWTAuthentication().authenticate(request)
+
+    def test_denied_token_rejected_by_other_workers(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from api import jwt_tokens
+        access = jwt_tokens.issue_tokens(self.user)['access']
+        self.assertEqual(self.authenticate(access)[0].pk, self.user.pk)
+        jwt_tokens.deny_token(AccessToken(access))
+        with mock.patch.object(
+            jwt_tokens, 'jwt_denylist', return_value=self.other_worker_cache()
+        ):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(access)
+
+    @override_settings(JWT_AUTH=True)
+    def test_deactivation_revokes_tokens(self):
+        from api import jwt_tokens
+        access = jwt_tokens.issue_tokens(self.user)['access']
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access)
+
+    def test_inactive_claim_rejected(self):
+        from api import jwt_tokens
+        self.user.is_active = False
+        access = jwt_tokens.issue_tokens(self.user)['access']
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access)
+
+
+@override_settings(PASSWORD_HASH_WORKERS=2, PASSWORD_HASH_RETRY_AFTER=3)
+class PasswordHashingBusyTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='Pass12345'
+        )
+        full = threading.BoundedSemaphore(1)
+        full.acquire()
+        patcher = mock.patch.object(
+            hashers, '_get_executor', return_value=(None, full)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hasher_raises_its_own_exception(self):
+        with self.assertRaises(hashers.PasswordHashingBusy):
+            self.user.check_password('Pass12345')
+
+    def test_auth_views_answer_429(self):
+        credentials = {'email': 'user@example.com', 'password': 'Pass12345'}
+        response = self.client.post('/api/auth/token/login/', credentials)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3')
+        self.client.force_authenticate(self.user)
+        for url in ('/api/users/set_password/',
+                    '/api/auth/users/set_password/'):
+            response = self.client.post(url, {
+                'current_password': 'Pass12345',
+                'new_password': 'NewPass12345',
+            })
+            self.assertEqual(response.status_code, 429)
+
+
+class ThrottleIdentTests(APITestCase):
+    def ident(self, **meta):
+        request = APIRequestFactory().get('/', REMOTE_ADDR='10.0.0.2', **meta)
+        return TokenBucketThrottle().get_ident(request)
+
+    def test_client_address_from_nginx(self):
+        self.assertEqual(
+            self.ident(HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.7'),
+            '203.0.113.7',
+        )
+        self.assertEqual(self.ident(), '10.0.0.2')
+
+    @override_settings(REST_FRAMEWORK={'NUM_PROXIES': 0})
+    def test_without_proxy(self):
+        self.assertEqual(
+            self.ident(HTTP_X_FORWARDED_FOR='203.0.113.7'), '10.0.0.2'
+        )
+
+
+class ProfileTests(APITestCase):
+    def test_me_body_matches_etag_despite_stale_request_user(self):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='Pass12345',
+            first_name='Старое',
+        )
+        # Снимок пользователя, как из кэша токенов, отстаёт от БД
+        self.client.force_authenticate(user)
+        fresh = User.objects.get(pk=user.pk)
+        fresh.first_name = 'Новое'
+        fresh.save()
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['first_name'], 'Новое')
+        response = self.client.get(
+            '/api/users/me/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class FieldsetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='Pass12345',
+            first_name='Анна',
+        )
+        self.url = f'/api/users/{self.user.pk}/'
+
+    def test_fields_and_expand(self):
+        response = self.client.get(f'{self.url}?fields=id,first_name')
+        self.assertEqual(
+            response.data, {'id': self.user.pk, 'first_name': 'Анна'}
+        )
+        response = self.client.get(self.url)
+        self.assertNotIn('recipes_count', response.data)
+        response = self.client.get(f'{self.url}?expand=recipes_count')
+        self.assertEqual(response.data['recipes_count'], 0)
+
+    def test_only_requested_columns_are_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'{self.url}?fields=id,username')
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('"username"', sql)
+        self.assertNotIn('"first_name"', sql)
+
+    def test_recipes_change_invalidates_recipes_count_etag(self):
+        url = f'{self.url}?expand=recipes_count'
+        etag = self.client.get(url)['ETag']
+        recipe = Recipe.objects.create(
+            author=self.user, name='Каша', text='Сварить', cooking_time=5,
+            image='recipes/images/porridge.png',
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['recipes_count'], 1)
+        etag = response['ETag']
+        recipe.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['recipes_count'], 0)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class QueryBudgetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='Pass12345'
+        )
+        for number in range(5):
+            author = User.objects.create_user(
+                username=f'cook{number}', email=f'cook{number}@example.com',
+                password='Pass12345',
+            )
+            Subscription.objects.create(user=self.user, author=author)
+            for dish in range(2):
+                Recipe.objects.create(
+                    author=author, name=f'Блюдо {dish}', text='Сварить',
+                    cooking_time=5, image='recipes/images/dish.png',
+                )
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, budget):
+        with query_budget(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_user_list(self):
+        response = self.get('/api/users/?expand=recipes_count', 4)
+        self.assertEqual(response.data['count'], 6)
+
+    def test_me(self):
+        self.get('/api/users/me/', 4)
+
+    def test_subscriptions(self):
+        response = self.get('/api/users/subscriptions/?recipes_limit=1', 6)
+        self.assertEqual(response.data['count'], 5)
+        first = response.data['results'][0]
+        self.assertEqual(len(first['recipes']), 1)
+        self.assertEqual(first['recipes_count'], 2)
+        self.assertTrue(first['is_subscribed'])